@@ -218,6 +218,21 @@ uint8_t check_version(uint8_t *v)
 	return SS_VER;
 }
 
+// Payloads are sent as hex-ASCII, or as raw bytes after a "w01" command.
+// The "w" command itself is always hex-ASCII, so it works in both modes,
+// and an 'x' in binary mode switches back to hex-ASCII.
+static uint8_t ss_binary = 0;
+static uint8_t ss_binary_req = 0;
+
+// Callback function for "w" command.
+uint8_t set_wire_format(uint8_t *f)
+{
+	if(f[0] > 1)
+		return 1;
+	ss_binary_req = f[0];
+	return 0;
+}
+
 static char hex_lookup[16] =
 {
 	'0', '1', '2', '3', '4', '5', '6', '7',
@@ -259,6 +274,9 @@ int hex_decode(int len, char* ascii_buf, uint8_t* data_buf)
 void simpleserial_init()
 {
 	simpleserial_addcmd('v', 0, check_version);
+#if SS_VER == SS_VER_1_1
+	simpleserial_addcmd('w', 1, set_wire_format);
+#endif
 }
 
 int simpleserial_addcmd(char c, unsigned int len, uint8_t (*fp)(uint8_t*))
@@ -286,6 +304,12 @@ void simpleserial_get(void)
 	// Find which command we're receiving
 	c = getch();
 
+	if(ss_binary && c == 'x')
+	{
+		ss_binary = 0;
+		return;
+	}
+
 	int cmd;
 	for(cmd = 0; cmd < num_commands; cmd++)
 	{
@@ -297,16 +321,28 @@ void simpleserial_get(void)
 	if(cmd == num_commands)
 		return;
 
-	// Receive characters until we fill the ASCII buffer
-	for(int i = 0; i < 2*commands[cmd].len; i++)
+	// The "w" command is always hex-ASCII
+	uint8_t binary = ss_binary && commands[cmd].c != 'w';
+
+	if(binary)
+	{
+		// Raw payload, no need to decode
+		for(int i = 0; i < commands[cmd].len; i++)
+			data_buf[i] = getch();
+	}
+	else
 	{
-		c = getch();
+		// Receive characters until we fill the ASCII buffer
+		for(int i = 0; i < 2*commands[cmd].len; i++)
+		{
+			c = getch();
 
-		// Check for early \n
-		if(c == '\n' || c == '\r')
-			return;
+			// Check for early \n
+			if(c == '\n' || c == '\r')
+				return;
 
-		ascii_buf[i] = c;
+			ascii_buf[i] = c;
+		}
 	}
 
 	// Assert that last character is \n or \r
@@ -316,7 +352,7 @@ void simpleserial_get(void)
 
 	// ASCII buffer is full: convert to bytes 
 	// Check for illegal characters here
-	if(hex_decode(commands[cmd].len, ascii_buf, data_buf))
+	if(!binary && hex_decode(commands[cmd].len, ascii_buf, data_buf))
 		return;
 
 	// Callback
@@ -325,6 +361,14 @@ void simpleserial_get(void)
 	
 	// Acknowledge (if version is 1.1)
 #if SS_VER == SS_VER_1_1
+	if(commands[cmd].c == 'w')
+	{
+		// Ack in the old format, then switch
+		ss_binary = 0;
+		simpleserial_put('z', 1, ret);
+		ss_binary = ss_binary_req;
+		return;
+	}
 	simpleserial_put('z', 1, ret);
 #endif
 }
@@ -334,11 +378,19 @@ void simpleserial_put(char c, uint8_t size, uint8_t* output)
 	// Write first character
 	putch(c);
 
-	// Write each byte as two nibbles
-	for(int i = 0; i < size; i++)
+	if(ss_binary)
 	{
-		putch(hex_lookup[output[i] >> 4 ]);
-		putch(hex_lookup[output[i] & 0xF]);
+		for(int i = 0; i < size; i++)
+			putch(output[i]);
+	}
+	else
+	{
+		// Write each byte as two nibbles
+		for(int i = 0; i < size; i++)
+		{
+			putch(hex_lookup[output[i] >> 4 ]);
+			putch(hex_lookup[output[i] & 0xF]);
+		}
 	}
 
 	// Write trailing '\n'
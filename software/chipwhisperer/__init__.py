@@ -71,6 +71,9 @@ programTarget = camel_case_deprecated(program_target)
 def open_project(filename):
     """Load an existing project from disk.
 
+    Traces that were journaled but not saved (see create_project()) are
+    added to the project, which then needs to be saved.
+
     Args:
        filename (str): Path to project file.
 
@@ -90,7 +93,7 @@ def open_project(filename):
 openProject = camel_case_deprecated(open_project)
 
 
-def create_project(filename, overwrite=False):
+def create_project(filename, overwrite=False, journal=False):
     """Create a new project with the path <filename>.
 
     If <overwrite> is False, raise an OSError if this path already exists.
@@ -100,6 +103,10 @@ def create_project(filename, overwrite=False):
        overwrite (bool, optional): Whether or not to overwrite an existing
            project with <filename>. Raises an OSError if path already exists
            and this is false. Defaults to false.
+       journal (bool, optional): Write traces to disk as they are added, so
+           they can be recovered by open_project() if the program stops before
+           the project is saved. Full segments are saved and unloaded from
+           memory. Defaults to false.
 
     Returns:
        A chipwhisperer project object.
@@ -117,6 +124,13 @@ def create_project(filename, overwrite=False):
 
     proj = project.Project()
     proj.setFilename(filename)
+    proj.journal = journal
+    # Don't recover the traces of an overwritten project
+    from chipwhisperer.common.traces import journal as trace_journal
+    trace_journal.remove_all(os.path.join(proj.datadirectory, "traces"))
+    if journal:
+        # So there is a project file to recover the traces into
+        proj.save()
 
     return proj
 
@@ -246,6 +260,11 @@ def target(scope, target_type=targets.SimpleSerial, **kwargs):
             print("Limiting max read")
     return target
 
+#: How capture_trace() and capture_traces() poll for the target to finish,
+#: see :class:`PollWait <chipwhisperer.common.utils.util.PollWait>`
+target_wait = util.PollWait(max_interval=0.05)
+
+
 def capture_trace(scope, target, plaintext, key=None, ack=True):
     """Capture a trace, sending plaintext and key
 
@@ -319,13 +338,12 @@ def capture_trace(scope, target, plaintext, key=None, ack=True):
 
         ret = scope.capture()
 
-        i = 0
-        while not target.is_done():
-            i += 1
-            time.sleep(0.05)
-            if i > 100:
-                warnings.warn("Target did not finish operation")
-                return None
+        stats = target_wait.wait(target.is_done, 5.0, "target")
+        if hasattr(scope, 'wait_stats'):
+            scope.wait_stats.append(stats)
+        if stats.timed_out:
+            warnings.warn("Target did not finish operation")
+            return None
 
         if ret:
             warnings.warn("Timeout happened during capture")
@@ -342,6 +360,8 @@ def capture_trace(scope, target, plaintext, key=None, ack=True):
 
 captureTrace = camel_case_deprecated(capture_trace)
 
+from chipwhisperer.capture.api.batch import capture_traces, CaptureResults
+
 def plot(*args, **kwargs):
     """Get a plotting object for use in Jupyter.
     
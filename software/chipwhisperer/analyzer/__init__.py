@@ -4,6 +4,7 @@ from chipwhisperer.analyzer import preprocessing
 from chipwhisperer.common.utils.util import camel_case_deprecated
 from chipwhisperer.common.api.ProjectFormat import Project
 from chipwhisperer.analyzer.utils import aes_funcs as aes_funcs
+from chipwhisperer.analyzer.utils.verify import verify_responses
 from chipwhisperer.analyzer.attacks.models import EightBitAES128LeakageModels
 from chipwhisperer.analyzer.attacks.models.AES128_8bit import AESLeakageHelper
 
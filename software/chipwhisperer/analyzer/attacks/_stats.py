@@ -27,7 +27,7 @@
 
 import numpy as np
 from chipwhisperer.common.utils.util import camel_case_deprecated
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
 
 class Results(object):
@@ -36,6 +36,9 @@ class Results(object):
     standard DPA & CPA attacks.
     """
 
+    #: Number of results kept in pge_total & maxes_list for each subkey, None to keep all
+    max_history = 1000
+
     def __init__(self, numSubkeys=16, numPerms=256):
         self.numSubkeys = numSubkeys
         self.numPerms = numPerms
@@ -89,11 +92,16 @@ class Results(object):
         self.maxValid = [False]*self.numSubkeys
         self.pge = [255]*self.numSubkeys
         self.diffs_tnum = [None]*self.numSubkeys
-        self.pge_total = []
-        self.maxes_list = [list() for i in range(0, self.numSubkeys)]
+        self.pge_total = deque(maxlen=self._history_length(self.numSubkeys))
+        self.maxes_list = [deque(maxlen=self._history_length(1)) for i in range(0, self.numSubkeys)]
 
         #TODO: Ensure this gets called by attack algorithms when rerunning
 
+    def _history_length(self, n):
+        if self.max_history is None:
+            return None
+        return self.max_history * n
+
     def simple_PGE(self, bnum):
         """Returns the partial guessing entropy of subkey."""
         if self.maxValid[bnum] == False:
@@ -129,6 +137,30 @@ class Results(object):
 
     updateSubkey = camel_case_deprecated(update_subkey)
 
+    @staticmethod
+    def _row_maximums(diffs, use_absolute):
+        """Return location & value of the maximum of each row of diffs, ignoring NaN's"""
+        rows = np.arange(len(diffs))
+        point = np.argmax(diffs, axis=1)
+        value = diffs[rows, point]
+        if use_absolute:
+            # Saves making an abs() copy of diffs, first location still wins on a tie
+            minpoint = np.argmin(diffs, axis=1)
+            minvalue = -diffs[rows, minpoint]
+            usemin = (minvalue > value) | ((minvalue == value) & (minpoint < point))
+            point = np.where(usemin, minpoint, point)
+            value = np.where(usemin, minvalue, value)
+
+        #argmax/argmin stop at the first NaN, redo these rows without them
+        for row in np.flatnonzero(np.isnan(value)):
+            data = diffs[row]
+            if use_absolute:
+                data = np.fabs(data)
+            data = np.where(np.isnan(data), -np.inf, data)
+            point[row] = np.argmax(data)
+            value[row] = data[point[row]] if data[point[row]] != -np.inf else np.nan
+        return point, value
+
     def find_key(self, use_absolute=True):
         """ Find the best guess for the key from the attack.
 
@@ -173,8 +205,7 @@ class Results(object):
 
             print(attack_results.find_maximums()[4][0][2])
 
-        Note the "point location of the max" is normally not calculated/tracked,
-        and thus returns as a 0.
+        The location is the index of the point with the maximum correlation.
         """
         if bytelist is None:
             bytelist = list(range(0, self.numSubkeys))
@@ -187,36 +218,22 @@ class Results(object):
                 continue
 
             if self.maxValid[i] == False:
-                for hyp in range(0, self.numPerms):
-                    if use_absolute:
-                        v = np.nanmax(np.fabs(self.diffs[i][hyp]))
-                    else:
-                        v = np.nanmax(self.diffs[i][hyp])
+                diffs = np.asarray(self.diffs[i])
+                hyps = np.arange(self.numPerms)
+                point, value = self._row_maximums(diffs, use_absolute)
 
-                    mvalue = v
-
-                    #Get maximum value for this hypothesis
-                    try:
-                        mindex = np.amin(np.where(v == mvalue))
-                    except ValueError:
-                        mindex = self.numPerms-1
-                    self.maxes[i][hyp]['hyp'] = hyp
-                    self.maxes[i][hyp]['point'] = mindex
-                    self.maxes[i][hyp]['value'] = mvalue
-
-                #TODO: why does this fail?
-                #self.maxes[i][np.isnan(self.maxes[i]['value'])]['value'] = 0
-                #TODO: workaround for PGE, as NaN's get ranked first
-                numnans = np.isnan(self.maxes[i]['value']).sum()
-
-                if use_single:
+                if use_single and not np.isnan(value).all():
                     #All table values are taken from same point MAX is taken from
-                    where = self.maxes[i][0]['point']
-                    for j in range(0, self.numPerms):
-                        self.maxes[i][j]['point'] = where
-                        self.maxes[i][j]['value'] = self.diffs[i][self.maxes[i][j]['hyp']][where]
-
-                self.maxes[i][::-1].sort(order='value') # sorts nunpy array in place and in reverse order
+                    point[:] = point[np.nanargmax(value)]
+                    value = diffs[hyps, point]
+
+                #Sort by value (then hyp) in reverse order. NaN's sort last, so get ranked first,
+                #which is worked around for PGE
+                numnans = np.isnan(value).sum()
+                order = np.lexsort((hyps, value))[::-1]
+                self.maxes[i]['hyp'] = hyps[order]
+                self.maxes[i]['point'] = point[order]
+                self.maxes[i]['value'] = value[order]
                 self.maxValid[i] = True
 
                 if self.known_key is not None:
@@ -227,11 +244,12 @@ class Results(object):
                     except IndexError:
                         self.pge[i] = self.numPerms-1
 
-            tnum = self.diffs_tnum[i]
-            self.pge_total.append({'trace':tnum, 'subkey':i, 'pge':self.pge[i]})
+                #Only new results are added to the history
+                tnum = self.diffs_tnum[i]
+                self.pge_total.append({'trace':tnum, 'subkey':i, 'pge':self.pge[i]})
 
-            if len(self.maxes_list[i]) == 0 or self.maxes_list[i][-1]['trace'] != tnum:
-                self.maxes_list[i].append({'trace':tnum, 'maxes':np.array(self.maxes[i])})
+                if len(self.maxes_list[i]) == 0 or self.maxes_list[i][-1]['trace'] != tnum:
+                    self.maxes_list[i].append({'trace':tnum, 'maxes':np.array(self.maxes[i])})
 
         return self.maxes
 
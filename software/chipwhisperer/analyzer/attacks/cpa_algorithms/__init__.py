@@ -2,10 +2,16 @@
 
 Algorithms:
 * Progressive - Online calculation allowing feedback during attack. You probably want this.
+* Vectorized - Progressive, with all key guesses for a block of traces processed as one matrix product.
+* Parallel - Vectorized, with the subkeys spread over a pool of worker processes.
 * SimpleLoop - Simple attack loop. No feedback before end of attack
 * ProgressiveCAccel - Progressive with ctypes to increase speed. Experimental/untested.
 """
 
 from .progressive import CPAProgressive as Progressive
+from .vectorized import CPAVectorized as Vectorized
+from .parallel import CPAParallel as Parallel
+from .accumulator import CPAAccumulator
+from .partial import PartialResults
 from .simpleloop import CPASimpleLoop as SimpleLoop
 from .progressive_caccel import CPAProgressive_CAccel as ProgressiveCAccel
@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import numpy as np
+
+
+class CPAAccumulator(object):
+    """Running correlation between hypotheses and traces, in co-moment form.
+
+    Instead of raw sums (sum(t), sum(t^2), sum(h*t), ...), which lose precision
+    through cancellation once many traces are added, this keeps the means and
+    the centered second moments. Each block of traces is centered on its own
+    mean and then merged into the totals (Chan et al. pairwise update), so the
+    result stays accurate for tens of millions of traces.
+
+    Blocks can be float32: they are only centered and multiplied in float32,
+    while all of the running totals are kept in float64.
+
+    Accumulators are mergeable, so traces can be split over several processes
+    or machines and combined afterwards::
+
+        a = CPAAccumulator()
+        a.add(traces[:5000], hyp[:, :5000])
+        b = CPAAccumulator()
+        b.add(traces[5000:], hyp[:, 5000:])
+        corr = (a + b).correlation()
+
+    Attributes:
+        n (int): Number of traces added.
+        mean_t (ndarray): Mean of the traces, per point.
+        mean_h (ndarray): Mean of the hypotheses, per guess.
+        m2_t (ndarray): Sum of squared deviations of the traces, per point.
+        m2_h (ndarray): Sum of squared deviations of the hypotheses, per guess.
+        cov (ndarray): (guesses x points) sum of products of deviations.
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean_t = None
+        self.mean_h = None
+        self.m2_t = None
+        self.m2_h = None
+        self.cov = None
+
+    def add(self, traces, hyp):
+        """Add a block of traces.
+
+        Args:
+            traces (ndarray): (traces x points) array, float32 or float64.
+            hyp (ndarray): (guesses x traces) array of hypotheses for the same traces.
+
+        Returns:
+            self
+        """
+        traces = np.asarray(traces)
+        if traces.dtype not in (np.float32, np.float64):
+            traces = traces.astype(np.float64)
+        hyp = np.asarray(hyp, dtype=traces.dtype)
+        if len(traces) == 0:
+            return self
+
+        mean_t = np.mean(traces, axis=0, dtype=np.float64)
+        mean_h = np.mean(hyp, axis=1, dtype=np.float64)
+        tc = traces - mean_t.astype(traces.dtype)
+        hc = hyp - mean_h.astype(traces.dtype)[:, None]
+
+        m2_t = np.sum(np.square(tc), axis=0, dtype=np.float64)
+        m2_h = np.sum(np.square(hc), axis=1, dtype=np.float64)
+        cov = np.dot(hc, tc)
+
+        self._merge(len(traces), mean_t, mean_h, m2_t, m2_h, cov)
+        return self
+
+    def _merge(self, n, mean_t, mean_h, m2_t, m2_h, cov):
+        """Merge the moments of another set of n traces into this one (in place)"""
+        if n == 0:
+            return
+
+        if self.cov is None:
+            self.mean_t = np.zeros(len(mean_t))
+            self.mean_h = np.zeros(len(mean_h))
+            self.m2_t = np.zeros(len(mean_t))
+            self.m2_h = np.zeros(len(mean_h))
+            self.cov = np.zeros((len(mean_h), len(mean_t)))
+
+        total = self.n + n
+        delta_t = mean_t - self.mean_t
+        delta_h = mean_h - self.mean_h
+        weight = self.n * n / total
+
+        # Arrays are updated in place, they may be views of shared memory
+        self.mean_t += delta_t * (n / total)
+        self.mean_h += delta_h * (n / total)
+        self.m2_t += m2_t
+        self.m2_t += np.square(delta_t) * weight
+        self.m2_h += m2_h
+        self.m2_h += np.square(delta_h) * weight
+        self.cov += cov
+        self.cov += np.outer(delta_h * weight, delta_t)
+        self.n = total
+
+    def merge(self, other):
+        """Add all of the traces of other accumulator to this one (in place)"""
+        if other.n:
+            self._merge(other.n, other.mean_t, other.mean_h, other.m2_t, other.m2_h, other.cov)
+        return self
+
+    def copy(self):
+        acc = CPAAccumulator()
+        acc.n = self.n
+        if self.cov is not None:
+            acc.mean_t = np.array(self.mean_t)
+            acc.mean_h = np.array(self.mean_h)
+            acc.m2_t = np.array(self.m2_t)
+            acc.m2_h = np.array(self.m2_h)
+            acc.cov = np.array(self.cov)
+        return acc
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    def correlation(self):
+        """Return the (guesses x points) correlation of all traces added so far"""
+        return self.cov / np.sqrt(np.outer(self.m2_h, self.m2_t))
+
+
+def save_accumulators(filename, accumulators, **info):
+    """Save accumulators to a .npz file.
+
+    Args:
+        filename (str): File to write, .npz is appended if missing.
+        accumulators (dict): {subkey: CPAAccumulator}. Empty accumulators are skipped.
+        **info: Extra arrays/values stored alongside, returned by load_accumulators().
+    """
+    subkeys = sorted(bnum for bnum, acc in accumulators.items() if acc.n)
+    accs = [accumulators[bnum] for bnum in subkeys]
+    np.savez(filename,
+             subkeys=np.array(subkeys, dtype=np.int64),
+             n=np.array([acc.n for acc in accs], dtype=np.int64),
+             mean_t=np.array([acc.mean_t for acc in accs]),
+             mean_h=np.array([acc.mean_h for acc in accs]),
+             m2_t=np.array([acc.m2_t for acc in accs]),
+             m2_h=np.array([acc.m2_h for acc in accs]),
+             cov=np.array([acc.cov for acc in accs]),
+             **info)
+
+
+def load_accumulators(filename):
+    """Load accumulators saved with save_accumulators().
+
+    Returns:
+        ({subkey: CPAAccumulator}, {name: extra info})
+    """
+    fields = ['subkeys', 'n', 'mean_t', 'mean_h', 'm2_t', 'm2_h', 'cov']
+    with np.load(filename, allow_pickle=False) as data:
+        accumulators = {}
+        for i, bnum in enumerate(data['subkeys']):
+            acc = CPAAccumulator()
+            acc.n = int(data['n'][i])
+            acc.mean_t = np.array(data['mean_t'][i])
+            acc.mean_h = np.array(data['mean_h'][i])
+            acc.m2_t = np.array(data['m2_t'][i])
+            acc.m2_h = np.array(data['m2_h'][i])
+            acc.cov = np.array(data['cov'][i])
+            accumulators[int(bnum)] = acc
+        info = {name: data[name] for name in data.files if name not in fields}
+    return accumulators, info
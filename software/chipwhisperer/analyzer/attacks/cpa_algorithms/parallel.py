@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .accumulator import CPAAccumulator
+from .vectorized import CPAVectorized, CPAVectorizedOneSubkey
+
+def _shared_array(layout, name, attached):
+    """Return the array called name from layout, attaching to its shared memory if needed"""
+    shm_name, shape, dtype = layout[name]
+    if shm_name not in attached:
+        attached[shm_name] = shared_memory.SharedMemory(name=shm_name)
+    return np.ndarray(shape, dtype=dtype, buffer=attached[shm_name].buf)
+
+
+_model = None
+
+
+def _set_model(model):
+    """Worker initializer: the leakage model used to generate hypotheses"""
+    global _model
+    _model = model
+
+
+def _accumulate(layout, attached, idx, bnum, numtraces, totalTraces):
+    acc = CPAAccumulator()
+    acc.n = totalTraces
+    acc.mean_t = _shared_array(layout, 'mean_t', attached)[idx]
+    acc.mean_h = _shared_array(layout, 'mean_h', attached)[idx]
+    acc.m2_t = _shared_array(layout, 'm2_t', attached)[idx]
+    acc.m2_h = _shared_array(layout, 'm2_h', attached)[idx]
+    acc.cov = _shared_array(layout, 'cov', attached)[idx]
+
+    traces = _shared_array(layout, 'traces', attached)[:numtraces]
+    textins, textouts, knownkeys = [_shared_array(layout, name, attached)[:numtraces] for name in ['textins', 'textouts', 'keys']]
+    hyp = CPAVectorizedOneSubkey(_model).hypothesis(bnum, numtraces, textins, textouts, knownkeys)
+    _shared_array(layout, 'diffs', attached)[idx] = acc.add(traces, hyp).correlation()
+
+
+def _update_subkey(layout, idx, bnum, numtraces, totalTraces):
+    """Worker: add the current block to the accumulator of subkey bnum (slot idx) and store its correlation"""
+    # Attached for this job only, so workers don't keep the memory of finished runs mapped
+    attached = {}
+    try:
+        _accumulate(layout, attached, idx, bnum, numtraces, totalTraces)
+    finally:
+        for shm in attached.values():
+            try:
+                shm.close()
+            except BufferError:
+                # Still referenced by the traceback of an exception
+                pass
+
+
+class CPAParallel(CPAVectorized):
+    """
+    Vectorized CPA with the subkeys spread over a pool of worker processes.
+
+    Each block of traces is placed in shared memory together with its
+    textins, textouts and keys, so nothing large is pickled to the workers.
+    Each worker generates the hypotheses for its subkey. The accumulator of
+    each subkey also lives in shared memory and is only ever written by the
+    worker handling that subkey.
+
+    The leakage model is given to the workers when they start, so with the
+    'spawn' start method (Windows, macOS) it must be picklable.
+
+    Set workers to the number of processes to use (default: one per CPU, at
+    most one per subkey)::
+
+        attack = cwa.cpa(proj, leak_model, cwa.cpa_algorithms.Parallel)
+        attack.algorithm.workers = 16
+        results = attack.run(update_interval=1000)
+
+    Larger update intervals mean fewer, larger jobs and better scaling.
+
+    The accumulators are copied back to the main process at the end of
+    addTraces(), so get_state()/set_state() and resume work as for Vectorized.
+    """
+    _name = "Parallel"
+
+    def __init__(self):
+        CPAVectorized.__init__(self)
+        self.workers = None
+
+    def addTraces(self, traceSource, tracerange, progressBar=None, pointRange=None):
+        numtraces = tracerange[1] - tracerange[0] + 1
+        brange = list(self.brange)
+        nguess = self.model.getPermPerSubkey()
+        blocksize = min(self._reportingInterval, numtraces)
+        workers = min(self.workers or os.cpu_count() or 1, len(brange))
+
+        if not self.resume:
+            self._subkeys = {}
+        accs = [self._new_subkey_attack(bnum).acc for bnum in brange]
+
+        shms = []
+        layout = {}
+        arrays = {}
+
+        def allocate(name, shape, dtype):
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            shms.append(shm)
+            layout[name] = (shm.name, shape, np.dtype(dtype).str)
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            arrays[name][...] = 0
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_set_model, initargs=(self.model,)) as pool:
+                tstart = 0
+                while tstart < numtraces:
+                    tend = min(tstart + self._reportingInterval, numtraces)
+
+                    try:
+                        traces, textins, textouts, knownkeys = self._get_block(traceSource, tracerange, tstart, tend, pointRange)
+                    except Exception as e:
+                        if progressBar:
+                            progressBar.abort(str(e))
+                            return
+                        raise
+
+                    n = tend - tstart
+                    texts = {'textins': textins, 'textouts': textouts, 'keys': np.asarray(knownkeys, dtype=np.uint8)}
+
+                    if not layout:
+                        npoints = traces.shape[1]
+                        allocate('traces', (blocksize, npoints), self.dtype)
+                        for name, data in texts.items():
+                            allocate(name, (blocksize, data.shape[1]), np.uint8)
+                        allocate('mean_t', (len(brange), npoints), np.float64)
+                        allocate('mean_h', (len(brange), nguess), np.float64)
+                        allocate('m2_t', (len(brange), npoints), np.float64)
+                        allocate('m2_h', (len(brange), nguess), np.float64)
+                        allocate('cov', (len(brange), nguess, npoints), np.float64)
+                        allocate('diffs', (len(brange), nguess, npoints), np.float64)
+                        for name in ['mean_t', 'mean_h', 'm2_t', 'm2_h', 'cov']:
+                            for idx, acc in enumerate(accs):
+                                if acc.n:
+                                    arrays[name][idx] = getattr(acc, name)
+                                setattr(acc, name, arrays[name][idx])
+
+                    arrays['traces'][:n] = traces
+                    for name, data in texts.items():
+                        if data.shape[1] != arrays[name].shape[1]:
+                            raise ValueError("Length of %s changed from %d to %d between blocks" % (name, arrays[name].shape[1], data.shape[1]))
+                        arrays[name][:n] = data
+
+                    jobs = [pool.submit(_update_subkey, layout, idx, bnum, n, accs[idx].n) for idx, bnum in enumerate(brange)]
+                    for job in jobs:
+                        job.result()
+                    for acc in accs:
+                        acc.n += n
+
+                    for idx, bnum in enumerate(brange):
+                        # Total traces in the accumulator, which includes those of earlier runs when resuming
+                        self.stats.update_subkey(bnum, np.array(arrays['diffs'][idx]), tnum=accs[idx].n)
+
+                    if progressBar and progressBar.wasAborted():
+                        return
+
+                    tstart = tend
+
+                    if self.sr:
+                        self.sr()
+        finally:
+            # Views must be released before the shared memory can be closed
+            if layout:
+                for acc in accs:
+                    for name in ['mean_t', 'mean_h', 'm2_t', 'm2_h', 'cov']:
+                        setattr(acc, name, np.array(getattr(acc, name)))
+            arrays.clear()
+            for shm in shms:
+                shm.close()
+                shm.unlink()
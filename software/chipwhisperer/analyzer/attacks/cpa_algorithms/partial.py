@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+"""Partial CPA results, which can be computed on separate machines and merged.
+
+Each node attacks its own part of the trace set and saves the result::
+
+    attack = cwa.cpa(proj, leak_model, cwa.cpa_algorithms.Vectorized)
+    attack.run(trace_range=[0, 500000])
+    attack.save_state('shard0.npz')
+
+The shards are then merged into the exact correlation of all of the traces,
+either with PartialResults or from the command line::
+
+    python -m chipwhisperer.analyzer.attacks.cpa_algorithms.partial merged.npz shard0.npz shard1.npz
+"""
+
+import argparse
+from functools import reduce
+
+import numpy as np
+
+from .accumulator import save_accumulators, load_accumulators
+from .._stats import Results
+
+
+class PartialResults(object):
+    """Sufficient statistics of a CPA attack on part of a trace set.
+
+    Holds the count, means and co-moments of the traces and hypotheses of
+    every subkey (see CPAAccumulator). Merging is associative, so shards can
+    be combined in any order or grouping and always give the same correlation
+    as attacking all traces at once.
+
+    Attributes:
+        accumulators (dict): {subkey: CPAAccumulator}
+        leak_model (str): Leakage model the hypotheses came from, with its bitmask
+            and parameters.
+        point_range (list): [start, end) of the points used.
+        trace_ranges (list): [start, end) trace ranges included.
+    """
+    def __init__(self, accumulators=None, leak_model='', point_range=None, trace_ranges=None):
+        self.accumulators = accumulators or {}
+        self.leak_model = leak_model
+        self.point_range = list(point_range) if point_range is not None else None
+        self.trace_ranges = [list(rng) for rng in trace_ranges or []]
+
+    @property
+    def num_traces(self):
+        """Number of traces included"""
+        return max([acc.n for acc in self.accumulators.values()] or [0])
+
+    def copy(self):
+        return PartialResults({bnum: acc.copy() for bnum, acc in self.accumulators.items()},
+                              self.leak_model, self.point_range, self.trace_ranges)
+
+    def merge(self, other):
+        """Add the traces of other to these results (in place).
+
+        Raises:
+            ValueError: other was computed with a different leakage model or
+                point range, or includes some of the same traces.
+        """
+        if other.leak_model != self.leak_model:
+            raise ValueError("Can't merge results of leakage model '%s' into '%s'" % (other.leak_model, self.leak_model))
+        if other.point_range != self.point_range:
+            raise ValueError("Can't merge results of points %s into %s" % (other.point_range, self.point_range))
+        for start, end in other.trace_ranges:
+            for ostart, oend in self.trace_ranges:
+                if start < oend and ostart < end:
+                    raise ValueError("Traces [%d, %d) are included twice" % (max(start, ostart), min(end, oend)))
+
+        for bnum, acc in other.accumulators.items():
+            if bnum in self.accumulators:
+                self.accumulators[bnum].merge(acc)
+            else:
+                self.accumulators[bnum] = acc.copy()
+        self.trace_ranges = sorted(self.trace_ranges + [list(rng) for rng in other.trace_ranges])
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    def results(self, numSubkeys=None):
+        """Return Results holding the correlation of every subkey"""
+        if numSubkeys is None:
+            numSubkeys = max(list(self.accumulators) + [15]) + 1
+        numPerms = max([len(acc.mean_h) for acc in self.accumulators.values()] or [256])
+        results = Results(numSubkeys, numPerms)
+        for bnum, acc in self.accumulators.items():
+            results.update_subkey(bnum, acc.correlation(), tnum=acc.n)
+        return results
+
+    def save(self, filename):
+        """Save to a .npz file, .npz is appended if missing"""
+        save_accumulators(filename, self.accumulators,
+                          leak_model=np.array(self.leak_model),
+                          point_range=np.array(self.point_range or [], dtype=np.int64),
+                          trace_ranges=np.array(self.trace_ranges, dtype=np.int64).reshape(-1, 2))
+
+    @classmethod
+    def load(cls, filename):
+        """Load results saved with save()"""
+        accumulators, info = load_accumulators(filename)
+        point_range = info['point_range'].tolist() or None
+        return cls(accumulators, str(info['leak_model']), point_range, info['trace_ranges'].tolist())
+
+
+def merge_files(filenames):
+    """Load and merge the PartialResults saved in filenames"""
+    return reduce(PartialResults.merge, (PartialResults.load(f) for f in filenames))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Merge partial CPA results computed on separate trace shards.")
+    parser.add_argument('output', help="merged .npz file to write")
+    parser.add_argument('shards', nargs='+', help=".npz files written by CPA.save_state()")
+    parser.add_argument('-q', '--quiet', action='store_true', help="don't print the key guess")
+    args = parser.parse_args(args)
+
+    merged = merge_files(args.shards)
+    merged.save(args.output)
+    if not args.quiet:
+        print("Merged %d traces from %d files" % (merged.num_traces, len(args.shards)))
+        print(merged.results())
+
+
+if __name__ == "__main__":
+    main()
@@ -29,24 +29,21 @@ import numpy as np
 import math
 
 from ..algorithmsbase import AlgorithmsBase
+from .accumulator import CPAAccumulator
 
 
 class CPAProgressiveOneSubkey(object):
     """This class is the basic progressive CPA attack, capable of adding traces onto a variable with previous data"""
     def __init__(self, model):
         self.model = model
-        self.sumhq = [0] * self.model.getPermPerSubkey()
-        self.sumtq = [0]
-        self.sumt = [0]
-        self.sumh = [0] * self.model.getPermPerSubkey()
-        self.sumht = [0] * self.model.getPermPerSubkey()
-        self.totalTraces = 0
+        self.acc = CPAAccumulator()
         self.modelstate = {'knownkey':None}
 
-    def oneSubkey(self, bnum, pointRange, traces_all, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, state, pbcnt):
-        diffs = [0] * self.model.getPermPerSubkey()
-        self.totalTraces += numtraces
+    @property
+    def totalTraces(self):
+        return self.acc.n
 
+    def oneSubkey(self, bnum, pointRange, traces_all, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, state, pbcnt):
         if pointRange == None:
             traces = traces_all
             # padbefore = 0
@@ -57,25 +54,10 @@ class CPAProgressiveOneSubkey(object):
             # padafter = len(traces_all[0, :]) - pointRange[1]
             # print "%d - %d (%d %d)" % (pointRange[0], pointRange[1], padbefore, padafter)
 
-        self.sumtq += np.sum(np.square(traces), axis=0, dtype=np.float64)
-        self.sumt += np.sum(traces, axis=0)
-        sumden2 = (np.square(self.sumt) - self.totalTraces * self.sumtq)
+        hyp = np.zeros((self.model.getPermPerSubkey(), numtraces))
 
         #For each 0..0xFF possible value of the key byte
         for key in range(0, self.model.getPermPerSubkey()):
-            #Initialize arrays & variables to zero
-            sumnum = np.zeros(len(traces[0,:]))
-            # sumden1 = np.zeros(len(traces[0,:]))
-            # sumden2 = np.zeros(len(traces[0,:]))
-
-            hyp = [0] * numtraces
-
-            #Formula for CPA & description found in "Power Analysis Attacks"
-            # by Mangard et al, page 124, formula 6.2.
-            #
-            # This has been modified to reduce computational requirements such that adding a new waveform
-            # doesn't require you to recalculate everything
-
             #Generate hypotheticals
             for tnum in range(numtraces):
 
@@ -92,57 +74,26 @@ class CPAProgressiveOneSubkey(object):
 
                 state['knownkey'] = nk
 
-                hypint = self.model.leakage(pt, ct, key, bnum, state)
-
-                hyp[tnum] = hypint
-
-            hyp = np.array(hyp)
-
-            self.sumh[key] += np.sum(hyp, axis=0)
-            self.sumht[key] += np.sum(np.multiply(np.transpose(traces), hyp), axis=1)
-
-            #WARNING: not casting to np.float64 causes algorithm degredation... always be careful
-            #meanh = self.sumh[key] / np.float64(self.totalTraces)
-            #meant = self.sumt[key] / np.float64(self.totalTraces)
-
-            #numtraces * meanh * meant = sumh * meant
-            #sumnum =  self.sumht[key] - meant*self.sumh[key] - meanh*self.sumt[key] + (self.sumh[key] * meant)
-            #sumnum =  self.sumht[key] - meanh*self.sumt[key]
-#            sumnum =  self.sumht[key] - meanh*self.sumt[key]
-            #sumnum =  self.sumht[key] - self.sumh[key]*self.sumt[key] / np.float64(self.totalTraces)
-            sumnum = self.totalTraces * self.sumht[key] - self.sumh[key] * self.sumt
-
-            self.sumhq[key] += np.sum(np.square(hyp),axis=0, dtype=np.float64)
-
-            #numtraces * meanh * meanh = sumh * meanh
-            #sumden1 = sumhq - (2*meanh*self.sumh) + (numtraces*meanh*meanh)
-            #sumden1 = sumhq - (2*meanh*self.sumh) + (self.sumh * meanh)
-            # sumden1 = sumhq - meanh*self.sumh
-            # similarly for sumden2
-            #sumden1 = self.sumhq[key] - meanh*self.sumh[key]
-            #sumden2 = self.sumtq[key] - meant*self.sumt[key]
-            # sumden = sumden1 * sumden2
-
-            #Sumden1/Sumden2 are variance of these variables, may be numeric unstability
-            #See http://en.wikipedia.org/wiki/Algorithms_for_calculating_variance for online update
-            #algorithm which might be better
-            sumden1 = (np.square(self.sumh[key]) - self.totalTraces * self.sumhq[key])
-            sumden = sumden1 * sumden2
-
-            #if sumden.any() < 1E-12:
-            #    print "WARNING: sumden small"
-
-            diffs[key] = sumnum / np.sqrt(sumden)
+                hyp[key, tnum] = self.model.leakage(pt, ct, key, bnum, state)
 
             if progressBar:
-                progressBar.updateStatus(pbcnt, (self.totalTraces-numtraces, self.totalTraces-1, bnum))
+                progressBar.updateStatus(pbcnt, (self.totalTraces, self.totalTraces+numtraces-1, bnum))
             pbcnt = pbcnt + 1
 
-            # if padafter > 0:
-            #    diffs[key] = np.concatenate([diffs[key], np.zeros(padafter)])
+        #Formula for CPA & description found in "Power Analysis Attacks"
+        # by Mangard et al, page 124, formula 6.2.
+        #
+        # The sums are kept as means & centered (co-)moments (see CPAAccumulator) so adding
+        # new waveforms doesn't require you to recalculate everything, and doesn't lose
+        # precision to the sum(t)^2 - n*sum(t^2) cancellation of raw sums
+        self.acc.add(np.asarray(traces[:numtraces], dtype=np.float64), hyp)
+        diffs = self.acc.correlation()
 
-            # if padbefore > 0:
-            #    diffs[key] = np.concatenate([np.zeros(padbefore), diffs[key]])
+        # if padafter > 0:
+        #    diffs = np.pad(diffs, ((0, 0), (0, padafter)))
+
+        # if padbefore > 0:
+        #    diffs = np.pad(diffs, ((0, 0), (padbefore, 0)))
 
         return (diffs, pbcnt)
 
@@ -162,6 +113,16 @@ class CPAProgressive(AlgorithmsBase):
         ])
         self.updateScript()
 
+    def _new_subkey_attack(self, bnum):
+        """Create the object holding the running sums for subkey bnum"""
+        return CPAProgressiveOneSubkey(self.model)
+
+    def _get_block(self, traceSource, tracerange, tstart, tend, pointRange=None):
+        """Get traces tstart to tend-1 (relative to the start of tracerange), cut to pointRange, and their text/keys"""
+        traces, textins, textouts, knownkeys = traceSource.get_trace_block(tracerange[0] + tstart, tracerange[0] + tend, pointRange)
+        # Subkey attacks take the keys as a list
+        return traces, textins, textouts, list(knownkeys)
+
     def addTraces(self, traceSource, tracerange, progressBar=None, pointRange=None):
         numtraces = tracerange[1] - tracerange[0] + 1
         if progressBar:
@@ -172,7 +133,7 @@ class CPAProgressive(AlgorithmsBase):
         pbcnt = 0
         cpa = [None]*(max(self.brange)+1)
         for bnum in self.brange:
-            cpa[bnum] = CPAProgressiveOneSubkey(self.model)
+            cpa[bnum] = self._new_subkey_attack(bnum)
 
         brangeMap = [None]*(max(self.brange)+1)
         i = 1
@@ -204,28 +165,12 @@ class CPAProgressive(AlgorithmsBase):
                 if tstart > numtraces:
                     tstart = numtraces
 
-                data = []
-                textins = []
-                textouts = []
-                knownkeys = []
-                for i in range(tstart, tend):
-                    # Handle Offset
-                    tnum = i + tracerange[0]
-
-                    try:
-                        data.append(traceSource.get_trace(tnum))
-                        textins.append(traceSource.get_textin(tnum))
-                        textouts.append(traceSource.get_textout(tnum))
-                        knownkeys.append(traceSource.get_known_key(tnum))
-                    except Exception as e:
-                        if progressBar:
-                            progressBar.abort(e.message)
-                        return
-
-                traces = np.array(data)
-                textins = np.array(textins)
-                textouts = np.array(textouts)
-                # knownkeys = np.array(knownkeys)
+                try:
+                    traces, textins, textouts, knownkeys = self._get_block(traceSource, tracerange, tstart, tend, pointRange)
+                except Exception as e:
+                    if progressBar:
+                        progressBar.abort(e.message)
+                    return
 
                 for bnum_bf in brange_bf:
                     if bf:
@@ -235,9 +180,10 @@ class CPAProgressive(AlgorithmsBase):
 
                     skip = False
                     if (self.stats.simple_PGE(bnum) != 0) or (skipPGE == False):
-                        bptrange = pointRange
+                        # Block is already cut to pointRange
+                        bptrange = None
                         (data, pbcnt) = cpa[bnum].oneSubkey(bnum, bptrange, traces, tend - tstart, textins, textouts, knownkeys, progressBar, cpa[bnum].modelstate, pbcnt)
-                        self.stats.update_subkey(bnum, data, tnum=tend)
+                        self.stats.update_subkey(bnum, data, tnum=cpa[bnum].totalTraces)
                     else:
                         skip = True
 
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import numpy as np
+
+from .accumulator import CPAAccumulator
+from .progressive import CPAProgressive
+
+
+class CPAVectorizedOneSubkey(object):
+    """Progressive CPA on one subkey, with all guesses processed at once.
+
+    Builds the (guesses x traces) hypothesis matrix for a block of traces and
+    adds it to a CPAAccumulator, which updates every guess with a single
+    matrix multiply.
+    """
+    def __init__(self, model, dtype=np.float64):
+        self.model = model
+        self.dtype = dtype
+        self.acc = CPAAccumulator()
+        self.modelstate = {'knownkey':None}
+
+    @property
+    def totalTraces(self):
+        return self.acc.n
+
+    def hypothesis(self, bnum, numtraces, plaintexts, ciphertexts, knownkeys):
+        """Return the (guesses x numtraces) matrix of modelled leakage"""
+        if knownkeys is not None and len(knownkeys) > 0 and len(knownkeys[0]) > 0:
+            knownkeys = np.asarray(knownkeys, dtype=np.uint8)
+        else:
+            knownkeys = None
+        guesses = range(self.model.getPermPerSubkey())
+        return self.model.leakage_batch(plaintexts[:numtraces], ciphertexts[:numtraces], guesses, bnum, knownkeys)
+
+    def update(self, traces, hyp):
+        """Add a block of traces & their (guesses x traces) hypotheses, return (guesses x points) correlation"""
+        self.acc.add(np.asarray(traces, dtype=self.dtype), hyp)
+        return self.acc.correlation()
+
+    def oneSubkey(self, bnum, pointRange, traces_all, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, state, pbcnt):
+        if pointRange == None:
+            traces = traces_all
+        else:
+            traces = traces_all[:, pointRange[0] : pointRange[1]]
+
+        hyp = self.hypothesis(bnum, numtraces, plaintexts, ciphertexts, knownkeys)
+        diffs = self.update(traces[:numtraces], hyp)
+
+        pbcnt = pbcnt + self.model.getPermPerSubkey()
+        if progressBar:
+            progressBar.updateStatus(pbcnt - 1, (self.totalTraces-numtraces, self.totalTraces-1, bnum))
+
+        return (diffs, pbcnt)
+
+
+class CPAVectorized(CPAProgressive):
+    """
+    Progressive CPA where each block of traces is processed with NumPy array operations
+    instead of looping over every guess and trace. Gives the same output as Progressive.
+
+    Hypotheses come from the model's leakage_batch(), which is a single table
+    lookup for most of the AES leakage models.
+
+    Set dtype to np.float32 to process traces in single precision, which halves
+    the memory bandwidth needed. Running totals are always kept in float64
+    (see CPAAccumulator), so this doesn't degrade the result over many traces.
+
+    If resume is True, addTraces() continues from the traces added by the
+    previous call (or set_state()) instead of starting over.
+    """
+    _name = "Vectorized"
+
+    def __init__(self):
+        CPAProgressive.__init__(self)
+        self.dtype = np.float64
+        self.resume = False
+        self._subkeys = {}
+
+    def _new_subkey_attack(self, bnum):
+        if bnum not in self._subkeys:
+            self._subkeys[bnum] = CPAVectorizedOneSubkey(self.model, self.dtype)
+        subkey = self._subkeys[bnum]
+        subkey.model = self.model
+        subkey.dtype = self.dtype
+        return subkey
+
+    def get_state(self):
+        """Return {subkey: CPAAccumulator} holding all traces added so far"""
+        return {bnum: subkey.acc for bnum, subkey in self._subkeys.items()}
+
+    def set_state(self, accumulators):
+        """Replace the attack state with {subkey: CPAAccumulator}, see get_state()"""
+        self._subkeys = {}
+        for bnum, acc in accumulators.items():
+            # Model is filled in when the subkey is next attacked
+            self._subkeys[bnum] = CPAVectorizedOneSubkey(None, self.dtype)
+            self._subkeys[bnum].acc = acc
+
+    def addTraces(self, traceSource, tracerange, progressBar=None, pointRange=None):
+        if not self.resume:
+            self._subkeys = {}
+        CPAProgressive.addTraces(self, traceSource, tracerange, progressBar, pointRange)
@@ -1,4 +1,5 @@
 from .cpa import CPA as CPA_Old
+from .cpa_algorithms.partial import PartialResults
 from chipwhisperer.common.api.ProjectFormat import Project
 from collections import OrderedDict
 from chipwhisperer.common.utils.util import dict_to_str
@@ -30,6 +31,19 @@ class CPA(CPA_Old):
         results = attack.run()
         print(results)
 
+    With an accumulator-based algorithm (Vectorized or Parallel), the state of
+    the attack can be saved and the attack continued later with new traces
+    only::
+
+        attack = cwa.cpa(proj, leak_model, cwa.cpa_algorithms.Vectorized)
+        attack.run()
+        attack.save_state('attack.npz')
+
+        # later, after more traces have been added to the project
+        attack = cwa.cpa(proj, leak_model, cwa.cpa_algorithms.Vectorized)
+        attack.load_state('attack.npz')
+        results = attack.run()  # only runs on traces not in attack.npz
+
     Attributes:
         project: Project to pull waves, textin, etc. from.
         algorithm: Analysis algorithm to use for attack. Should be Progressive
@@ -48,6 +62,8 @@ class CPA(CPA_Old):
     trace_range = None
     _project = None
     reporting_interval = 10
+    _resume_next = False
+    _trace_ranges = []
 
     def __init__(self, proj, leak_model, algorithm):
         """
@@ -142,7 +158,7 @@ class CPA(CPA_Old):
     def results(self):
         return self.get_statistics()
 
-    def run(self, callback=None, update_interval=25):
+    def run(self, callback=None, update_interval=25, trace_range=None, resume=False):
         """ Runs the attack
 
         Args:
@@ -150,6 +166,12 @@ class CPA(CPA_Old):
                 interval. No arguments are passed to callback. Defaults to None.
             update_interval (int, optional):  Number of traces to process
                 before updating the results of the attack.
+            trace_range (list, optional): [start, end) traces to process,
+                replaces the trace_range attribute.
+            resume (bool, optional): Add the traces to those processed by the
+                previous run instead of starting over. Always done for the
+                first run after load_state(). Only supported by accumulator
+                based algorithms (Vectorized, Parallel).
 
         Returns:
             Results, the results of the attack. See documentation
@@ -157,12 +179,104 @@ class CPA(CPA_Old):
         """
         if update_interval:
             self.reporting_interval = update_interval
+        if trace_range is not None:
+            self.trace_range = list(trace_range)
+        resume = resume or self._resume_next
+        if resume:
+            self._check_state_support()
+        if hasattr(self.algorithm, 'resume'):
+            self.algorithm.resume = resume
+        self._resume_next = False
+        if not resume:
+            self._trace_ranges = []
+        self._trace_ranges = self._trace_ranges + [list(self.trace_range)]
+
         self.algorithm.setModel(self.leak_model)
         self.algorithm.get_statistics().clear()
         self.algorithm.set_reporting_interval(self.reporting_interval)
         self.algorithm.set_target_subkeys(self.get_target_subkeys())
         self.algorithm.setStatsReadyCallback(callback)
-        self.algorithm.addTraces(self.get_trace_source(), self.trace_range,
+        if resume:
+            # Results of the traces already added, in case there are no new ones
+            for bnum, acc in self.algorithm.get_state().items():
+                if acc.n:
+                    self.algorithm.get_statistics().update_subkey(bnum, acc.correlation(), tnum=acc.n)
+        # addTraces() takes an inclusive range
+        self.algorithm.addTraces(self.get_trace_source(),
+                                 (self.trace_range[0], self.trace_range[1] - 1),
                                  None, pointRange=self.point_range)
         return self.results
 
+    def _check_state_support(self):
+        if not hasattr(self.algorithm, 'get_state'):
+            raise TypeError("Algorithm %s can't save or resume its state, use "
+                            "cpa_algorithms.Vectorized or cpa_algorithms.Parallel"
+                            % self.algorithm.getName())
+
+    def _model_name(self):
+        """Identity of the leakage model: everything that changes its hypotheses"""
+        model = self.leak_model
+        modelobj = getattr(model, 'modelobj', None)
+        params = ["bitmask=0x%02x" % model._mask] if hasattr(model, '_mask') else []
+        params += ["subkeys=%s" % model.numSubKeys, "perms=%s" % model.permPerSubkey]
+        if modelobj is not None:
+            params.insert(0, type(modelobj).__name__)
+            # Parameters of the model object, but not its cached tables
+            params += ["%s=%r" % (name, value) for name, value in sorted(vars(modelobj).items())
+                       if not name.startswith('_')]
+        return "%s: %s (%s)" % (type(model).__name__, getattr(modelobj, 'name', ''), ", ".join(params))
+
+    def partial_results(self):
+        """ Get the sufficient statistics of the traces processed so far
+
+        Only supported by accumulator based algorithms (Vectorized, Parallel).
+
+        Returns:
+            PartialResults, which can be saved and merged with the results
+            of other trace shards. See cpa_algorithms.partial.
+        """
+        self._check_state_support()
+        accumulators = {bnum: acc.copy() for bnum, acc in self.algorithm.get_state().items()}
+        return PartialResults(accumulators, self._model_name(), self.point_range, self._trace_ranges)
+
+    def save_state(self, filename):
+        """ Save the state of the attack to a .npz file
+
+        The file holds the accumulated statistics of every subkey, so that
+        load_state() can continue the attack with new traces, or the files
+        from attacks on different traces can be merged (see
+        cpa_algorithms.partial). Only supported by accumulator based
+        algorithms (Vectorized, Parallel).
+
+        Args:
+            filename (str): File to write, .npz is appended if missing.
+        """
+        self.partial_results().save(filename)
+
+    def load_state(self, filename):
+        """ Load the state of an attack saved with save_state()
+
+        The next run() continues the saved attack. trace_range is set to
+        the traces after the ones already processed, and point_range to the
+        one used for the saved attack.
+
+        Args:
+            filename (str): File written by save_state().
+
+        Raises:
+            ValueError: The state was saved with a different leakage model.
+        """
+        self._check_state_support()
+        partial = PartialResults.load(filename)
+        if partial.leak_model != self._model_name():
+            raise ValueError("State in %s is for leakage model '%s', not '%s'"
+                             % (filename, partial.leak_model, self._model_name()))
+
+        self.algorithm.set_state(partial.accumulators)
+        self.point_range = partial.point_range
+        end = max([rng[1] for rng in partial.trace_ranges] or [0])
+        self.trace_range = [end, len(self.project.traces)]
+        self.subkey_list = sorted(partial.accumulators)
+        self._trace_ranges = partial.trace_ranges
+        self._resume_next = True
+
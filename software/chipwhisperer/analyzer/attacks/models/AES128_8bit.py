@@ -26,14 +26,61 @@
 
 from collections import OrderedDict
 import inspect
+import numpy as np
 
 from chipwhisperer.analyzer.attacks.models.aes.funcs import sbox, inv_sbox, subbytes, inv_subbytes, mixcolumns, inv_mixcolumns, shiftrows, inv_shiftrows
 from chipwhisperer.common.utils.aes_tables import t_table_hw, t_table_hw_dec
+from chipwhisperer.common.utils import aes_batch
 
 from .base import ModelsBase
 from chipwhisperer.analyzer.attacks.models.aes.key_schedule import key_schedule_rounds
 from chipwhisperer.common.utils.util import camel_case_deprecated
 
+#Lookup tables used by the batched leakage models, indexed [guess, text byte]
+_TEXT = np.arange(256, dtype=np.uint8)
+_SBOX = np.array([sbox(i) for i in range(256)], dtype=np.uint8)
+_INV_SBOX = np.array([inv_sbox(i) for i in range(256)], dtype=np.uint8)
+_XOR = np.bitwise_xor.outer(_TEXT, _TEXT)
+
+
+def _as_array(data):
+    """Convert texts/keys to a (N, len) uint8 array, or None if not available"""
+    if data is None or len(data) == 0 or data[0] is None or len(data[0]) == 0:
+        return None
+    return np.asarray(data, dtype=np.uint8)
+
+
+def _guess_rows(guesses, keys, bnum):
+    """Key byte index for leakage_batch: (nguess, 1) column of guesses, or (1, N) row of known key bytes"""
+    if guesses is None:
+        if keys is None:
+            raise ValueError("Known keys required when no guesses given")
+        return keys[:, bnum][None, :].astype(np.intp)
+    return np.asarray(guesses, dtype=np.intp)[:, None]
+
+
+def _state_batch(state, pt, guesses, bnum, keys):
+    """leakage_batch for models that use the whole key: byte bnum of state(pt, keys) for each guess"""
+    pt = _as_array(pt)
+    keys = _as_array(keys)
+    if keys is None:
+        raise ValueError("Model requires known key")
+    if guesses is None:
+        return state(pt, keys)[:, bnum][None, :]
+    guesses = list(guesses)
+    keys = keys.copy()
+    out = np.empty((len(guesses), len(pt)), dtype=np.uint8)
+    for i, guess in enumerate(guesses):
+        keys[:, bnum] = guess
+        out[i] = state(pt, keys)[:, bnum]
+    return out
+
+
+def _round1(pt, keys):
+    """State after SubBytes, ShiftRows and MixColumns of the first round"""
+    return aes_batch.mixcolumns(aes_batch.shiftrows(aes_batch.subbytes(pt ^ keys)))
+
+
 class AESLeakageHelper(object):
 
     #Name of AES Model
@@ -43,6 +90,10 @@ class AESLeakageHelper(object):
     c_model_enum_value = None
     c_model_enum_name = None
 
+    #Text ('pt' or 'ct') whose byte bnum is the only input to leakage() besides
+    #the key guess. Lets leakage_batch() use a 256x256 lookup table (None = unknown)
+    lut_input = None
+
     INVSHIFT_undo = [0, 5, 10, 15, 4, 9, 14, 3, 8, 13, 2, 7, 12, 1, 6, 11]
 
     def sbox(self, data):
@@ -107,27 +158,100 @@ class AESLeakageHelper(object):
         """
         raise NotImplementedError("ASKLeakageHelper does not implement leakage")
 
+    def leakage_table(self):
+        """Return 256x256 table of leakage() indexed by [guess, text byte].
+
+        Only valid for models with lut_input set. Built on first use by calling
+        leakage() for every combination, unless _build_leakage_table() is overridden.
+        """
+        if getattr(self, '_lut', None) is None:
+            self._lut = self._build_leakage_table()
+        return self._lut
+
+    def _build_leakage_table(self):
+        table = np.zeros((256, 256), dtype=np.uint8)
+        for x in range(256):
+            text = [x] * 16
+            for guess in range(256):
+                table[guess, x] = self.leakage(text, text, [guess] * 16, 0)
+        return table
+
+    def leakage_batch(self, pt, ct, guesses, bnum, keys=None):
+        """
+        Same as leakage(), but for many traces and key guesses at once.
+
+        Models with lut_input set use a table lookup, others can override this
+        with a vectorized version. The default calls leakage() for every trace
+        and guess.
+
+        Args:
+            pt: (N, 16) uint8 array of plain-text inputs (None if not available).
+            ct: (N, 16) uint8 array of cipher-text outputs (None if not available).
+            guesses: Iterable of guesses for key byte 'bnum'. If None, byte 'bnum' of keys is used instead.
+            bnum: Byte number we are trying to attack.
+            keys: (N, 16) uint8 array of known keys (None if not available).
+
+        Returns:
+            (len(guesses), N) uint8 array of values presented on the 8-bit bus (a single row if guesses is None).
+        """
+        pt = _as_array(pt)
+        ct = _as_array(ct)
+        keys = _as_array(keys)
+
+        if self.lut_input is not None:
+            text = pt if self.lut_input == 'pt' else ct
+            return self.leakage_table()[_guess_rows(guesses, keys, bnum), text[:, bnum][None, :]]
+
+        ntraces = len(pt) if pt is not None else len(ct)
+        if guesses is not None:
+            guesses = list(guesses)
+        out = np.zeros((1 if guesses is None else len(guesses), ntraces), dtype=np.uint8)
+        for tnum in range(ntraces):
+            p = pt[tnum].tolist() if pt is not None else None
+            c = ct[tnum].tolist() if ct is not None else None
+            key = keys[tnum].tolist() if keys is not None else [None] * 16
+            if guesses is None:
+                out[0, tnum] = self.leakage(p, c, key, bnum)
+                continue
+            for i, guess in enumerate(guesses):
+                key[bnum] = guess
+                out[i, tnum] = self.leakage(p, c, key, bnum)
+        return out
+
 class PtKey_XOR(AESLeakageHelper):
     name = 'HW: AddRoundKey Output, First Round (Enc)'
+    lut_input = 'pt'
     def leakage(self, pt, ct, key, bnum):
         return pt[bnum] ^ key[bnum]
 
+    def _build_leakage_table(self):
+        return _XOR
+
 class SBox_output(AESLeakageHelper):
     name = 'HW: AES SBox Output, First Round (Enc)'
+    lut_input = 'pt'
     c_model_enum_value = 1
     c_model_enum_name = 'LEAK_HW_SBOXOUT_FIRSTROUND'
     def leakage(self, pt, ct, key, bnum):
         return self.sbox(pt[bnum] ^ key[bnum])
 
+    def _build_leakage_table(self):
+        return _SBOX[_XOR]
+
 class InvSBox_output(AESLeakageHelper):
     name = 'HW: AES Inv SBox Output, First Round (Dec)'
+    lut_input = 'pt'
     c_model_enum_value = 6
     c_model_enum_name = 'LEAK_HW_INVSBOXOUT_FIRSTROUND'
     def leakage(self, pt, ct, key, bnum):
         return self.inv_sbox(pt[bnum] ^ key[bnum])
 
+    def _build_leakage_table(self):
+        return _INV_SBOX[_XOR]
+
 class LastroundHW(AESLeakageHelper):
     name = 'HW: AES Last-Round State'
+    lut_input = 'ct'
     def leakage(self, pt, ct, key, bnum):
         # HD Leakage of AES State between 9th and 10th Round
         # Used to break SASEBO-GII / SAKURA-G
@@ -138,6 +262,8 @@ class LastroundHW(AESLeakageHelper):
     def process_known_key(self, inpkey):
         return key_schedule_rounds(inpkey, 0, 10)
 
+    def _build_leakage_table(self):
+        return _INV_SBOX[_XOR]
 
 class LastroundStateDiff(AESLeakageHelper):
     name = 'HD: AES Last-Round State'
@@ -153,8 +279,15 @@ class LastroundStateDiff(AESLeakageHelper):
     def process_known_key(self, inpkey):
         return key_schedule_rounds(inpkey, 0, 10)
 
+    def leakage_batch(self, pt, ct, guesses, bnum, keys=None):
+        ct = _as_array(ct)
+        st10 = ct[:, self.INVSHIFT_undo[bnum]]
+        st9 = _INV_SBOX[_guess_rows(guesses, _as_array(keys), bnum) ^ ct[:, bnum]]
+        return st9 ^ st10
+
 class LastroundStateDiffAlternate(AESLeakageHelper):
     name = 'HD: AES Last-Round State Alternate'
+    lut_input = 'ct'
     def leakage(self, pt, ct, key, bnum):
         # Alternate leakage
         st10 = ct[bnum]
@@ -166,8 +299,12 @@ class LastroundStateDiffAlternate(AESLeakageHelper):
         k = self.shiftrows(k)
         return k
 
+    def _build_leakage_table(self):
+        return _INV_SBOX[_XOR] ^ _TEXT
+
 class SBoxInOutDiff(AESLeakageHelper):
     name = 'HD: AES SBox Input to Output'
+    lut_input = 'pt'
     c_model_enum_value = 3
     c_model_enum_name = 'LEAK_HD_SBOX_IN_OUT'
     def leakage(self, pt, ct, key, bnum):
@@ -175,6 +312,9 @@ class SBoxInOutDiff(AESLeakageHelper):
         st2 = self.sbox(st1)
         return st1 ^ st2
 
+    def _build_leakage_table(self):
+        return _XOR ^ _SBOX[_XOR]
+
 class SBoxInputSuccessive(AESLeakageHelper):
     name = 'HD: AES SBox Input i to i+1'
     c_model_enum_name = 4
@@ -190,6 +330,16 @@ class SBoxInputSuccessive(AESLeakageHelper):
             st2 = 0
         return st1 ^ st2
 
+    def leakage_batch(self, pt, ct, guesses, bnum, keys=None):
+        pt = _as_array(pt)
+        keys = _as_array(keys)
+        st1 = (_guess_rows(guesses, keys, bnum) ^ pt[:, bnum]).astype(np.uint8)
+        if bnum > 0:
+            if keys is None:
+                raise ValueError("Successive requires known key")
+            return st1 ^ (pt[:, bnum-1] ^ keys[:, bnum-1])
+        return st1
+
 class SBoxOutputSuccessive(AESLeakageHelper):
     name = 'HD: AES SBox Output i to i+1'
     c_model_enum_value = 5
@@ -205,11 +355,25 @@ class SBoxOutputSuccessive(AESLeakageHelper):
             st2 = 0
         return st1 ^ st2
 
+    def leakage_batch(self, pt, ct, guesses, bnum, keys=None):
+        pt = _as_array(pt)
+        keys = _as_array(keys)
+        st1 = _SBOX[_guess_rows(guesses, keys, bnum) ^ pt[:, bnum]]
+        if bnum > 0:
+            if keys is None:
+                raise ValueError("Successive requires known key")
+            return st1 ^ _SBOX[pt[:, bnum-1] ^ keys[:, bnum-1]]
+        return st1
+
 class AfterKeyMixin(AESLeakageHelper):
     name = 'HW: AES After Key/PT Addition'
+    lut_input = 'pt'
     def leakage(self, pt, ct, key, bnum):
         return pt[bnum] ^ key[bnum]
 
+    def _build_leakage_table(self):
+        return _XOR
+
 class Mixcolumns_output(AESLeakageHelper):
     name = 'HW: AES Mixcolumns Output'
     #This is mostly a nonsense leakage model for now, but added for completeness
@@ -220,6 +384,9 @@ class Mixcolumns_output(AESLeakageHelper):
         state = self.mixcolumns(state)
         return state[bnum]
 
+    def leakage_batch(self, pt, ct, guesses, bnum, keys=None):
+        return _state_batch(_round1, pt, guesses, bnum, keys)
+
 class ShiftColumns_output(AESLeakageHelper):
     name = 'HW: AES ShiftColumns Output'
     def leakage(self, pt, ct, key, bnum):
@@ -228,6 +395,9 @@ class ShiftColumns_output(AESLeakageHelper):
         state = self.shiftrows(state)
         return state[bnum]
 
+    def leakage_batch(self, pt, ct, guesses, bnum, keys=None):
+        return _state_batch(lambda p, k: aes_batch.shiftrows(aes_batch.subbytes(p ^ k)), pt, guesses, bnum, keys)
+
 class Round1Round2StateDiff_Text(AESLeakageHelper):
     name = 'HD: AES Round1/Round2 State diff for text'
     def leakage(self, pt, ct, key, bnum):
@@ -238,6 +408,9 @@ class Round1Round2StateDiff_Text(AESLeakageHelper):
         state = self.mixcolumns(state)
         return state[bnum] ^ state1[bnum]
 
+    def leakage_batch(self, pt, ct, guesses, bnum, keys=None):
+        return _state_batch(lambda p, k: _round1(p, k) ^ p, pt, guesses, bnum, keys)
+
 class Round1Round2StateDiff_KeyMix(AESLeakageHelper):
     name = 'HD: AES Round1/Round2 State diff for key addition'
     def leakage(self, pt, ct, key, bnum):
@@ -252,6 +425,11 @@ class Round1Round2StateDiff_KeyMix(AESLeakageHelper):
 
         return state[bnum] ^ state1[bnum]
 
+    def leakage_batch(self, pt, ct, guesses, bnum, keys=None):
+        def state(p, k):
+            return _round1(p, k) ^ aes_batch.expand_key(k, 1)[:, 1] ^ p ^ k
+        return _state_batch(state, pt, guesses, bnum, keys)
+
 class Round1Round2StateDiff_SBox(AESLeakageHelper):
     name = 'HD: AES Round1/Round2 State diff for SBox'
     def leakage(self, pt, ct, key, bnum):
@@ -266,6 +444,13 @@ class Round1Round2StateDiff_SBox(AESLeakageHelper):
         state = subbytes(state)
         return state[bnum] ^ state1[bnum]
 
+    def leakage_batch(self, pt, ct, guesses, bnum, keys=None):
+        def state(p, k):
+            state1 = aes_batch.subbytes(p ^ k)
+            state2 = aes_batch.mixcolumns(aes_batch.shiftrows(state1)) ^ aes_batch.expand_key(k, 1)[:, 1]
+            return aes_batch.subbytes(state2) ^ state1
+        return _state_batch(state, pt, guesses, bnum, keys)
+
 #List of all classes you can use
 enc_list = [SBox_output, PtKey_XOR, SBoxInputSuccessive, SBoxInOutDiff, LastroundStateDiff, LastroundStateDiffAlternate, SBoxOutputSuccessive, ShiftColumns_output, Mixcolumns_output, Round1Round2StateDiff_Text, Round1Round2StateDiff_KeyMix, Round1Round2StateDiff_SBox]
 dec_list = [InvSBox_output]
@@ -278,6 +463,8 @@ class AES128_8bit(ModelsBase):
     """
     _name = 'AES 128'
 
+    _hw_table = np.array(ModelsBase.HW, dtype=np.uint8)
+
     hwModels = OrderedDict((mod.name, mod) for mod in (enc_list+dec_list) )
 
     hw_models = OrderedDict((mod.__name__, mod) for mod in (enc_list+dec_list))
@@ -349,6 +536,22 @@ class AES128_8bit(ModelsBase):
         #Return HW of guess
         return self.HW[intermediate_value]
 
+    def leakage_batch(self, pt, ct, guesses, bnum, knownkeys=None):
+        """ Leakage as set by model, for many traces and guesses at once
+
+        Args:
+            pt (array): (N, 16) Plaintexts/textins
+            ct (array): (N, 16) Ciphertexts/textouts
+            guesses (iterable): Key guesses. If None, the known key is used as-is
+            bnum (int): Subkey Byte Number
+            knownkeys (array, optional): (N, 16) known keys
+
+        Returns:
+            (len(guesses), N) uint8 array of hamming weights
+        """
+        intermediate_value = self.modelobj.leakage_batch(pt, ct, guesses, bnum, knownkeys)
+        return self._hw_table[self._mask & intermediate_value]
+
     def key_schedule_rounds(self, inputkey, inputround, desiredround):
         """Changes the round of inputkey from inputround to desiredround
 
@@ -366,6 +569,8 @@ class AES128_8bit(ModelsBase):
 
 
 class AES128_ttable(AES128_8bit):
+    _hw_table = np.array(t_table_hw, dtype=np.uint8)
+
     def leakage(self, pt, ct, guess, bnum, state):
         """ Leakage as set by model
 
@@ -402,6 +607,8 @@ class AES128_ttable(AES128_8bit):
         return t_table_hw[intermediate_value]
 
 class AES128_ttable_dec(AES128_8bit):
+    _hw_table = np.array(t_table_hw_dec, dtype=np.uint8)
+
     def leakage(self, pt, ct, guess, bnum, state):
         """ Leakage as set by model
 
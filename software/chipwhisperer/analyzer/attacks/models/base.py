@@ -95,6 +95,26 @@ class ModelsBase(Parameterized):
     def leakage(self, pt, ct, guess, bnum, state):
         pass
 
+    def leakage_batch(self, pt, ct, guesses, bnum, knownkeys=None):
+        """Return leakage() for every guess (rows) and trace (columns) as an array.
+
+        Generic version calling leakage() once per guess and trace. If guesses
+        is None, the known key is used as-is and a single row is returned.
+        """
+        ntraces = len(pt) if pt is not None and len(pt) > 0 else len(ct)
+        if guesses is None:
+            guesses = [None]
+        state = {'knownkey':None}
+        out = [[None] * ntraces for _ in guesses]
+        for tnum in range(ntraces):
+            p = pt[tnum] if pt is not None and len(pt) > 0 else None
+            c = ct[tnum] if ct is not None and len(ct) > 0 else None
+            if knownkeys is not None and len(knownkeys) > 0:
+                state['knownkey'] = knownkeys[tnum]
+            for i, guess in enumerate(guesses):
+                out[i][tnum] = self.leakage(p, c, guess, bnum, state)
+        return np.array(out)
+
     def getNumSubKeys(self):
         return self.numSubKeys
 
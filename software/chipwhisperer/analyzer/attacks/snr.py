@@ -43,55 +43,22 @@ def calculate_snr(input, leak_model, bnum=0, db=True):
         bd (bool): Return signal-to-noise ratio in decibals.
     """
 
-    textin = None
-    textout = None
-    key = None
-    trace = None
-
-    hwarray = []
-
-    tm = None
-
     ntrace = len(input)
-    npoints = len(input[0].wave)
-
-    for tnum in range(0, ntrace):
-        trace = input[tnum].wave
-        textin = input[tnum].textin
-        textout = input[tnum].textout
-        key = input[tnum].key
-
-        state = {'knownkey':key}
-
-        leakage = leak_model.leakage(textin, textout, None, bnum, state)
-
-        while leakage >= len(hwarray):
-            hwarray.append([])
-
-        hwarray[leakage].append(trace)
-
-    hwmean = np.zeros((len(hwarray), npoints))
-
-    for i in range(0, len(hwarray)):
-        hwmean[i] = np.mean(hwarray[i], axis=0)
 
-    inc_list = []
-    best_choice = -1
-    best_choice_len = 0
-    for i in range(0, len(hwarray)):
-        num_elements = len(hwarray[i])
-        if num_elements > 0:
-            inc_list.append(i)
-            #Figure out if this is largest list as well
-            if num_elements > best_choice_len:
-                best_choice = i
-                best_choice_len = num_elements
+    waves = np.array([input[tnum].wave for tnum in range(ntrace)])
+    textins = [input[tnum].textin for tnum in range(ntrace)]
+    textouts = [input[tnum].textout for tnum in range(ntrace)]
+    keys = [input[tnum].key for tnum in range(ntrace)]
 
+    leakage = leak_model.leakage_batch(textins, textouts, None, bnum, keys)[0]
 
-    hwmean_valid = hwmean[inc_list]
+    #Group traces by leakage value, the largest group is used for the noise
+    values, counts = np.unique(leakage, return_counts=True)
+    hwmean_valid = np.array([np.mean(waves[leakage == v], axis=0) for v in values])
+    best_choice = values[np.argmax(counts)]
 
     signal_var = np.var(hwmean_valid, axis=0)
-    noise_var_onehw = np.var(hwarray[best_choice], axis=0)
+    noise_var_onehw = np.var(waves[leakage == best_choice], axis=0)
 
     snr = signal_var / noise_var_onehw
 
@@ -25,6 +25,7 @@
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
 import logging
+import numpy as np
 
 from chipwhisperer.common.utils.tracesource import TraceSource, PassiveTraceObserver
 from chipwhisperer.common.utils.parameter import setupSetParam
@@ -105,6 +106,35 @@ class PreprocessingBase(TraceSource, PassiveTraceObserver):
             return self._traceSource.get_trace(n)
 
     getTrace = camel_case_deprecated(get_trace)
+
+    def _processes_traces(self):
+        """True if this module overrides get_trace() or the older getTrace()"""
+        return type(self).get_trace is not PreprocessingBase.get_trace or \
+            type(self).getTrace is not PreprocessingBase.getTrace
+
+    def _get_processed_trace(self, n):
+        # Some modules only override the older getTrace()
+        if type(self).get_trace is PreprocessingBase.get_trace and self._processes_traces():
+            return self.getTrace(n)
+        return self.get_trace(n)
+
+    def get_trace_block(self, start, stop, point_range=None):
+        """Get traces start to stop-1 and their data as arrays, see TraceSource.get_trace_block()
+
+        Passes the block straight through from the previous source if this
+        module is disabled or doesn't change the traces. Otherwise the traces
+        are processed one at a time.
+        """
+        if not self.enabled or not self._processes_traces():
+            return self._traceSource.get_trace_block(start, stop, point_range)
+
+        # Only the text & keys are needed from the previous source
+        _, textins, textouts, keys = self._traceSource.get_trace_block(start, stop, [0, 0])
+        traces = np.array([self._get_processed_trace(n) for n in range(start, stop)])
+        if point_range is not None:
+            traces = traces[:, point_range[0]:point_range[1]]
+        return traces, textins, textouts, keys
+
     def get_textin(self, n):
         """Get text-in number n"""
         return self._traceSource.get_textin(n)
@@ -198,9 +228,10 @@ class PreprocessingBase(TraceSource, PassiveTraceObserver):
         proj = Project()
 
         for i in trange(self.num_traces()):
-            if self.get_trace(i) is None:
-                logging.warn("Wave {} ({}) is invalid. Skipping ".format(i, self.get_trace(i)))
+            trace = self._get_processed_trace(i)
+            if trace is None:
+                logging.warn("Wave {} ({}) is invalid. Skipping ".format(i, trace))
                 continue
-            proj.traces.append(Trace(self.get_trace(i), self.get_textin(i),
+            proj.traces.append(Trace(trace, self.get_textin(i),
                                 self.get_textout(i), self.get_known_key(i)))
         return proj
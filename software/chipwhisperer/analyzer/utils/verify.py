@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2020, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.github.com/newaetech/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+import numpy as np
+
+from chipwhisperer.common.utils import aes_batch
+
+
+def _as_rows(data):
+    """Return data as an (N x width) uint8 array and the length of each row (0 if missing)"""
+    if isinstance(data, np.ndarray) and data.ndim == 2:
+        return np.asarray(data, dtype=np.uint8), np.full(len(data), data.shape[1])
+    lengths = np.array([0 if row is None else len(row) for row in data], dtype=int)
+    rows = np.zeros((len(lengths), lengths.max(initial=0)), dtype=np.uint8)
+    for i, row in enumerate(data):
+        if lengths[i]:
+            rows[i, :lengths[i]] = bytearray(row)
+    return rows, lengths
+
+
+def verify_responses(project, decrypt=False, chunk_size=65536):
+    """Check which textouts of a project are the AES encryption of their textin.
+
+    Useful to find traces where the target glitched or the serial data was
+    corrupted. All the traces are checked with a vectorized AES (see
+    :mod:`chipwhisperer.common.utils.aes_batch`), chunk_size traces at a
+    time. Keys can be 16, 24 or 32 bytes long.
+
+    Args:
+        project (Project): Project (or :class:`TraceBatch <chipwhisperer.common.traces.TraceBatch>`)
+            with the textins, textouts and keys of the traces.
+        decrypt (bool): Check that the textouts are the decryption of
+            the textins instead.
+        chunk_size (int): Number of traces checked at once.
+
+    Returns:
+        Boolean array, True for the traces with the right textout. Traces
+        missing a textin, textout or key, or with the wrong length, are False.
+    """
+    ntraces = len(project.textins)
+    result = np.zeros(ntraces, dtype=bool)
+    cipher = aes_batch.decrypt if decrypt else aes_batch.encrypt
+    for start in range(0, ntraces, chunk_size):
+        stop = min(start + chunk_size, ntraces)
+        textins, inlen = _as_rows(project.textins[start:stop])
+        textouts, outlen = _as_rows(project.textouts[start:stop])
+        keys, keylen = _as_rows(project.keys[start:stop])
+        valid = (inlen == 16) & (outlen == 16)
+        for length in (16, 24, 32):
+            rows = np.flatnonzero(valid & (keylen == length))
+            if len(rows) == 0:
+                continue
+            rowkeys = keys[rows, :length]
+            if (rowkeys == rowkeys[0]).all():
+                # Usually a fixed key, which only needs expanding once
+                rowkeys = rowkeys[0]
+            expected = cipher(textins[rows, :16], rowkeys)
+            result[start + rows] = (expected == textouts[rows, :16]).all(axis=1)
+    return result
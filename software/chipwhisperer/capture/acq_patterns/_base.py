@@ -23,6 +23,7 @@
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
 
+import numpy as np
 from chipwhisperer.common.utils.util import camel_case_deprecated
 
 class AcqKeyTextPattern_Base(object):
@@ -33,6 +34,7 @@ class AcqKeyTextPattern_Base(object):
         self._text_len = 16
         self._key = None
         self._textin = None
+        self.seed = None
 
     def setTarget(self, target):
         pass
@@ -53,6 +55,31 @@ class AcqKeyTextPattern_Base(object):
     def text_len(self, n):
         self._text_len = n
 
+    @property
+    def seed(self):
+        """Seed of the random number generator for keys and plaintexts.
+
+        Setting it (again) restarts the generator, so the same keys and
+        plaintexts are generated after setting the same seed. None seeds
+        it randomly.
+        """
+        return self._seed
+
+    @seed.setter
+    def seed(self, seed):
+        self._seed = seed
+        self._rng = np.random.default_rng(seed)
+
+    def _random_rows(self, n, length):
+        """Return an (n x length) uint8 array of random bytes.
+
+        Every row takes the same number of 32-bit words from the generator,
+        so n rows at once are the same as n single rows.
+        """
+        words = (length + 3) // 4
+        data = self._rng.integers(0, 2**32, size=(n, words), dtype=np.uint32)
+        return data.astype('<u4').view(np.uint8)[:, :length]
+
     @property
     def fixed_key(self):
         """Generate fixed key (True) or not (False).
@@ -125,4 +152,21 @@ class AcqKeyTextPattern_Base(object):
         return "key: {}\ntext: {}".format(list(hex(b) for b in self._key), list(hex(b) for b in self._textin))
 
     def next(self):
-        self.new_pair()
+        return self.new_pair()
+
+    def next_batch(self, n):
+        """Returns the next n keys and plaintexts.
+
+        The same as calling next() n times, but patterns with a faster way
+        of generating many pairs at once use it.
+
+        Returns:
+            (keys, texts): (n x key_len) and (n x text_len) uint8 arrays
+        """
+        keys = np.empty((n, self.key_len), dtype=np.uint8)
+        texts = np.empty((n, self.text_len), dtype=np.uint8)
+        for i in range(n):
+            key, text = self.next()
+            keys[i] = bytearray(key)
+            texts[i] = bytearray(text)
+        return keys, texts
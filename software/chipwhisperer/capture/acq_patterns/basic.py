@@ -23,7 +23,7 @@
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
 
-import random
+import numpy as np
 from chipwhisperer.common.utils import util
 from ._base import AcqKeyTextPattern_Base
 from chipwhisperer.common.utils.util import camel_case_deprecated
@@ -36,6 +36,11 @@ class AcqKeyTextPattern_Basic(AcqKeyTextPattern_Base):
         import chipwhisperer as cw
         ktp = cw.ktp.Basic()
         key, text = ktp.next()
+
+    Many pairs at once, reproducibly::
+
+        ktp.seed = 1234
+        keys, texts = ktp.next_batch(5000)
     """
     _name = "Basic"
 
@@ -136,15 +141,12 @@ class AcqKeyTextPattern_Basic(AcqKeyTextPattern_Base):
         pass
 
     def new_pair(self):
+        keys, texts = self._random_pairs(1)
         if self._fixedKey is False:
-            self._key = bytearray(self.keyLen())
-            for i in range(0, self.keyLen()):
-                self._key[i] = random.randint(0, 255)
+            self._key = bytearray(keys[0])
 
         if self._fixedPlain is False:
-            self._textin = bytearray(self.textLen())
-            for i in range(0, self.textLen()):
-                self._textin[i] = random.randint(0, 255)
+            self._textin = bytearray(texts[0])
 
         # Check pair works with target
         self.validateKey()
@@ -166,7 +168,36 @@ class AcqKeyTextPattern_Basic(AcqKeyTextPattern_Base):
             Added next
         """
 
-        return self.next_key(), self.next_text()
+        return self.new_pair()
+
+    def _random_pairs(self, n):
+        rows = self._random_rows(n, self.keyLen() + self.textLen())
+        return rows[:, :self.keyLen()], rows[:, self.keyLen():]
+
+    def next_batch(self, n):
+        """Returns the next n key text pairs
+
+        The same pairs as calling next() n times, but generated at once.
+        Updates last key and text.
+
+        Returns:
+            (keys, texts): (n x key_len) and (n x text_len) uint8 arrays
+        """
+        keys, texts = self._random_pairs(n)
+        if self._fixedKey:
+            self.validateKey()
+            keys = np.tile(np.frombuffer(bytes(self._key), dtype=np.uint8), (n, 1))
+        if self._fixedPlain:
+            self.validateText()
+            texts = np.tile(np.frombuffer(bytes(self._textin), dtype=np.uint8), (n, 1))
+        keys, texts = np.ascontiguousarray(keys), np.ascontiguousarray(texts)
+
+        if n > 0:
+            self._key = bytearray(keys[-1])
+            self._textin = bytearray(texts[-1])
+        self.validateKey()
+        self.validateText()
+        return keys, texts
 
     def next_text(self):
         """ Returns the next plaintext
@@ -181,9 +212,7 @@ class AcqKeyTextPattern_Basic(AcqKeyTextPattern_Base):
             Added next_text
         """
         if self._fixedPlain is False:
-            self._textin = bytearray(self.textLen())
-            for i in range(0, self.textLen()):
-                self._textin[i] = random.randint(0, 255)
+            self._textin = bytearray(self._random_rows(1, self.textLen())[0])
 
         self.validateText()
         return self._textin
@@ -201,9 +230,7 @@ class AcqKeyTextPattern_Basic(AcqKeyTextPattern_Base):
             Added next_key
         """
         if self._fixedKey is False:
-            self._key = bytearray(self.keyLen())
-            for i in range(0, self.keyLen()):
-                self._key[i] = random.randint(0, 255)
+            self._key = bytearray(self._random_rows(1, self.keyLen())[0])
         self.validateKey()
         return self._key
 
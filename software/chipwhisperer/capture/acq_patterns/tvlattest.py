@@ -23,10 +23,9 @@
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
 import logging
-import random
+import numpy as np
 from chipwhisperer.common.utils import util
-from chipwhisperer.analyzer.utils.aes_funcs import key_schedule_rounds
-from chipwhisperer.common.utils.aes_cipher import AESCipher
+from chipwhisperer.common.utils.aes_batch import AESBatch
 from ._base import AcqKeyTextPattern_Base
 
 class AcqKeyTextPattern_TVLATTest(AcqKeyTextPattern_Base):
@@ -40,6 +39,10 @@ class AcqKeyTextPattern_TVLATTest(AcqKeyTextPattern_Base):
                              # capture
         key, text = ktp.next()
 
+    Or all of them at once::
+
+        keys, texts = ktp.next_batch(num_traces)
+
     """
     _name = "TVLA Rand vs Fixed"
     _description = "Welsh T-Test with random/fixed plaintext."
@@ -48,6 +51,8 @@ class AcqKeyTextPattern_TVLATTest(AcqKeyTextPattern_Base):
         AcqKeyTextPattern_Base.__init__(self)
         self._interleavedPlaintext = []
         self._key = []
+        self._cipher = None
+        self._cipher_key = None
 
 
         self.setTarget(target)
@@ -84,43 +89,45 @@ class AcqKeyTextPattern_TVLATTest(AcqKeyTextPattern_Base):
         self.num_group1 = int(maxtraces/2)
         self.num_group2 = int(maxtraces - self.num_group1)
 
-    def new_pair(self):
-        rand = random.random()
-        num_tot = self.num_group1 + self.num_group2
-        if num_tot == 0:
-            group1 = (rand < 0.5)
-        else:
-            cutoff = float(self.num_group1) / num_tot
-            group1 = (rand < cutoff)
-
-        if group1:
-            self._textin = self._textin1
-
-            exp_key = list(self._key)
-            rounds = 0
-            keylen = self.keyLen()
-
-            if keylen == 16:
-                rounds = 10
-            elif keylen == 24:
-                rounds = 12
-            elif keylen == 32:
-                rounds = 14
-
-            #expand key
-            for i in range(1, rounds+1):
-                exp_key.extend(key_schedule_rounds(list(self._key), 0, i))
-
-            cipher = AESCipher(exp_key)
-            self._textin1 = bytearray(cipher.cipher_block(list(self._textin1)))
+    def _get_cipher(self):
+        """Return an AESBatch for the key, expanding the key only when it changes"""
+        if self._cipher is None or self._cipher_key != bytes(self._key):
+            self._cipher = AESBatch(self._key)
+            self._cipher_key = bytes(self._key)
+        return self._cipher
+
+    def _next_groups(self, n):
+        """Return which of the next n traces are in group 1 (bool array)"""
+        rand = self._rng.random(n)
+        group1 = np.empty(n, dtype=bool)
+        for i in range(n):
+            num_tot = self.num_group1 + self.num_group2
+            if num_tot == 0:
+                group1[i] = (rand[i] < 0.5)
+            else:
+                cutoff = float(self.num_group1) / num_tot
+                group1[i] = (rand[i] < cutoff)
+
+            if group1[i]:
+                if self.num_group1 > 0:
+                    self.num_group1 -= 1
+            elif self.num_group2 > 0:
+                self.num_group2 -= 1
+        return group1
 
-            if self.num_group1 > 0:
-                self.num_group1 -= 1
+    def _next_chain(self, n):
+        """Return the next n texts of group 1, each the encryption of the one before"""
+        cipher = self._get_cipher()
+        texts = cipher.encrypt_chain(self._textin1, n)
+        if n > 0:
+            self._textin1 = cipher.encrypt_block(texts[-1])
+        return texts
 
+    def new_pair(self):
+        if self._next_groups(1)[0]:
+            self._textin = bytearray(self._next_chain(1)[0])
         else:
             self._textin = self._interleavedPlaintext
-            if self.num_group2 > 0:
-                self.num_group2 -= 1
 
         # Check key works with target
         self.validateKey()
@@ -139,3 +146,21 @@ class AcqKeyTextPattern_TVLATTest(AcqKeyTextPattern_Base):
             Added next
         """
         return self.new_pair()
+
+    def next_batch(self, n):
+        """Returns the next n key text pairs
+
+        The same pairs as calling next() n times, but the group 1 texts are
+        generated together, with the key expanded once.
+
+        Returns:
+            (keys, texts): (n x key_len) and (n x text_len) uint8 arrays
+        """
+        self.validateKey()
+        group1 = self._next_groups(n)
+        keys = np.tile(np.frombuffer(bytes(self._key), dtype=np.uint8), (n, 1))
+        texts = np.tile(np.frombuffer(bytes(self._interleavedPlaintext), dtype=np.uint8), (n, 1))
+        texts[group1] = self._next_chain(int(np.count_nonzero(group1)))
+        if n > 0:
+            self._textin = bytearray(texts[-1])
+        return keys, texts
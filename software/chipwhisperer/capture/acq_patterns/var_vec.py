@@ -25,6 +25,7 @@
 #=================================================
 
 import random
+import numpy as np
 from chipwhisperer.common.utils import util
 from ._base import AcqKeyTextPattern_Base
 from chipwhisperer.common.utils.util import camel_case_deprecated
@@ -107,4 +108,15 @@ class AcqKeyTextPattern_VarVec(AcqKeyTextPattern_Basic):
         for val in lut[self.var_vec]:
             tmp[val] = text[val]
 
-        return key, tmp
\ No newline at end of file
+        return key, tmp
+
+    def next_batch(self, n):
+        keys, texts = super().next_batch(n)
+        if self.vec_type == self.VEC_TYPE_COL:
+            lut = self.COL_LUT
+        else:
+            lut = self.ROW_LUT
+
+        tmp = np.zeros_like(texts)
+        tmp[:, lut[self.var_vec]] = texts[:, lut[self.var_vec]]
+        return keys, tmp
\ No newline at end of file
@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2020, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+"""Capturing a batch of traces, with the stages of consecutive traces overlapped."""
+
+import logging
+import queue
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import chipwhisperer as cw
+from chipwhisperer.common.traces import Trace
+from chipwhisperer.common.utils.util import DelayedKeyboardInterrupt, dict_to_str
+
+
+class CaptureResults(object):
+    """Traces and per-stage timings from :func:`capture_traces`.
+
+    Attributes:
+        traces (list): Captured traces, if they weren't stored in a project.
+        captured (int): Number of traces captured.
+        failed (int): Number of captures that timed out or returned no data.
+        elapsed (float): Wall-clock time of the whole batch, in seconds.
+        timings (OrderedDict): Total time spent in each stage, in seconds:
+
+            * prepare: Generating the keys and texts.
+            * key: Sending keys to the target.
+            * arm: Arming the scope.
+            * write: Sending texts to the target.
+            * capture: Waiting for the trigger and reading the ADC data.
+            * wait: Waiting for the target to finish.
+            * read: Reading the target's response.
+            * decode: Converting the ADC data into traces (background thread).
+            * store: Adding the traces to the project (background thread).
+    """
+    stages = ('prepare', 'key', 'arm', 'write', 'capture', 'wait', 'read', 'decode', 'store')
+
+    def __init__(self):
+        self.traces = []
+        self.captured = 0
+        self.failed = 0
+        self.elapsed = 0.0
+        self.timings = OrderedDict((stage, 0.0) for stage in self.stages)
+
+    @contextmanager
+    def timing(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] += time.perf_counter() - start
+
+    @property
+    def traces_per_second(self):
+        if self.elapsed == 0:
+            return 0.0
+        return self.captured / self.elapsed
+
+    def _dict_repr(self):
+        dict = OrderedDict()
+        dict['captured'] = self.captured
+        dict['failed'] = self.failed
+        dict['elapsed'] = self.elapsed
+        dict['traces_per_second'] = self.traces_per_second
+        dict['timings'] = self.timings
+        return dict
+
+    def __repr__(self):
+        return dict_to_str(self._dict_repr())
+
+    def __str__(self):
+        return self.__repr__()
+
+
+def capture_traces(scope, target, ktp, n, project=None, ack=True, timeout=5.0, queue_depth=64):
+    """Capture n traces, with keys/plaintexts from ktp.
+
+    Does the same steps as :func:`capture_trace <chipwhisperer.capture_trace>`
+    for every trace, but overlaps the work of consecutive traces:
+
+    * All of the key/text pairs are generated before capturing starts.
+    * The key is only sent to the target when it changes.
+    * If the scope supports it (capture_raw()/decode_raw(), such as OpenADC
+      scopes), the ADC data is converted to a trace in a background thread
+      while the next trace is captured.
+    * Traces are added to the project in the same background thread.
+
+    Captures that time out are skipped, like when capture_trace() returns None.
+
+    Args:
+        scope (ScopeTemplate): Scope object to use for capture.
+        target (TargetTemplate): Target object to read/write text from.
+        ktp (AcqKeyTextPattern): Key/text pattern to get the keys and
+            plaintexts from (ktp.next_batch(), or ktp.next() if it has none).
+        n (int): Number of traces to capture.
+        project (Project, optional): Project to add the traces to. If None,
+            they are returned in CaptureResults.traces.
+        ack (bool, optional): Check for ack when reading response from target.
+        timeout (float, optional): Time in seconds to wait for the target to
+            finish each operation.
+        queue_depth (int, optional): Maximum number of captured traces waiting
+            to be decoded/stored.
+
+    Returns:
+        :class:`CaptureResults` with the traces (unless project was given)
+        and the time spent in each stage.
+
+    Example::
+
+        import chipwhisperer as cw
+        ktp = cw.ktp.Basic()
+        results = cw.capture_traces(scope, target, ktp, 5000, project=project)
+        print(results)
+    """
+    results = CaptureResults()
+    start = time.perf_counter()
+
+    with results.timing('prepare'):
+        if hasattr(ktp, 'next_batch'):
+            keys, texts = ktp.next_batch(n)
+            pairs = [(bytearray(key), bytearray(text)) for key, text in zip(keys, texts)]
+        else:
+            # Copied, since patterns may reuse the same bytearray for every pair
+            pairs = [tuple(None if v is None else bytearray(v) for v in ktp.next()) for i in range(n)]
+
+    raw_capture = hasattr(scope, 'capture_raw') and hasattr(scope, 'decode_raw')
+    pending = queue.Queue(maxsize=queue_depth)
+    errors = []
+
+    def process():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if errors:
+                continue
+            data, text, response, key = item
+            if data is None:
+                # Failed capture, counted here so only this thread changes results
+                results.failed += 1
+                continue
+            try:
+                with results.timing('decode'):
+                    wave = scope.decode_raw(data) if raw_capture else data
+                if wave is None or len(wave) < 1:
+                    results.failed += 1
+                    continue
+                trace = Trace(wave, text, response, key)
+                with results.timing('store'):
+                    if project is not None:
+                        project.traces.append(trace)
+                    else:
+                        results.traces.append(trace)
+                results.captured += 1
+            except Exception as e:
+                errors.append(e)
+
+    worker = threading.Thread(target=process, name="capture_traces")
+    worker.start()
+    lastkey = None
+    try:
+        for key, text in pairs:
+            if errors:
+                break
+            with DelayedKeyboardInterrupt():
+                if key and key != lastkey:
+                    with results.timing('key'):
+                        target.set_key(key, ack=ack)
+                    lastkey = key
+
+                with results.timing('arm'):
+                    scope.arm()
+
+                if text:
+                    with results.timing('write'):
+                        target.simpleserial_write('p', text)
+
+                with results.timing('capture'):
+                    if raw_capture:
+                        ret, data = scope.capture_raw()
+                    else:
+                        ret = scope.capture()
+
+                with results.timing('wait'):
+                    stats = cw.target_wait.wait(target.is_done, timeout, "target")
+                # data None marks a failed capture for process()
+                response = None
+                if stats.timed_out:
+                    warnings.warn("Target did not finish operation")
+                    data = None
+                elif ret:
+                    warnings.warn("Timeout happened during capture")
+                    data = None
+                else:
+                    with results.timing('read'):
+                        response = target.simpleserial_read('r', target.output_len, ack=ack)
+                        if not raw_capture:
+                            data = scope.get_last_trace()
+
+            pending.put((data, text, response, key))
+    finally:
+        pending.put(None)
+        worker.join()
+        results.elapsed = time.perf_counter() - start
+
+    if errors:
+        raise errors[0]
+    logging.debug("capture_traces: %d traces in %.3f s" % (results.captured, results.elapsed))
+    return results
@@ -33,6 +33,7 @@ from .base import ScopeTemplate
 from .openadc_interface.naeusbchip import OpenADCInterface_NAEUSBChip
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.utils.util import dict_to_str, DelayedKeyboardInterrupt
+from chipwhisperer.common.traces import RawWave
 from collections import OrderedDict
 import time
 
@@ -94,6 +95,32 @@ class OpenADC(ScopeTemplate, util.DisableNewAttr):
 
         self.scopetype = OpenADCInterface_NAEUSBChip(self.qtadc)
 
+        #: How capture() polls for the trigger, see :class:`PollWait <chipwhisperer.common.utils.util.PollWait>`
+        self.capture_wait = util.PollWait()
+        self._int_samples = False
+        self._capture_margin = (0.21, 0.001)
+
+    @property
+    def int_samples(self):
+        """Keep traces as the 10-bit ADC codes instead of converting them to floats.
+
+        If True, get_last_trace() returns a :class:`RawWave <chipwhisperer.common.traces.RawWave>`
+        of uint16 codes, which projects store as they are (2 bytes per sample
+        instead of 8), converting them to the usual values (code/1024 - 0.5)
+        when the traces are read.
+
+        :Getter: Return whether integer samples are kept (bool)
+
+        :Setter: Set whether to keep integer samples
+        """
+        return self._int_samples
+
+    @int_samples.setter
+    def int_samples(self, enable):
+        self._int_samples = bool(enable)
+        if self.qtadc.sc is not None:
+            self.qtadc.sc.raw_samples = self._int_samples
+
     @property
     def latest_fw(self):
         cw_type = self._getCWType()
@@ -224,6 +251,9 @@ class OpenADC(ScopeTemplate, util.DisableNewAttr):
             if hasattr(self.scopetype, "ser") and hasattr(self.scopetype.ser, "_usbdev"):
                 self.qtadc.sc.usbcon = self.scopetype.ser._usbdev
             #self.qtadc.sc.usbcon = self.scopetype.ser._usbdev
+            self.qtadc.sc.capture_wait = self.capture_wait
+            self.qtadc.sc.capture_margin, self.qtadc.sc.capture_margin_time = self._capture_margin
+            self.qtadc.sc.raw_samples = self._int_samples
 
             cwtype = self._getCWType()
             if cwtype != "":
@@ -326,16 +356,107 @@ class OpenADC(ScopeTemplate, util.DisableNewAttr):
             else:
                 return self.qtadc.capture(None)
 
-    def get_last_trace(self):
+    def get_last_trace(self, as_int=None):
         """Return the last trace captured with this scope.
 
+        Args:
+            as_int (bool, optional): If True, return the 10-bit ADC codes
+                (uint16, 0 to 1023, as a :class:`RawWave <chipwhisperer.common.traces.RawWave>`)
+                instead of the scaled samples. Defaults to int_samples.
+
         Returns:
            Numpy array of the last capture trace.
         """
-        return self.qtadc.datapoints
+        if as_int is None:
+            as_int = self._int_samples
+        datapoints = self.qtadc.datapoints
+        if as_int != self._int_samples:
+            # Stored decoded as int_samples says, decode the last data again
+            datapoints = self.qtadc.sc.decodeLastData(len(datapoints), raw=as_int)
+        return self._wave(datapoints, as_int)
+
+    def _wave(self, datapoints, as_int):
+        """Return datapoints decoded with raw=as_int as a trace"""
+        if as_int:
+            return RawWave(datapoints, 1 / 1024.0, -self.qtadc.sc.offset)
+        return datapoints
 
     getLastTrace = util.camel_case_deprecated(get_last_trace)
 
+    @property
+    def wait_stats(self):
+        """Statistics of the waits during the last capture (list of :class:`WaitStats <chipwhisperer.common.utils.util.WaitStats>`).
+
+        Includes waiting for the trigger and for the samples to be taken.
+        :func:`capture_trace <chipwhisperer.capture_trace>` adds the wait for
+        the target to finish.
+        """
+        return self.qtadc.sc.wait_stats
+
+    @property
+    def capture_margin(self):
+        """Extra wait before stopping the ADC after a capture, as (fraction, seconds).
+
+        capture() waits for the samples after the trigger to be taken (from
+        the number of samples, decimation and the ADC clock), then for
+        fraction of that time more plus seconds, so USB latency or a small
+        error in the measured ADC clock doesn't lose the last samples.
+        :Getter: Return the margin (fraction, seconds). Default (0.21, 0.001).
+
+        :Setter: Set the margin
+        """
+        return self._capture_margin
+
+    @capture_margin.setter
+    def capture_margin(self, margin):
+        fraction, seconds = margin
+        if fraction < 0 or seconds < 0:
+            raise ValueError("Capture margin can't be negative: {}".format(margin))
+        self._capture_margin = (fraction, seconds)
+        if self.qtadc.sc is not None:
+            self.qtadc.sc.capture_margin, self.qtadc.sc.capture_margin_time = self._capture_margin
+
+    def capture_raw(self):
+        """Captures trace like capture(), but doesn't convert the ADC data.
+
+        The data is read from the scope here. Converting it with decode_raw()
+        can be done later (or in another thread, see
+        :func:`capture_traces <chipwhisperer.capture_traces>`), while the
+        next trace is captured.
+
+        Returns:
+           (timeout, raw): timeout is True if capture timed out, raw is
+           passed to decode_raw().
+        """
+        with DelayedKeyboardInterrupt():
+            samples = self.adc.samples
+            if not self.adc.stream_mode:
+                timeout = self.qtadc.sc.capture(self.adc.offset, self.clock.adc_freq, samples)
+            else:
+                timeout = self.qtadc.sc.capture(None)
+            return timeout, (self.qtadc.sc.readRawData(samples), samples)
+
+    def decode_raw(self, raw, as_int=None):
+        """Convert data from capture_raw() into a trace.
+
+        Args:
+            as_int (bool, optional): If True, return the ADC codes, see get_last_trace().
+
+        Returns:
+           Numpy array of the trace, or None if fewer points than expected
+           were received.
+        """
+        if as_int is None:
+            as_int = self._int_samples
+        data, samples = raw
+        datapoints = self.qtadc.sc.decodeData(data, samples, raw=as_int)
+        if len(datapoints) != samples:
+            logging.error("Received fewer points than expected! {} vs {}".format(len(datapoints), samples))
+            return None
+        if as_int == self._int_samples:
+            self.qtadc.datapoints = datapoints
+        return self._wave(datapoints, as_int)
+
     def _dict_repr(self):
         dict = OrderedDict()
         dict['sn'] = self.sn
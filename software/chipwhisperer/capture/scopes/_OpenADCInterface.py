@@ -14,7 +14,6 @@ from chipwhisperer.common.utils import util
 import array
 import numpy as np
 from collections import OrderedDict
-import copy
 
 ADDR_GAIN       = 0
 ADDR_SETTINGS   = 1
@@ -1502,6 +1501,23 @@ class OpenADCInterface(object):
         self.presampleTempMargin = 24
         self._stream_mode = False
         self._support_get_duration = True
+        self._decimate = 1
+        self.capture_wait = util.PollWait()
+        self.wait_stats = []
+        # Extra wait after the samples should have been taken, for USB
+        # latency and ADC clock error: a fraction of the capture time plus
+        # a fixed time in seconds
+        self.capture_margin = 0.21
+        self.capture_margin_time = 0.001
+        #: dtype of the samples returned by processData()
+        self.sample_dtype = np.float64
+        #: processData() returns the ADC codes by default
+        self.raw_samples = False
+        self._lastraw = None
+        # Reused by processData(), grown as needed
+        self._words = np.zeros(0, dtype=np.uint32)
+        self._shifted = np.zeros(0, dtype=np.uint32)
+        self._codes = np.zeros(0, dtype=np.uint16)
 
         # Send clearing function if using streaming mode
         if hasattr(self.serial, "stream") and self.serial.stream == False:
@@ -1732,6 +1748,7 @@ class OpenADCInterface(object):
         cmd = bytearray(2)
         if decsamples <= 0:
             raise ValueError("Decsamples is <= 0 (%d), makes no sense" % decsamples)
+        self._decimate = decsamples
         decsamples -= 1
         cmd[0] = ((decsamples >> 0) & 0xFF)
         cmd[1] = ((decsamples >> 8) & 0xFF)
@@ -1752,6 +1769,7 @@ class OpenADCInterface(object):
                 decnum = 1
         else:
             decnum = 1
+        self._decimate = decnum
         return decnum
 
     def numSamples(self):
@@ -1851,29 +1869,34 @@ class OpenADCInterface(object):
             # Stream mode adds 500mS of extra timeout on USB traffic itself...
             self.serial.initStreamModeCapture(self._stream_len, self._sbuf, timeout_ms=int(self._timeout * 1000) + 500)
 
-    def capture(self, offset=None, adc_freq=29.53E6, samples=24400):
-        timeout = False
-        sleeptime = 0
-        if offset:
-            sleeptime = (29.53E6*8*offset)/(100000*adc_freq) #rougly 8ms per 100k offset
-            sleeptime /= 1000
+    def _triggered(self):
+        """True once the trigger has happened and data is in the FIFO"""
+        status = self.getStatus()
+        return not (((status & STATUS_ARM_MASK) == STATUS_ARM_MASK) | ((status & STATUS_FIFO_MASK) == 0))
 
-        if self._streammode:
+    def capture(self, offset=None, adc_freq=29.53E6, samples=24400):
+        """Wait for the trigger and for the capture to finish.
 
-            # Wait for a trigger, letting the UI run when it can
-            starttime = datetime.datetime.now()
-            while self.serial.cmdReadStream_isDone() == False:
-                # Wait for a moment before re-running the loop
-                #time.sleep(0.05)
-                diff = datetime.datetime.now() - starttime
+        Polls the status with self.capture_wait until the trigger happens,
+        then waits until all of the samples should have been taken, computed
+        from offset, samples, presamples, decimation and adc_freq, plus
+        self.capture_margin of that time and self.capture_margin_time
+        seconds. Statistics of both waits are stored in self.wait_stats.
 
-                # If we've timed out, don't wait any longer for a trigger
-                if (diff.total_seconds() > self._timeout):
-                    logging.warning('Timeout in OpenADC capture(), trigger FORCED')
-                    timeout = True
-                    self.triggerNow()
-                    break
+        Returns:
+            True if capture timed out, false if it didn't.
+        """
+        timeout = False
+        self.wait_stats = []
 
+        if self._streammode:
+            # Wait for a trigger
+            stats = self.capture_wait.wait(self.serial.cmdReadStream_isDone, self._timeout, "stream")
+            self.wait_stats.append(stats)
+            if stats.timed_out:
+                logging.warning('Timeout in OpenADC capture(), trigger FORCED')
+                timeout = True
+                self.triggerNow()
 
             self._stream_rx_bytes, stream_timeout = self.serial.cmdReadStream()
             timeout |= stream_timeout
@@ -1888,53 +1911,33 @@ class OpenADCInterface(object):
                 else:
                     logging.warning("Streaming mode OVERFLOW occured during capture - ADC sample clock probably too fast for stream mode (keep ADC Freq < 10 MHz)")
                 timeout = True
-        else:
-            status = self.getStatus()
-            starttime = datetime.datetime.now()
-
-            # Wait for a trigger, letting the UI run when it can
-            while ((status & STATUS_ARM_MASK) == STATUS_ARM_MASK) | ((status & STATUS_FIFO_MASK) == 0):
-                status = self.getStatus()
-
-                # Wait for a moment before re-running the loop
-                #time.sleep(sleeptime) ## <-- This causes the capture slowdown
-                #util.better_delay(sleeptime) ## faster sleep method
-                diff = datetime.datetime.now() - starttime
-
-                # If we've timed out, don't wait any longer for a trigger
-                if (diff.total_seconds() > self._timeout):
-                    logging.warning('Timeout in OpenADC capture(), trigger FORCED')
-                    timeout = True
-                    self.triggerNow()
-
-                # Give the UI a chance to update (does nothing if not using UI)
-
-            #time.sleep(0.005)
-            #time.sleep(sleeptime*10)
-
-            # If using large offsets, system doesn't know we are delaying api
-
-            # NOTE: This doesn't actually delay until adc starts reading
-            # so need to actually do the manual delay
-            #nosampletimeout = self._nosampletimeout * 10
-            #while (self.getBytesInFifo() == 0) and nosampletimeout:
-            #    logging.debug("Bytes in Fifo: {}".format(self.getBytesInFifo()))
-            #    time.sleep(0.001)
-            #    nosampletimeout -= 1
-
-            #if nosampletimeout == 0:
-            #    logging.warning('No samples received. Either very long offset, or no ADC clock (try "Reset ADC DCM"). '
-            #                    'If you need such a long offset, increase "scope.qtadc.sc._nosampletimeout" limit.')
-            #    timeout = True
-
-        # give time for ADC to finish reading data
-        # may need to adjust delay
-        cap_delay = (7.37E6 * 4 * samples) / (adc_freq * 24400)
-        cap_delay *= 0.001
-        time.sleep(cap_delay+sleeptime)
-        # 0.000819672131147541
-        # 
-        #time.sleep(sleeptime) #need to do this one as well
+
+            # All of the data has been streamed out already
+            return timeout
+
+        # Wait for a trigger
+        stats = self.capture_wait.wait(self._triggered, self._timeout, "trigger")
+        self.wait_stats.append(stats)
+        if stats.timed_out:
+            logging.warning('Timeout in OpenADC capture(), trigger FORCED')
+            timeout = True
+            self.triggerNow()
+            self.wait_stats.append(self.capture_wait.wait(self._triggered, self._timeout, "forced trigger"))
+        triggered = time.perf_counter()
+
+        # Samples only reach the FIFO once the offset has passed (the status
+        # doesn't show it), and any presamples are already in it: wait for
+        # the offset and the rest of the samples to be clocked in,
+        # then stop the ADC. The margin keeps USB latency or a slower ADC
+        # clock than measured from cutting off the last samples
+        remaining = ((offset or 0) + max(samples - self.presamples_desired, 0)) * self._decimate
+        duration = remaining / float(adc_freq or 29.53E6)
+        duration = duration * (1 + self.capture_margin) + self.capture_margin_time
+        stats = util.WaitStats("samples", duration)
+        self.capture_wait.sleep_until(triggered + duration, stats)
+        stats.elapsed = time.perf_counter() - triggered
+        self.wait_stats.append(stats)
+
         self.arm(False) # <------ ADC will stop reading after this
         return timeout
 
@@ -1943,44 +1946,39 @@ class OpenADCInterface(object):
         self.sendMessage(CODE_READ, ADDR_ADCDATA, None, False, None)
 
     def readData(self, NumberPoints=None, progressDialog=None):
+        return self.decodeData(self.readRawData(NumberPoints, progressDialog), NumberPoints)
+
+    def readRawData(self, NumberPoints=None, progressDialog=None):
+        """Read the ADC data bytes of the last capture, without converting them.
+
+        Returns:
+            uint8 array starting with the 0xAC sync byte, for decodeData(), or None
+        """
         logging.debug("Reading data fromm OpenADC...")
         if self._streammode:
             # Process data
             bsize = self.serial.cmdReadStream_size_of_fpgablock()
             num_bytes, num_samples = self.serial.cmdReadStream_bufferSize(self._stream_len)
 
-            # Remove sync bytes from trace
+            # Remove sync bytes from trace: each block of bsize bytes starts with one
+            sbuf = np.frombuffer(self._sbuf, dtype=np.uint8)
+            nblocks = min(-(-self._stream_rx_bytes // bsize), len(sbuf) // bsize)
+            blocks = sbuf[:nblocks * bsize].reshape(nblocks, bsize)
+            badsync = np.flatnonzero(blocks[:, 0] != 0xAC)
+            if len(badsync):
+                i = badsync[0] * bsize
+                logging.warning("Stream mode: Expected sync byte (AC) at location %d but got %x" % (i, sbuf[i]))
+                nblocks = badsync[0]
+
             data = np.zeros(num_bytes, dtype=np.uint8)
-            data[0] = self._sbuf[0]
-            dbuf2_idx = 1
-            for i in range(0, self._stream_rx_bytes, bsize):
-                if self._sbuf[i] != 0xAC:
-                    logging.warning("Stream mode: Expected sync byte (AC) at location %d but got %x" % (i, self._sbuf[i]))
-                    break
-                s = i + 1
-                data[dbuf2_idx: (dbuf2_idx + (bsize - 1))] = self._sbuf[s:(s + (bsize - 1))]
-
-                # Write to next section
-                dbuf2_idx += (bsize - 1)
+            data[0] = sbuf[0]
+            data[1:1 + nblocks * (bsize - 1)] = blocks[:nblocks, 1:].reshape(-1)
 
             logging.debug("Stream mode: read %d bytes"%len(data))
-
-            # Turn raw bytes into samples
-            datapoints = self.processData(data, 0.0)
-
-            if datapoints is not None and len(datapoints):
-                logging.debug("Stream mode: done, %d samples processed"%len(datapoints))
-            else:
-                logging.warning("Stream mode: done, no samples resulted from processing")
-                datapoints = []
-
-            if len(datapoints) > NumberPoints:
-                datapoints = datapoints[0:NumberPoints]
-
-            return datapoints
+            return data
 
         else:
-            datapoints = []
+            raw = None
 
             if NumberPoints == None:
                 NumberPoints = 0x1000
@@ -2049,8 +2047,7 @@ class OpenADCInterface(object):
                 #       print "%x "%p,
 
                 if data is not None:
-                    data = np.array(data)
-                    datapoints = self.processData(data, 0.0)
+                    raw = np.array(data)
 
                 if progressDialog:
                     progressDialog.setValue(status)
@@ -2058,36 +2055,94 @@ class OpenADCInterface(object):
                     if progressDialog.wasCanceled():
                         break
 
-            # for point in datapoints:
-            #       print "%3x"%(int((point+0.5)*1024))
+            return raw
+
+    def decodeData(self, data, NumberPoints=None, raw=None):
+        """Convert ADC data bytes from readRawData() into samples.
+
+        If raw, the samples are the ADC codes (uint16, 0 to 1023) instead of
+        floats, see processData().
+        """
+        self._lastraw = data
+        if self._streammode:
+            # Turn raw bytes into samples
+            datapoints = self.processData(data, 0.0, NumberPoints=NumberPoints, raw=raw)
+
+            if datapoints is not None and len(datapoints):
+                logging.debug("Stream mode: done, %d samples processed"%len(datapoints))
+            else:
+                logging.warning("Stream mode: done, no samples resulted from processing")
+                datapoints = []
+
+            return datapoints
+
+        else:
+            if NumberPoints == None:
+                NumberPoints = 0x1000
+
+            datapoints = []
+            if data is not None:
+                datapoints = self.processData(data, 0.0, NumberPoints=NumberPoints, raw=raw)
 
             if datapoints is None:
                 return []
-            if len(datapoints) > NumberPoints:
-                datapoints = datapoints[0:NumberPoints]
-
-            # if len(datapoints) < NumberPoints:
-            # print len(datapoints),
-            # print NumberPoints
 
             return datapoints
 
-    def processData(self, data, pad=float('NaN'), debug=False):
+    def decodeLastData(self, NumberPoints=None, raw=None):
+        """Decode the data last passed to decodeData() again, e.g. to get the raw ADC codes"""
+        if self._lastraw is None:
+            return []
+        return self.decodeData(self._lastraw, NumberPoints, raw)
+
+    def _buffer(self, name, size):
+        """Return the first size elements of the reusable buffer called name, growing it if needed"""
+        buf = getattr(self, name)
+        if len(buf) < size:
+            buf = np.zeros(size, dtype=buf.dtype)
+            setattr(self, name, buf)
+        return buf[:size]
+
+    def processData(self, data, pad=float('NaN'), debug=False, NumberPoints=None, raw=None):
+        """Convert ADC data bytes into samples.
+
+        The data is a 0xAC sync byte followed by big-endian 32-bit words,
+        each holding three 10-bit samples (first sample in the lowest bits).
+        The top two bits of a word are 3 before the trigger, and give the
+        position of the trigger within the word once it has happened.
+
+        The samples are aligned so that the trigger is at presamples_desired,
+        padding the start with pad if fewer samples were captured before it.
+
+        Args:
+            data: ADC data bytes (e.g. from readRawData())
+            pad: Value for missing pre-trigger samples (0 if raw)
+            debug: Use the slow, verbose conversion
+            NumberPoints (int, optional): Return at most this many samples
+            raw (bool, optional): Return the ADC codes as uint16 instead of
+                code/1024 - offset as sample_dtype. Defaults to raw_samples.
+
+        Returns:
+            Array of samples (a new array each call), or None if the sync
+            byte is wrong
+        """
         if data[0] != 0xAC:
             logging.warning('Unexpected sync byte in processData(): 0x%x' % data[0])
             #print(data)
             return None
 
-        orig_data = copy.copy(data)
+        if raw is None:
+            raw = self.raw_samples
+
+        trigfound = False
+        trigsamp = 0
         if debug:
-            fpData = []
+            codes = []
             # Slow, verbose processing method
             # Useful for fixing issues in ADC read
             for i in range(1, len(data) - 3, 4):
                 # Convert
-                temppt = (data[i + 3] << 0) | (data[i + 2] << 8) | (data[i + 1] << 16) | (data[i + 0] << 24)
-
-                # print("%2x "%data[i])
+                temppt = (int(data[i + 3]) << 0) | (int(data[i + 2]) << 8) | (int(data[i + 1]) << 16) | (int(data[i + 0]) << 24)
 
                 # print "%x %x %x %x"%(data[i +0], data[i +1], data[i +2], data[i +3]);
                 # print "%x"%temppt
@@ -2113,64 +2168,66 @@ class OpenADCInterface(object):
                 ##    print "intpt: %x lstpt %x\n"%(intpt, lastpt)
                 ##lastpt = intpt;
 
-                # print "%x %x %x"%(intpt1, intpt2, intpt3)
-
-                fpData.append(float(intpt1) / 1024.0 - self.offset)
-                fpData.append(float(intpt2) / 1024.0 - self.offset)
-                fpData.append(float(intpt3) / 1024.0 - self.offset)
+                codes += [intpt1, intpt2, intpt3]
+            codes = np.array(codes, dtype=np.uint16)
         else:
             # Fast, efficient NumPy implementation
 
-            # Figure out how many bytes we're going to process
             # Cut off some bytes at the end: we need the length to be a multiple of 4, and we probably have extra data
-            numbytes = len(data) - 1
-            extralen = (len(data) - 1) % 4
-
-            # Copy the data into a NumPy array. For long traces this is the longest part
-            data = data[1:1+numbytes-extralen]
-
-            # Split data into groups of 4 bytes and combine into words
-            data = np.reshape(data, (-1, 4))
-            data = np.left_shift(data, [24, 16, 8, 0])
-            data = np.sum(data, 1)
-
-            # Split words into samples and trigger bytes
-            data = np.right_shift(np.reshape(data, (-1, 1)), [0, 10, 20, 30]) & 0x3FF
-            fpData = np.reshape(data[:, [0, 1, 2]], (-1))
-            trigger = data[:, 3] % 4
-            fpData = fpData / 1024.0 - self.offset
-            logging.debug("Trigger_data: {} len={}".format(trigger, len(trigger)))
-
-            # Search for the trigger signal
-            trigfound = False
-            trigsamp = 0
-            for t in trigger:
-                if(t != 3):
-                    trigfound = True
-                    trigsamp = trigsamp + (t & 0x3)
-                    logging.debug("Trigger found at %d"%trigsamp)
-                    break
-                else:
-                    trigsamp += 3
-
-        #print len(fpData)
+            data = np.ascontiguousarray(data, dtype=np.uint8)
+            nwords = (len(data) - 1) // 4
+
+            # View the bytes after the sync byte as big-endian words, and byteswap them once
+            words = self._buffer('_words', nwords)
+            words[:] = np.frombuffer(data, dtype='>u4', count=nwords, offset=1)
+
+            # Split words into samples, straight into the (interleaved) output
+            shifted = self._buffer('_shifted', nwords)
+            codes = self._buffer('_codes', nwords * 3)
+            np.bitwise_and(words, 0x3FF, out=codes[0::3], casting='unsafe')
+            np.right_shift(words, 10, out=shifted)
+            np.bitwise_and(shifted, 0x3FF, out=codes[1::3], casting='unsafe')
+            np.right_shift(words, 20, out=shifted)
+            np.bitwise_and(shifted, 0x3FF, out=codes[2::3], casting='unsafe')
+
+            # Search for the trigger signal: the first word not marked as pre-trigger
+            np.right_shift(words, 30, out=shifted)
+            trigword = int(np.argmax(shifted != 3)) if nwords else 0
+            if nwords and shifted[trigword] != 3:
+                trigfound = True
+                trigsamp = trigword * 3 + int(shifted[trigword])
+                logging.debug("Trigger found at %d"%trigsamp)
+            else:
+                trigsamp = nwords * 3
 
         if trigfound == False:
             logging.warning('Trigger not found in ADC data. No data reported!')
             logging.debug('Trigger not found typically caused by the actual \
             capture starting too late after the trigger event happens')
-            logging.debug('Data: {}'.format(orig_data))
-
+            logging.debug('Data: {}'.format(data))
 
         #Ensure that the trigger point matches the requested by padding/chopping
         diff = self.presamples_desired - trigsamp
         if diff > 0:
-               #fpData = [pad]*diff + fpData
-               fpData = np.append([pad]*diff, fpData)
-               logging.warning('Pretrigger not met: Do not use downsampling and pretriggering at same time.')
-               logging.debug('Pretrigger not met: can attempt to increase presampleTempMargin(in the code).')
+            logging.warning('Pretrigger not met: Do not use downsampling and pretriggering at same time.')
+            logging.debug('Pretrigger not met: can attempt to increase presampleTempMargin(in the code).')
+        npad = max(diff, 0)
+        codes = codes[max(-diff, 0):]
+        total = npad + len(codes)
+        if NumberPoints is not None:
+            total = min(total, NumberPoints)
+        codes = codes[:max(total - npad, 0)]
+
+        # Only the output is allocated, the intermediate buffers are reused
+        if raw:
+            fpData = np.empty(total, dtype=np.uint16)
+            fpData[:npad] = 0
+            fpData[npad:] = codes
         else:
-               fpData = fpData[-diff:]
+            fpData = np.empty(total, dtype=self.sample_dtype)
+            fpData[:npad] = pad
+            np.multiply(codes, 1 / 1024.0, out=fpData[npad:])
+            fpData[npad:] -= self.offset
 
         logging.debug("Processed data, ended up with %d samples total"%len(fpData))
 
@@ -32,6 +32,7 @@ from .base import ScopeTemplate
 from chipwhisperer.capture.scopes.openadc_interface.naeusbchip import OpenADCInterface_NAEUSBChip
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.utils.util import dict_to_str
+from chipwhisperer.common.traces import RawWave
 from collections import OrderedDict
 
 from chipwhisperer.hardware.naeusb.serial import USART
@@ -559,7 +560,16 @@ class CWNano(ScopeTemplate, util.DisableNewAttr):
         self.glitch = GlitchSettings(self._cwusb)
         self._timeout = 2
 
+        #: How capture() polls for the capture to finish, see :class:`PollWait <chipwhisperer.common.utils.util.PollWait>`
+        self.capture_wait = util.PollWait()
+        #: Statistics of the waits during the last capture
+        self.wait_stats = []
+
         self._lasttrace = None
+        self._lastcodes = None
+
+        #: Keep traces as the 8-bit ADC codes, see :attr:`OpenADC.int_samples <chipwhisperer.capture.scopes.OpenADC.OpenADC.int_samples>`
+        self.int_samples = False
 
         self.disable_newattr()
 
@@ -639,43 +649,56 @@ class CWNano(ScopeTemplate, util.DisableNewAttr):
             self._cwusb.sendCtrl(self.REQ_ARM, 1)
 
 
+    def _capture_done(self):
+        return self._cwusb.readCtrl(self.REQ_ARM, dlen=1)[0] != 0
+
     def capture(self):
         """Raises IOError if unknown failure, returns 'True' if timeout, 'False' if no timeout"""
 
         with DelayedKeyboardInterrupt():
-            starttime = datetime.datetime.now()
-            while self._cwusb.readCtrl(self.REQ_ARM, dlen=1)[0] == 0:
-                # Wait for a moment before re-running the loop
-                time.sleep(0.001)
-                diff = datetime.datetime.now() - starttime
-
-                # If we've timed out, don't wait any longer for a trigger
-                if (diff.total_seconds() > self._timeout):
-                    logging.warning('Timeout in cwnano capture()')
-                    return True
+            stats = self.capture_wait.wait(self._capture_done, self._timeout, "capture")
+            self.wait_stats = [stats]
+            if stats.timed_out:
+                logging.warning('Timeout in cwnano capture()')
+                return True
 
-            self._lasttrace = self._cwusb.cmdReadMem(0, self.adc.samples)
+            data = self._cwusb.cmdReadMem(0, self.adc.samples)
 
             # can just keep rerunning this until it works I think
             i = 0
-            while len(self._lasttrace) < self.adc.samples:
+            while len(data) < self.adc.samples:
                 logging.debug("couldn't read ADC data from Nano, retrying...")
 
-                self._lasttrace = self._cwusb.cmdReadMem(0, self.adc.samples)
+                data = self._cwusb.cmdReadMem(0, self.adc.samples)
                 i+= 1
                 if i > 20:
                     logging.warning("Couldn't read trace data back from Nano")
                     return True
-            self._lasttrace = np.array(self._lasttrace) / 256.0 - 0.5
+            self._lastcodes = np.array(data, dtype=np.uint8)
+            self._lasttrace = None
 
             #self.newDataReceived(0, self._lasttrace, 0, self.adc.clk_freq)
 
             return False
 
 
-    def get_last_trace(self):
+    def get_last_trace(self, as_int=None):
         """Return the last trace captured with this scope.
+
+        Args:
+            as_int (bool, optional): If True, return the ADC codes (uint8,
+                as a :class:`RawWave <chipwhisperer.common.traces.RawWave>`)
+                instead of code/256 - 0.5. Defaults to int_samples.
         """
+        if as_int is None:
+            as_int = self.int_samples
+        if self._lastcodes is None:
+            return None
+        if as_int:
+            return RawWave(self._lastcodes, 1 / 256.0, -0.5)
+        if self._lasttrace is None:
+            # Converted when first needed
+            self._lasttrace = self._lastcodes / 256.0 - 0.5
         return self._lasttrace
 
     getLastTrace = camel_case_deprecated(get_last_trace)
@@ -62,6 +62,8 @@ class SimpleSerial(TargetTemplate, util.DisableNewAttr):
       * :meth:`target.simpleserial_write <.SimpleSerial.simpleserial_write>`
       * :meth:`target.simpleserial_read <.SimpleSerial.simpleserial_read>`
       * :meth:`target.simpleserial_read_witherrors <.SimpleSerial.simpleserial_read_witherrors>`
+      * :meth:`target.simpleserial_read_many <.SimpleSerial.simpleserial_read_many>`
+      * :meth:`target.simpleserial_set_binary <.SimpleSerial.simpleserial_set_binary>`
       * :meth:`target.set_key <.SimpleSerial.set_key>`
       * :meth:`target.close <.SimpleSerial.close>`
       * :meth:`target.con <.SimpleSerial.con>`
@@ -106,6 +108,7 @@ class SimpleSerial(TargetTemplate, util.DisableNewAttr):
         dict['baud']     = self.baud
         dict['simpleserial_last_read'] = self.simpleserial_last_read
         dict['simpleserial_last_sent'] = self.simpleserial_last_sent
+        dict['protformat'] = self.protformat
         #dict['protver'] = self.protver
         return dict
 
@@ -175,9 +178,10 @@ class SimpleSerial(TargetTemplate, util.DisableNewAttr):
         if not scope or not hasattr(scope, "qtadc"): Warning("You need a scope with OpenADC connected to use this Target")
 
         self.ser.con(scope)
-        # 'x' flushes everything & sets system back to idle
+        # 'x' flushes everything & sets system back to idle (and to hex-ASCII payloads)
         self.ser.write("xxxxxxxxxxxxxxxxxxxxxxxx")
         self.ser.flush()
+        self.protformat = 'hex'
 
 
     def close(self):
@@ -266,13 +270,21 @@ class SimpleSerial(TargetTemplate, util.DisableNewAttr):
             Defined return value
         """
 
-        data = self.read(4, timeout = timeout)
-        if len(data) < 4:
+        data = self.read(self._ack_len(), timeout = timeout)
+        return self._decode_ack(data)
+
+    def _ack_len(self):
+        return 3 if self.protformat == 'bin' else 4
+
+    def _decode_ack(self, data):
+        if len(data) < self._ack_len():
             logging.error("Target did not ack")
             return None
         if data[0] != 'z':
             logging.error("Ack error: {}".format(data))
             return None
+        if self.protformat == 'bin':
+            return ord(data[1])
         ret = None
         try:
             ret = int(data[1:3], 16)
@@ -284,7 +296,8 @@ class SimpleSerial(TargetTemplate, util.DisableNewAttr):
     def simpleserial_write(self, cmd, num, end='\n'):
         """ Writes a simpleserial command to the target over serial.
 
-        Writes 'cmd' + ascii(num) + 'end' over serial. Flushes the read and
+        Writes 'cmd' + ascii(num) + 'end' over serial (or 'cmd' + num +
+        'end' after :meth:`simpleserial_set_binary`). Flushes the read and
         write buffers before writing.
 
         Args:
@@ -310,7 +323,10 @@ class SimpleSerial(TargetTemplate, util.DisableNewAttr):
         """
         self.ser.flush()
         if cmd:
-            cmd += binascii.hexlify(num).decode()
+            if self.protformat == 'bin':
+                cmd += bytes(num).decode('latin-1')
+            else:
+                cmd += binascii.hexlify(num).decode()
         cmd += end
         self.write(cmd)
         self._simpleserial_last_sent = cmd
@@ -352,38 +368,142 @@ class SimpleSerial(TargetTemplate, util.DisableNewAttr):
         .. versionadded:: 5.1
             Added target.simpleserial_read()
         """
-        cmd_len = len(cmd)
-        ascii_len = pay_len * 2
-        recv_len = cmd_len + ascii_len + len(end)
+        recv_len = len(cmd) + self._payload_len(pay_len) + len(end)
         response = self.read(recv_len, timeout=timeout)
         self._simpleserial_last_read = response
 
+        payload = self._decode_response(response, cmd, pay_len, end)
+        if payload is None:
+            return None
+
+        if ack:
+            if self.simpleserial_wait_ack(timeout) is None:
+                raise Warning("Device failed to ack")
+
+        return payload
+
+    def _payload_len(self, pay_len):
+        """Number of characters pay_len bytes of payload are sent as"""
+        return pay_len if self.protformat == 'bin' else pay_len * 2
+
+    def _decode_payload(self, data, pay_len, strict=False):
+        """Return the pay_len bytes of payload in data, or None if strict and they can't be decoded"""
+        if self.protformat == 'bin':
+            payload = bytearray(data, 'latin-1')
+            if len(payload) == pay_len:
+                return payload
+            if strict:
+                return None
+            return payload + bytearray(pay_len - len(payload))
+
+        try:
+            payload = bytearray.fromhex(data)
+        except ValueError:
+            payload = None
+        # fromhex() skips whitespace, so also check the length
+        if payload is not None and len(payload) == pay_len and len(data) == pay_len * 2:
+            return payload
+        if strict:
+            return None
         payload = bytearray(pay_len)
+        for i in range(0, pay_len):
+            try:
+                payload[i] = int(data[2*i:2*i + 2], 16)
+            except ValueError as e:
+                logging.warning("ValueError: {}".format(e))
+        return payload
+
+    def _decode_response(self, response, cmd, pay_len, end):
+        cmd_len = len(cmd)
         if cmd_len > 0:
             if response[0:cmd_len] != cmd:
                 logging.warning("Unexpected start to command: {}".format(
                     response[0:cmd_len]
                 ))
                 return None
-        idx = cmd_len
-        for i in range(0, pay_len):
-            try:
-                payload[i] = int(response[idx:(idx + 2)], 16)
-            except ValueError as e:
-                logging.warning("ValueError: {}".format(e))
-            idx += 2
+        idx = cmd_len + self._payload_len(pay_len)
+        payload = self._decode_payload(response[cmd_len:idx], pay_len)
 
         if len(end) > 0:
             if response[(idx):(idx + len(end))] != end:
                 logging.warning("Unexpected end to command: {}".format(
                     response[(idx):(idx+len(end))]))
                 return None
+        return payload
 
-        if ack:
-            if self.simpleserial_wait_ack(timeout) is None:
-                raise Warning("Device failed to ack")
+    def simpleserial_read_many(self, cmd, pay_len, count, end='\n', timeout=250, ack=True):
+        r""" Reads count simpleserial responses from the target over serial.
 
-        return payload
+        Like calling :meth:`simpleserial_read` count times, but all the
+        responses (and acks) are read at once, so it takes as few USB
+        transfers as the responses allow. For firmware commands that send
+        several responses, or commands written with :meth:`write` without
+        waiting for their responses.
+
+        Args:
+            cmd (str): Expected start of each response.
+            pay_len (int): Expected length of each payload in bytes.
+            count (int): Number of responses to read.
+            end (str, optional): Expected end of each response. Defaults to '\n'
+            timeout (int, optional): Time to wait for each response in ms.
+                Defaults to 250.
+            ack (bool, optional): Expect an ack after each response. Defaults
+                to True.
+
+        Returns:
+            A list of count payloads (bytearrays). An entry is None if the
+            response didn't arrive, didn't decode or wasn't acked.
+        """
+        recv_len = len(cmd) + self._payload_len(pay_len) + len(end)
+        frame_len = recv_len + (self._ack_len() if ack else 0)
+        response = self.read(frame_len * count, timeout=timeout * count)
+        self._simpleserial_last_read = response
+
+        payloads = []
+        for i in range(count):
+            frame = response[i * frame_len:(i + 1) * frame_len]
+            if len(frame) < frame_len:
+                logging.warning("Only got {} of {} responses".format(i, count))
+                payloads.extend([None] * (count - i))
+                break
+            payload = self._decode_response(frame, cmd, pay_len, end)
+            if payload is not None and ack and self._decode_ack(frame[recv_len:]) is None:
+                payload = None
+            payloads.append(payload)
+        return payloads
+
+    def simpleserial_set_binary(self, enable=True, timeout=250):
+        """Sends simpleserial payloads as raw bytes instead of hex-ASCII.
+
+        Halves the number of bytes on the wire for simpleserial_write(),
+        simpleserial_read() and the other simpleserial_* methods, which
+        makes large payloads up to twice as fast. The target switches when
+        it gets a 'w01' command, which needs SimpleSerial v1.1 firmware built
+        with this version of simpleserial.c. Other targets don't ack the
+        command, and hex-ASCII is kept.
+
+        Resetting the target switches it back to hex-ASCII, so call this
+        again after a reset.
+
+        Args:
+            enable (bool, optional): Switch to raw bytes (True) or back to
+                hex-ASCII (False). Defaults to True.
+            timeout (int, optional): Time to wait for the target to ack in ms.
+                Defaults to 250.
+
+        Returns:
+            True if payloads are now sent as raw bytes (see protformat).
+        """
+        # 'w' is always sent and acked as hex-ASCII
+        self.protformat = 'hex'
+        self.ser.flush()
+        self.write('w0{}\n'.format(1 if enable else 0))
+        if self.read(4, timeout=timeout) == 'z00\n':
+            if enable:
+                self.protformat = 'bin'
+        elif enable:
+            logging.info("Target doesn't support binary payloads, using hex-ASCII")
+        return self.protformat == 'bin'
 
     def simpleserial_read_witherrors(self, cmd, pay_len, end="\n", timeout=250, glitch_timeout=8000, ack=True):
         r""" Reads a simpleserial command from the target over serial, but returns invalid responses.
@@ -439,8 +559,8 @@ class SimpleSerial(TargetTemplate, util.DisableNewAttr):
         """
 
         cmd_len = len(cmd)
-        ascii_len = pay_len * 2
-        recv_len = cmd_len + ascii_len + len(end)
+        wire_len = self._payload_len(pay_len)
+        recv_len = cmd_len + wire_len + len(end)
         response = self.read(recv_len, timeout=timeout)
 
         payload = bytearray(pay_len)
@@ -452,18 +572,9 @@ class SimpleSerial(TargetTemplate, util.DisableNewAttr):
             response += self.read(1000, timeout=glitch_timeout)
             payload = None
         else:
-            valid = True
-            idx = cmd_len
-            for i in range(0, pay_len):
-                try:
-                    payload[i] = int(response[idx:(idx + 2)], 16)
-                except ValueError as e:
-                    payload = None
-                    valid = False
-                    break
-                    #logging.warning("ValueError: {}".format(e))
-
-                idx += 2
+            idx = cmd_len + wire_len
+            payload = self._decode_payload(response[cmd_len:idx], pay_len, strict=True)
+            valid = payload is not None
 
             if valid and (len(end) > 0):
                 if response[(idx):(idx + len(end))] != end:
@@ -6,6 +6,33 @@ from chipwhisperer.common.utils import util
 from ._base import TargetTemplate
 from .simpleserial_readers.cwlite import SimpleSerial_ChipWhispererLite
 
+def _crc_table(poly):
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ poly) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+        table[i] = crc
+    return bytes(table)
+
+
+_CRC_TABLE = _crc_table(0xA6)
+
+
+def _stuff(buf, frame_byte=0x00):
+    """COBS buf in place: buf has a placeholder for the first offset and ends with the frame byte"""
+    last = 0
+    i = buf.find(frame_byte, 1)
+    while i != -1:
+        buf[last] = i - last
+        last = i
+        i = buf.find(frame_byte, i + 1)
+    return buf
+
+
 class SimpleSerial2_Err:
     OK = 0
     ERR_CMD = 1
@@ -102,60 +129,80 @@ class SimpleSerial2(TargetTemplate):
         """Calculate CRC (0xA6) for buf
         """
         crc = 0x00
-        try:
-            for b in buf:
-                crc ^= b
-                for _ in range(8):
-                    if crc & 0x80:
-                        crc = (crc << 1) ^ 0xA6
-                        crc &= 0xFF
-                    else:
-                        crc <<= 1
-                        crc &= 0xFF
-        except:
-            print(buf)
+        for b in buf:
+            crc = _CRC_TABLE[crc ^ b]
         return crc
 
-
     def _stuff_data(self, buf):
         """Apply COBS to buf
+
+        buf must start with a placeholder byte for the first offset and end
+        with the frame byte. Returns the stuffed frame as a bytearray.
         """
-        l = len(buf)
-        ptr = 0
-        last = 0
-        for i in range(1, l):
-            if (buf[i] == self._frame_byte):
-                buf[last] = i - last
-                last = i
-        return buf
+        return _stuff(bytearray(buf), self._frame_byte)
 
     def _unstuff_data(self, buf):
-        """Removes COBS from buf
+        """Removes COBS from buf (in place)
 
-        Can currently get into an infinite loop, don't know why
+        Returns:
+            Offset of the next frame if the offsets run past the end of buf,
+            otherwise 0x00
         """
         if len(buf) == 0:
             return 0x00
         n = buf[0]
         buf[0] = 0
         l = len(buf) - 1
-        sentinel = 0
         while n < l:
             tmp = buf[n]
             buf[n] = self._frame_byte
-            n += tmp
-            if (n == 0) and (tmp == 0):
-                logging.error("Infinite loop in unstuff data")
-                logging.error(buf)
-                return
-            sentinel += 1
-            if sentinel > 30:
-                logging.error(f"{buf}, {n}, {tmp}")
+            if tmp == 0:
+                logging.error("Frame byte inside frame: {}".format(buf))
                 return
+            n += tmp
         if n > l:
             return n
         return 0x00
 
+    @classmethod
+    def _encode_frame(cls, buf):
+        """Append the CRC to buf and COBS it, giving a complete frame (ending in the frame byte)"""
+        buf = bytearray(buf)
+        return _stuff(bytearray(1) + buf + bytearray([cls._calc_crc(buf), cls._frame_byte]), cls._frame_byte)
+
+    @classmethod
+    def _decode_frames(cls, data):
+        """Split a stream of frames and decode each of them.
+
+        Returns:
+            (frames, rest): frames is a list with (cmd, payload) for every
+            complete frame in data, or None if the frame was invalid (bad CRC,
+            length or COBS). rest is the incomplete frame at the end of data.
+        """
+        data = bytes(data)
+        frames = []
+        start = 0
+        end = data.find(cls._frame_byte)
+        while end != -1:
+            if end > start:
+                frames.append(cls._decode_frame(bytearray(data[start:end])))
+            start = end + 1
+            end = data.find(cls._frame_byte, start)
+        return frames, data[start:]
+
+    @staticmethod
+    def _decode_frame(buf):
+        # buf is [offset, cmd, len, data..., crc] without the frame byte
+        n = buf[0]
+        while n < len(buf):
+            tmp = buf[n]
+            buf[n] = 0x00
+            n += tmp
+        if n != len(buf) or len(buf) < 4 or buf[2] != len(buf) - 4 or \
+                SimpleSerial2._calc_crc(buf[1:-1]) != buf[-1]:
+            return None
+        return buf[1], buf[3:-1]
+
     def con(self, scope=None, flush_on_err=True):
         self.ser.con(scope)
         self._flush_on_err = flush_on_err
@@ -510,17 +557,131 @@ class SimpleSerial2(TargetTemplate):
             scmd (int): The subcommand to use
             data (bytearray): The data to send
         """
+        self.write(self._command_frame(cmd, scmd, data))
+
+    def _command_frame(self, cmd, scmd, data):
         if isinstance(cmd, str):
             cmd = ord(cmd[0])
-        buf = [0x00, cmd, scmd, len(data)]
+        buf = bytearray([cmd, scmd, len(data)])
         buf.extend(data)
-        crc = self._calc_crc(buf[1:])
-        buf.append(crc)
-        buf.append(0x00)
-        buf = self._stuff_data(buf)
-        self.write(buf)
-        #print(bytearray(buf))
-        #print(bytearray(self._unstuff_data(buf)))
+        return self._encode_frame(buf)
+
+    def send_cmds(self, cmds):
+        """Send several SSV2 commands to the target with a single write.
+
+        Args:
+            cmds (list): (cmd, scmd, data) of each command, like the
+                arguments of :meth:`send_cmd`.
+        """
+        self.write(b"".join(self._command_frame(cmd, scmd, data) for cmd, scmd, data in cmds))
+
+    def read_frames(self, done, min_len=5, timeout=250):
+        """Read and decode frames until done(frames) is True, or nothing arrives for timeout ms.
+
+        Args:
+            done (callable): Given the list of decoded frames so far, returns
+                True when no more are needed.
+            min_len (int, optional): Fewest bytes the frames can take, which
+                are requested in one read.
+            timeout (int, optional): Time in ms to wait for more data.
+
+        Returns:
+            List of (cmd, payload) of each frame received, or None for frames
+            that were invalid.
+        """
+        frames = []
+        rest = b""
+        while not done(frames):
+            # Past the expected length, read whatever has arrived
+            data = self.read(min_len if min_len > 0 else max(self.in_waiting(), 1), timeout=timeout)
+            if not data:
+                break
+            min_len -= len(data)
+            new, rest = self._decode_frames(rest + data.encode('latin-1'))
+            frames.extend(new)
+        return frames
+
+    def simpleserial_batch(self, cmd, data, pay_len=None, ack=True, timeout=250, max_batch=None):
+        """Send a command for every entry of data, and read back all of the responses.
+
+        Like calling :meth:`simpleserial_write` and :meth:`simpleserial_read`
+        for each entry, but the commands are written together and the
+        responses are read as one stream, so a batch needs a few USB
+        transfers instead of several per command. The target has to process
+        the commands one after the other from its serial buffer (as
+        simpleserial-aes does).
+
+        Args:
+            cmd (str): Command, with the same special cases for 'p' and 'k'
+                as :meth:`simpleserial_write`.
+            data (list): Data (bytearray) to send with each command.
+            pay_len (int, optional): Expected length of each response payload,
+                lets the responses be read with fewer transfers.
+            ack (bool, optional): Expect an ack packet after each response.
+                Defaults to True.
+            timeout (int, optional): Time in ms to wait for more responses.
+            max_batch (int, optional): Most commands to write at once. Use it if
+                the responses of a whole batch overflow the ChipWhisperer's
+                serial receive buffer.
+
+        Returns:
+            List with the response payload (bytearray) to each command, or None
+            if there was no valid response. If ack is True, a response is the
+            data packet before each ack (None for commands that only ack).
+
+        Example:
+            Encrypting 64 plaintexts::
+
+                responses = target.simpleserial_batch('p', [ktp.next()[1] for i in range(64)], 16)
+        """
+        if cmd == 'p':
+            cmd, scmd = 0x01, 0x01
+        elif cmd == 'k':
+            cmd, scmd = 0x01, 0x02
+        else:
+            scmd = 0x00
+        data = list(data)
+        if max_batch is None:
+            max_batch = max(len(data), 1)
+
+        frame_len = 5 + (pay_len or 0)
+        results = []
+        for start in range(0, len(data), max_batch):
+            batch = data[start:start + max_batch]
+            self.send_cmds([(cmd, scmd, d) for d in batch])
+            if ack:
+                acks = lambda frames: sum(1 for f in frames if f is not None and f[0] == ord('e'))
+                per_cmd = 6 + (frame_len if pay_len is not None else 0)
+                frames = self.read_frames(lambda frames: acks(frames) >= len(batch),
+                                          per_cmd * len(batch), timeout)
+                results.extend(self._batch_responses(frames, len(batch)))
+            else:
+                frames = self.read_frames(lambda frames: len(frames) >= len(batch), frame_len * len(batch), timeout)
+                results.extend([None if f is None else f[1] for f in frames[:len(batch)]])
+                results.extend([None] * (len(batch) - len(frames)))
+        return results
+
+    def _batch_responses(self, frames, num):
+        """Match the response packets in frames to the acks that follow them"""
+        responses = []
+        response = None
+        for frame in frames:
+            if frame is None:
+                response = None
+                continue
+            cmd, payload = frame
+            if cmd == ord('e'):
+                if len(payload) != 1 or payload[0] != 0x00:
+                    logging.warning("Device reported error %s" % (hex(payload[0]) if payload else None))
+                    response = None
+                responses.append(response)
+                response = None
+            else:
+                response = payload
+        if len(responses) < num:
+            logging.warning("Device did not ack %d of %d commands" % (num - len(responses), num))
+            self.flush_on_error()
+        return (responses + [None] * num)[:num]
 
     def reset_comms(self):
         """ Try to reset communication with the target and put it in
@@ -48,13 +48,19 @@ class SimpleSerialTemplate:
     def __init__(self):
         self.connectStatus = False
 
-        self.target_queue = collections.deque()
-        self.target_count = 0
+        self.max_queue_size = 384
 
-        self.terminal_queue = collections.deque()
-        self.terminal_count = 0
+        # Bounded deques drop the oldest entries themselves when they overflow
+        self.target_queue = collections.deque(maxlen=self.max_queue_size)
+        self.terminal_queue = collections.deque(maxlen=self.max_queue_size)
 
-        self.max_queue_size = 384
+    @property
+    def target_count(self):
+        return len(self.target_queue)
+
+    @property
+    def terminal_count(self):
+        return len(self.terminal_queue)
 
     def selectionChanged(self):
         pass
@@ -94,12 +100,7 @@ class SimpleSerialTemplate:
         self.hardware_write(string)
 
         # Update terminal buffer
-        for c in string:
-            self.terminal_queue.append(['out', c])
-            if self.terminal_count < self.max_queue_size:
-                self.terminal_count += 1
-            else:
-                self.terminal_queue.popleft()
+        self.terminal_queue.extend(['out', c] for c in string)
 
     def read(self, num=0, timeout=250):
         """
@@ -122,24 +123,18 @@ class SimpleSerialTemplate:
 
         # Try to read from queue
         ret = ''
-        while num > 0 and self.target_count > 0:
-            ret += self.target_queue.popleft()
-            self.target_count -= 1
-            num -= 1
+        if self.target_queue:
+            queued = min(num, len(self.target_queue))
+            ret = ''.join([self.target_queue.popleft() for _ in range(queued)])
+            num -= queued
 
-        if num == 0:
+        if num <= 0:
             return ret
 
         # If we didn't get enough data, try to read more from the hardware
         data = bytearray(self.hardware_read(num, timeout=timeout)).decode('latin-1')
-        for c in data:
-            self.terminal_queue.append(['in', c])
-            if self.terminal_count < self.max_queue_size:
-                self.terminal_count += 1
-            else:
-                self.terminal_queue.popleft()
-        ret += data
-        return ret
+        self.terminal_queue.extend(['in', c] for c in data)
+        return ret + data
 
     def flush(self):
         """
@@ -153,7 +148,6 @@ class SimpleSerialTemplate:
             self.hardware_read(waiting)
             waiting = self.hardware_inWaiting()
         self.target_queue.clear()
-        self.target_count = 0
 
     def inWaiting(self):
         """
@@ -208,25 +202,18 @@ class SimpleSerialTemplate:
 
         # Try to read from queue
         ret = []
-        while num > 0 and self.terminal_count > 0:
-            ret.append(self.terminal_queue.popleft())
-            self.terminal_count -= 1
-            num -= 1
+        if self.terminal_queue:
+            queued = min(num, len(self.terminal_queue))
+            ret = [self.terminal_queue.popleft() for _ in range(queued)]
+            num -= queued
 
-        if num == 0:
+        if num <= 0:
             return ret
 
         # If we didn't get enough data, try to read more from the hardware
-        data = self.hardware_read(num, timeout=timeout)
-        data = bytearray(data)
-        data = str(data)
-        for c in data:
-            self.target_queue.append(str(c))
-            if self.target_count < self.max_queue_size:
-                self.target_count += 1
-            else:
-                self.target_queue.popleft()
-            ret.append(['in', c])
+        data = bytearray(self.hardware_read(num, timeout=timeout)).decode('latin-1')
+        self.target_queue.extend(data)
+        ret.extend(['in', c] for c in data)
         return ret
 
     def terminal_flush(self):
@@ -238,7 +225,6 @@ class SimpleSerialTemplate:
         """
 
         self.terminal_queue.clear()
-        self.terminal_count = 0
 
     def terminal_inWaiting(self):
         """
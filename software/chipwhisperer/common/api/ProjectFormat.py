@@ -34,8 +34,9 @@ from chipwhisperer.common.api.settings import Settings
 from chipwhisperer.common.utils.parameter import Parameter, Parameterized, setupSetParam
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.traces.TraceContainerNative import TraceContainerNative
+from chipwhisperer.common.traces.TraceContainerTypes import TraceContainerFormatList
 import copy
-from chipwhisperer.common.traces import Trace
+from chipwhisperer.common.traces import Trace, TraceBatch, journal
 import shutil
 
 try:
@@ -143,6 +144,12 @@ class Project(Parameterized):
         self.sigStatusChanged = util.Signal()
         self.dirty = util.Observable(True)
 
+        #: Journal traces as they are added, so they can be recovered if the
+        #: program stops before the project is saved (see :mod:`chipwhisperer.common.traces.journal`)
+        self.journal = False
+        #: Longest time between syncing the journal to disk, in seconds
+        self.journal_sync_interval = 1.0
+
         self.settingsDict = {'Project Name':"Untitled", 'Project File Version':"1.00", 'Project Author':"Unknown"}
         self.datadirectory = ""
         self.config = ConfigObjProj(callback=self.configObjChanged)
@@ -155,10 +162,12 @@ class Project(Parameterized):
 
         self._segments = Segments(self)
         self._traces = Traces(self)
-        self._keys = IndividualIterable(self._traceManager.get_known_key, self._traceManager.num_traces)
-        self._textins = IndividualIterable(self._traceManager.get_textin, self._traceManager.num_traces)
-        self._textouts = IndividualIterable(self._traceManager.get_textout, self._traceManager.num_traces)
-        self._waves = IndividualIterable(self._traceManager.get_trace, self._traceManager.num_traces)
+        tm = self._traceManager
+        self._keys = IndividualIterable(tm.get_known_key, tm.num_traces, lambda rows, points: tm.get_column(3, rows))
+        self._textins = IndividualIterable(tm.get_textin, tm.num_traces, lambda rows, points: tm.get_column(1, rows))
+        self._textouts = IndividualIterable(tm.get_textout, tm.num_traces, lambda rows, points: tm.get_column(2, rows))
+        self._waves = IndividualIterable(tm.get_trace, tm.num_traces, lambda rows, points: tm.get_column(0, rows, points),
+                                         tm.num_points)
 
         if __debug__:
             logging.debug('Created: ' + str(self))
@@ -218,7 +227,18 @@ class Project(Parameterized):
 
     @setupSetParam("Trace Format")
     def set_trace_format(self, trace_format):
+        """ Sets the TraceContainer used to store new segments
+
+        Args:
+            trace_format: TraceContainer object, or the name of one in
+                TraceContainerFormatList ("native", "compressed", ...).
+        """
+        if isinstance(trace_format, str):
+            trace_format = TraceContainerFormatList[trace_format](project=self)
         self._trace_format = trace_format
+        traces = getattr(self, '_traces', None)
+        if traces is not None:
+            traces._use_trace_format()
 
     setTraceFormat = util.camel_case_deprecated(set_trace_format)
 
@@ -300,7 +320,8 @@ class Project(Parameterized):
 
         self.config = ConfigObjProj(infile=self.filename, callback=self.configObjChanged)
         self._traceManager.loadProject(self.filename)
-        self.dirty.setValue(False)
+        recovered = self._traceManager.recover_journals(self)
+        self.dirty.setValue(recovered > 0)
 
     def getDataFilepath(self, filename, subdirectory='analysis'):
         datadir = os.path.join(self.datadirectory, subdirectory)
@@ -400,6 +421,12 @@ class Project(Parameterized):
         self.config[pn]['General Settings'] =  self.settingsDict
 
         self.config.write()
+
+        # Everything journaled is saved now
+        for seg in self._traceManager.traceSegments:
+            seg.removeJournal()
+        journal.clear_index(os.path.join(self.datadirectory, "traces"))
+
         self.sigStatusChanged.emit()
         self.dirty.setValue(False)
 
@@ -623,9 +650,11 @@ class Traces:
 
         trace_of_interest = my_project.traces[99]
 
-    So is slicing::
+    So is slicing, which returns a :class:`TraceBatch <chipwhisperer.common.traces.TraceBatch>`
+    with the waves, textins, textouts and keys as arrays::
 
         interesting_traces = my_project.traces[20:35]
+        interesting_traces.waves  # (15 x points) array
 
     Args:
         project: The project class where traces will be stored.
@@ -654,11 +683,24 @@ class Traces:
 
         # segment management
         self.cur_seg = self.project.segments.new()
+        self.cur_seg.setTraceHint(segment_length)
         self.project.segments.append(self.cur_seg)
         self.cur_trace_num = 0
         self.seg_len = segment_length
         self.seg_ind_max = self.seg_len - 1
 
+    def _use_trace_format(self):
+        """Replace the current segment with one in the project's trace format, if it is still empty"""
+        segment_length = self.project.get_trace_format().segment_length
+        if segment_length is not None:
+            self.seg_len = segment_length
+            self.seg_ind_max = segment_length - 1
+        if self.cur_trace_num == 0 and self.cur_seg in self.tm.traceSegments:
+            self.tm.removeTraceSegments(self.tm.traceSegments.index(self.cur_seg))
+            self.cur_seg = self.project.segments.new()
+            self.cur_seg.setTraceHint(self.seg_len)
+            self.project.segments.append(self.cur_seg)
+
     @property
     def max(self):
         """Max index during iteration."""
@@ -681,7 +723,9 @@ class Traces:
             raise TypeError("Expected Trace object, got {}.".format(trace))
 
         if self.cur_trace_num > self.seg_ind_max:
+            self.cur_seg.compactJournal()
             self.cur_seg = self.project.segments.new()
+            self.cur_seg.setTraceHint(self.seg_len)
             self.project.segments.append(self.cur_seg)
             self.cur_trace_num = 0
         self.cur_seg.add_trace(*trace)
@@ -721,8 +765,8 @@ class Traces:
         return result
 
     def __getitem__(self, item):
-        if isinstance(item, int):
-            ind = item
+        if isinstance(item, (int, np.integer)):
+            ind = int(item)
             if ind < 0:
                 ind = self.max + ind + 1
 
@@ -737,21 +781,10 @@ class Traces:
             )
             return result
 
-        elif isinstance(item, slice):
-            indices = item.indices(self.tm.num_traces())
-            result = []
-            for i in range(*indices):
-                result.append(
-                    Trace(
-                        self.tm.get_trace(i),
-                        self.tm.get_textin(i),
-                        self.tm.get_textout(i),
-                        self.tm.get_known_key(i)
-                    )
-                )
-            return result
+        elif isinstance(item, (slice, list, np.ndarray)):
+            return TraceBatch(*self.tm.get_traces(item))
         else:
-            raise TypeError('Indexing by integer or slice only')
+            raise TypeError('Indexing by integer, slice or index array only')
 
     def __repr__(self):
         _, project_filename = os.path.split(self.project.get_filename())
@@ -789,7 +822,6 @@ class Segments:
     def __init__(self, project):
         self.project = project
         self.tm = project._traceManager
-        self.trace_container = project._trace_format
         self.data_directory = project.datadirectory
 
     def __len__(self):
@@ -801,7 +833,7 @@ class Segments:
         Returns:
             (TraceContainer) A new empty instance of a trace container.
         """
-        seg = copy.copy(self.trace_container)
+        seg = copy.copy(self.project.get_trace_format())
         seg.clear()
         return seg
 
@@ -830,10 +862,23 @@ class Segments:
 
 
 class IndividualIterable:
-    
-    def __init__(self, getter_func, trace_num_func):
+    """One of the columns (waves, textins, textouts, keys) of the traces of a project.
+
+    Indexing with an integer returns the entry of one trace. Slices, index
+    arrays and boolean masks return an array with one row per trace, read a
+    segment at a time. Contiguous rows of one segment are read-only views of
+    its arrays (memory-mapped for saved segments), not copies.
+
+    For waves, a second index selects points, and only those are read::
+
+        window = project.waves[:, 1000:1200]
+    """
+
+    def __init__(self, getter_func, trace_num_func, rows_func=None, point_num_func=None):
         self.getter = getter_func
         self.trace_num_func = trace_num_func
+        self.rows_func = rows_func
+        self.point_num_func = point_num_func
 
     @property
     def max(self):
@@ -854,8 +899,8 @@ class IndividualIterable:
         return self.trace_num_func()
 
     def __getitem__(self, item):
-        if isinstance(item, int):
-            ind = item
+        if isinstance(item, (int, np.integer)):
+            ind = int(item)
             if ind < 0:
                 ind = self.max + ind + 1
 
@@ -864,6 +909,22 @@ class IndividualIterable:
 
             return self.getter(ind)
 
+        elif self.rows_func is not None and isinstance(item, tuple):
+            if self.point_num_func is None or len(item) != 2:
+                raise IndexError('Only waves have a second (point) index')
+            rows, points = item
+            if isinstance(points, slice) and points.step in (None, 1):
+                start, stop, _ = points.indices(self.point_num_func())
+                point_range, points = [start, max(start, stop)], slice(None)
+            else:
+                point_range = None
+            if isinstance(rows, (int, np.integer)):
+                return self[rows:int(rows) + 1 or None, item[1]][0]
+            return self.rows_func(rows, point_range)[:, points]
+
+        elif self.rows_func is not None and isinstance(item, (slice, list, np.ndarray)):
+            return self.rows_func(item, None)
+
         elif isinstance(item, slice):
             indices = item.indices(self.max+1)
             result = []
@@ -873,8 +934,17 @@ class IndividualIterable:
         else:
             raise TypeError('Indexing by integer or slice only')
 
-    def __array__(self):
+    def __array__(self, dtype=None, copy=None):
         # to make converting to numpy arrays much easier
+        if self.rows_func is not None:
+            # May be a read-only view of a segment, so copied unless copy=False
+            arr = self.rows_func(slice(None), None)
+            if copy is False:
+                if dtype is not None and arr.dtype != np.dtype(dtype):
+                    raise ValueError("Unable to convert to {} without a copy".format(dtype))
+                return arr
+            return np.array(arr, dtype=dtype, copy=True)
+
         if hasattr(self.getter(0), "dtype"):
             dtype = self.getter(0).dtype
         else:
@@ -882,5 +952,6 @@ class IndividualIterable:
         num_traces = self.trace_num_func()
         len_trace = len(self.getter(0))
         arr = np.zeros((num_traces, len_trace), dtype=dtype)
-        arr[:,:] = np.array([self.getter(i) for i in range(num_traces)])[:,:]
-        return arr
\ No newline at end of file
+        for i in range(num_traces):
+            arr[i] = self.getter(i)
+        return arr
@@ -22,18 +22,23 @@
 #    You should have received a copy of the GNU General Public License
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 
+import bisect
 import configparser
 import logging
 import os.path
 import re
+from collections import OrderedDict
 
 from chipwhisperer.common.traces.TraceContainerNative import TraceContainerNative
+from chipwhisperer.common.traces.TraceContainerTypes import TraceContainerFormatList
+from chipwhisperer.common.traces import journal
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.utils.tracesource import TraceSource
 
 from datetime import datetime
 from pathlib import Path
 import copy
+import numpy as np
 
 class TraceManager(TraceSource):
     """
@@ -43,8 +48,15 @@ class TraceManager(TraceSource):
 
     Don't use anything that modifies the trace manager -> stick to stuff
     that gives you information about it instead (i.e. get_trace, get_known_key)
+
+    Once the traces are saved, segments stay loaded until the ones in use
+    need more than segment_cache_bytes, then the least recently used
+    segments are unloaded. The last used segment is always kept loaded.
     """
 
+    #: Memory budget in bytes for loaded segments (memmapped traces included)
+    segment_cache_bytes = 512 * 1024 * 1024
+
     def __init__(self, name = "Trace Management"):
         TraceSource.__init__(self, name)
         self.name = name
@@ -54,12 +66,18 @@ class TraceManager(TraceSource):
         self._sampleRate = 0
         self.lastUsedSegment = None
         self.traceSegments = []
+        self._segmentStarts = []
+        self._mappedSegments = []
+        self._loadedSegments = OrderedDict()
         self.saved = False
         if __debug__: logging.debug('Created: ' + str(self))
 
     def new_project(self):
         """Create a new empty set of traces."""
         self.traceSegments = []
+        self._segmentStarts = []
+        self._mappedSegments = []
+        self._loadedSegments = OrderedDict()
         self.dirty.setValue(False)
         self.sigTracesChanged.emit()
 
@@ -68,7 +86,19 @@ class TraceManager(TraceSource):
     def save_project(self, config, configfilename):
         """Save the trace segments information to a project file."""
         config[self.name].clear()
+        tracedir = os.path.normpath(os.path.splitext(configfilename)[0] + "_data" + "/traces")
         for indx, t in enumerate(self.traceSegments):
+            cfgfile = t.config.configFilename()
+            if not t.dirty and cfgfile and os.path.isfile(cfgfile) and os.path.dirname(cfgfile) == tracedir:
+                # Already saved in this project (e.g. by compactJournal()), no need to write the traces again
+                t.config.saveTrace()
+                config[self.name]['tracefile%d' % indx] = os.path.normpath(os.path.relpath(cfgfile, os.path.split(configfilename)[0]))
+                config[self.name]['enabled%d' % indx] = str(t.enabled)
+                continue
+            if not t.isLoaded() and cfgfile:
+                # Load before the filename changes
+                t.loadAllTraces(None, None)
+
             starttime = datetime.now()
             prefix = starttime.strftime('%Y.%m.%d-%H.%M.%S') + "_" + str(indx)
             t.config.setConfigFilename(os.path.splitext(configfilename)[0] + "_data" + "/traces/config_" + prefix + ".cfg")
@@ -99,7 +129,7 @@ class TraceManager(TraceSource):
                 # print "Opening %s"%fname
                 ti = TraceContainerNative()
                 try:
-                    ti.config.loadTrace(fname)
+                    ti = self._segmentFromConfig(fname)
                     ti.loadAllTraces()
                 except Exception as e:
                     logging.error(str(e))
@@ -110,6 +140,74 @@ class TraceManager(TraceSource):
         self._setModified()
         self.dirty.setValue(False)
 
+    @staticmethod
+    def _segmentFromConfig(fname):
+        """Return a segment with its config loaded from fname, in the container it was saved with"""
+        ti = TraceContainerNative()
+        ti.config.loadTrace(fname)
+        # Formats derived from the native one (e.g. compressed) are loaded the same way
+        container = TraceContainerFormatList.get(ti.config.attr("format"), TraceContainerNative)
+        if container is not TraceContainerNative and issubclass(container, TraceContainerNative):
+            ti = container()
+            ti.config.loadTrace(fname)
+        return ti
+
+    def recover_journals(self, project):
+        """Add the traces captured since the project was last saved, if they were journaled.
+
+        See :mod:`chipwhisperer.common.traces.journal`. Segments that were
+        saved when they were full are added (or replace the segment they
+        were saved from). Traces still in journals are saved as new segments.
+
+        Returns:
+            Number of segments recovered.
+        """
+        directory = os.path.join(project.datadirectory, "traces")
+        saved = dict((os.path.normpath(t.config.configFilename() or ""), i) for i, t in enumerate(self.traceSegments))
+        compacted = set()
+        recovered = 0
+
+        for cfgfile, journalfile, replaced in journal.read_index(directory):
+            compacted.add(journalfile)
+            if os.path.normpath(cfgfile) in saved or not os.path.isfile(cfgfile):
+                continue
+            ti = self._segmentFromConfig(cfgfile)
+            ti.enabled = True
+            if replaced is not None and os.path.normpath(replaced) in saved:
+                i = saved[os.path.normpath(replaced)]
+                ti.enabled = self.traceSegments[i].enabled
+                self.traceSegments[i] = ti
+            else:
+                self.traceSegments.append(ti)
+            saved[os.path.normpath(cfgfile)] = self.traceSegments.index(ti)
+            recovered += 1
+
+        for journalfile in journal.find_journals(directory):
+            if journalfile in compacted:
+                # Saved, but the journal wasn't removed yet
+                os.remove(journalfile)
+                continue
+            traces = journal.read_journal(journalfile)
+            ti = TraceContainerNative(project=project)
+            ti.enabled = True
+            for trace in traces:
+                ti.addWave(trace.wave)
+                ti.addTextin(trace.textin)
+                ti.addTextout(trace.textout)
+                ti.addKey(trace.key)
+            ti._journal = journal.TraceJournal(journalfile)
+            if not traces:
+                ti.removeJournal()
+                continue
+            ti.compactJournal()
+            self.traceSegments.append(ti)
+            recovered += 1
+
+        if recovered:
+            logging.warning("Recovered %d trace segments that were captured but not saved with the project" % recovered)
+            self._setModified()
+        return recovered
+
     def removeTraceSegments(self, positions):
         """Remove a list of trace segments. Do not repeat numbers!!"""
         if not isinstance(positions, list):
@@ -143,25 +241,50 @@ class TraceManager(TraceSource):
 
     def get_segment(self, traceIndex):
         """Return the trace segment with the specified trace in the list with all enabled segments."""
-        if self.lastUsedSegment is not None:
-            if self.lastUsedSegment.mappedRange is not None and self.lastUsedSegment.mappedRange[0] <= traceIndex <= \
-                    self.lastUsedSegment.mappedRange[1]:
-                return self.lastUsedSegment
-            else:
-                # Only load one segment at a time for memory reasons
-                # If the traces are actually saved :)
-                if self.saved:
-                    self.lastUsedSegment.unloadAllTraces()
-                    self.lastUsedSegment = None
-
-        for traceSegment in self.traceSegments:
-            if traceSegment.mappedRange and traceSegment.mappedRange[0] <= traceIndex <= traceSegment.mappedRange[1]:
-                if not traceSegment.isLoaded():
-                    traceSegment.loadAllTraces(None, None)
-                self.lastUsedSegment = traceSegment
-                return traceSegment
-
-        raise ValueError("Error: Trace %d is not in mapped range." % traceIndex)
+        if self.lastUsedSegment is not None and self.lastUsedSegment.mappedRange is not None and \
+                self.lastUsedSegment.mappedRange[0] <= traceIndex <= self.lastUsedSegment.mappedRange[1] and \
+                self.lastUsedSegment.isLoaded():
+            return self.lastUsedSegment
+
+        i = bisect.bisect_right(self._segmentStarts, traceIndex) - 1
+        if i < 0 or traceIndex > self._mappedSegments[i].mappedRange[1]:
+            raise ValueError("Error: Trace %d is not in mapped range." % traceIndex)
+
+        traceSegment = self._mappedSegments[i]
+        if not traceSegment.isLoaded():
+            traceSegment.loadAllTraces(None, None)
+        self.lastUsedSegment = traceSegment
+        self._useSegment(traceSegment)
+        return traceSegment
+
+    @staticmethod
+    def _segmentBytes(traceSegment):
+        # Rows allocated for traces still to be added don't use memory until written
+        traces = traceSegment.traces
+        if isinstance(traces, np.ndarray):
+            traces = traces[:traceSegment.numTraces()]
+        return sum(getattr(data, 'nbytes', 0) for data in
+                   (traces, traceSegment.textins, traceSegment.textouts, getattr(traceSegment, 'keylist', None)))
+
+    def _useSegment(self, traceSegment):
+        """Mark traceSegment as the most recently used, and unload old segments that don't fit the memory budget"""
+        self._loadedSegments.pop(id(traceSegment), None)
+        self._loadedSegments[id(traceSegment)] = traceSegment
+
+        # Segments can only be unloaded if the traces are actually saved :)
+        if not self.saved:
+            return
+
+        total = sum(self._segmentBytes(t) for t in self._loadedSegments.values())
+        for key, t in list(self._loadedSegments.items())[:-1]:
+            if total <= self.segment_cache_bytes:
+                break
+            if not t.isLoaded():
+                del self._loadedSegments[key]
+            elif not t.dirty:
+                total -= self._segmentBytes(t)
+                t.unloadAllTraces()
+                del self._loadedSegments[key]
 
     getSegment = util.camel_case_deprecated(get_segment)
 
@@ -207,15 +330,96 @@ class TraceManager(TraceSource):
 
     getKnownKey = util.camel_case_deprecated(get_known_key)
 
+    def get_trace_block(self, start, stop, point_range=None, copy=True):
+        """Return traces start to stop-1 in the list of enabled segments, and their data
+
+        Each segment is read with a single slice instead of trace by trace.
+
+        Args:
+            start (int): First trace.
+            stop (int): End of the block (not included).
+            point_range (list, optional): [start, end) of the points to return.
+            copy (bool, optional): If False, a block in a single segment is
+                returned as read-only views of its arrays where possible.
+
+        Returns:
+            (traces, textins, textouts, keys): traces is a (traces x points)
+            array, the others have one row per trace.
+
+        Raises:
+            ValueError: Some of the traces are not in the mapped range.
+        """
+        parts = []
+        tnum = start
+        while tnum < stop:
+            t = self.get_segment(tnum)
+            end = min(stop, t.mappedRange[1] + 1)
+            parts.append(t.get_trace_block(tnum - t.mappedRange[0], end - t.mappedRange[0], point_range))
+            tnum = end
+
+        if not parts:
+            npoints = self._numPoints if point_range is None else point_range[1] - point_range[0]
+            return np.zeros((0, npoints)), np.zeros((0, 0), dtype=np.uint8), np.zeros((0, 0), dtype=np.uint8), np.zeros((0, 0), dtype=np.uint8)
+        if len(parts) == 1 and not copy:
+            return tuple(self._readonly(data) for data in parts[0])
+        return tuple(np.concatenate([part[i] for part in parts]) for i in range(4))
+
+    @staticmethod
+    def _readonly(data):
+        data = data.view()
+        data.flags.writeable = False
+        return data
+
+    def get_traces(self, rows, point_range=None):
+        """Return the traces selected by rows in the list of enabled segments, and their data
+
+        Like get_trace_block(), but rows can be any slice, an array of trace
+        numbers or a boolean mask. Nearby rows are read with one slice, and a
+        contiguous block in a single segment is returned as read-only views.
+        """
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(self._numTraces)
+            if step == 1:
+                return self.get_trace_block(start, max(start, stop), point_range, copy=False)
+            rows = np.arange(start, stop, step)
+        else:
+            rows = np.arange(self._numTraces)[rows]
+            if rows.ndim != 1:
+                raise IndexError("Expected a 1-D array of trace numbers")
+        if len(rows) == 0:
+            return self.get_trace_block(0, 0, point_range)
+
+        order = np.argsort(rows, kind='stable')
+        sortedrows = rows[order]
+        parts = []
+        for run in np.split(sortedrows, np.flatnonzero(np.diff(sortedrows) > 16) + 1):
+            block = self.get_trace_block(int(run[0]), int(run[-1]) + 1, point_range, copy=False)
+            parts.append([data[run - run[0]] for data in block])
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        return tuple(np.concatenate([part[i] for part in parts])[inverse] for i in range(4))
+
+    def get_column(self, column, rows, point_range=None):
+        """Return one of the arrays of get_traces(): 0 for traces, 1 textins, 2 textouts, 3 keys"""
+        if column != 0:
+            # Only the text/keys are needed
+            point_range = [0, 0]
+        return self.get_traces(rows, point_range)[column]
+
     def _updateRanges(self):
         """Update the trace range for each segments."""
         startTrace = 0
         self._sampleRate = 0
         self._numPoints = 0
+        self._segmentStarts = []
+        self._mappedSegments = []
         for t in self.traceSegments:
             if t.enabled:
                 tlen = t.numTraces()
                 t.mappedRange = [startTrace, startTrace+tlen-1]
+                if tlen > 0:
+                    self._segmentStarts.append(startTrace)
+                    self._mappedSegments.append(t)
                 startTrace = startTrace + tlen
                 np = int(t.config.attr("numPoints"))
                 if self._numPoints != np and np != 0:
@@ -235,6 +439,26 @@ class TraceManager(TraceSource):
                 t.mappedRange = None
         self._numTraces = startTrace
 
+        # Track segments loaded when added/opened, forget removed ones
+        segments = OrderedDict((id(t), t) for t in self.traceSegments if t.isLoaded())
+        for key in [key for key in self._loadedSegments if key not in segments]:
+            del self._loadedSegments[key]
+        for key, t in segments.items():
+            self._loadedSegments.setdefault(key, t)
+
+    def _traceAdded(self, traceSegment):
+        """Update the ranges after a trace was added to traceSegment.
+
+        Adding to the last mapped segment is the usual case while capturing,
+        and only extends its range. Anything else updates all the ranges.
+        """
+        if traceSegment.enabled and self._mappedSegments and self._mappedSegments[-1] is traceSegment and \
+                traceSegment is self.traceSegments[-1] and traceSegment.numTraces() == self._numTraces - traceSegment.mappedRange[0] + 1:
+            traceSegment.mappedRange[1] += 1
+            self._numTraces += 1
+        else:
+            self._updateRanges()
+
     def num_points(self):
         """Return the number of points in traces of the selected segments."""
         return self._numPoints
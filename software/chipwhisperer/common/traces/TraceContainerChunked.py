@@ -0,0 +1,361 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2020, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+"""Trace container that keeps all of the traces of a project in one chunked, memory-mapped file.
+
+The traces are split into chunks of chunk_traces traces x chunk_points
+samples, and the file (<prefix>traces.cwc) holds:
+
+* A HEADER_SIZE byte header: MAGIC, then JSON with the dtype, number of
+  traces and points, and the chunk shape.
+* The chunks, as a (trace chunks x point chunks x chunk_traces x chunk_points)
+  array. Each row of chunks is written when its traces are captured, so the
+  file only grows at the end.
+
+Reading a narrow window of points of all traces (e.g. CPA) reads one column
+of chunks, which is contiguous within each row of chunks. Reading a few
+whole traces reads chunk_points contiguous samples per chunk. Neither has to
+read the rest of the file, and nothing is loaded into memory beyond what
+is indexed.
+
+The traces are written to the file as they are added, instead of being kept
+in memory until the project is saved, so a single segment can hold more
+traces than fit in RAM.
+"""
+
+import json
+import logging
+import os
+import shutil
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from . import RawWave
+from .TraceContainerNative import TraceContainerNative
+
+MAGIC = b"CWC1"
+HEADER_SIZE = 4096
+
+
+class ChunkedTraces(object):
+    """(traces x points) array of traces in a chunked file (see module docstring).
+
+    Indexing returns new arrays, reading only the chunks that are needed.
+
+    Args:
+        filename (str): .cwc file.
+        mode (str): 'r' to read, 'r+' to read and append traces.
+    """
+    def __init__(self, filename, mode='r'):
+        self.filename = filename
+        self.mode = mode
+        with open(filename, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if header[:len(MAGIC)] != MAGIC:
+            raise IOError("%s is not a chunked trace file" % filename)
+        info = json.loads(header[len(MAGIC):].decode().rstrip())
+        self.dtype = np.dtype(info["dtype"])
+        self.points = info["points"]
+        self.chunk_traces = info["chunk_traces"]
+        self.chunk_points = info["chunk_points"]
+        self._traces = info["traces"]
+        self._pointchunks = -(-self.points // self.chunk_points)
+        self._rowbuf = np.zeros(self._pointchunks * self.chunk_points, dtype=self.dtype)
+        self._map()
+
+    @classmethod
+    def create(cls, filename, dtype, points, chunk_traces=256, chunk_bytes=4096):
+        """Create an empty file for traces of points samples, chunked by chunk_traces
+        traces x chunk_bytes bytes of samples"""
+        dtype = np.dtype(dtype)
+        chunk_points = max(min(chunk_bytes // dtype.itemsize, points), 1)
+        with open(filename, "xb") as f:
+            f.write(cls._header(dtype, points, chunk_traces, chunk_points, 0))
+        return cls(filename, 'r+')
+
+    @staticmethod
+    def _header(dtype, points, chunk_traces, chunk_points, traces):
+        info = json.dumps({
+            "dtype": dtype.str,
+            "points": points,
+            "chunk_traces": chunk_traces,
+            "chunk_points": chunk_points,
+            "traces": traces,
+        }).encode()
+        return (MAGIC + info).ljust(HEADER_SIZE)
+
+    @property
+    def _chunkrowbytes(self):
+        return self._pointchunks * self.chunk_traces * self.chunk_points * self.dtype.itemsize
+
+    def _map(self):
+        rows = (os.path.getsize(self.filename) - HEADER_SIZE) // self._chunkrowbytes
+        if rows == 0:
+            self._data = None
+        else:
+            self._data = np.memmap(self.filename, dtype=self.dtype, mode=self.mode, offset=HEADER_SIZE,
+                                   shape=(rows, self._pointchunks, self.chunk_traces, self.chunk_points))
+
+    def _capacity(self):
+        return 0 if self._data is None else self._data.shape[0] * self.chunk_traces
+
+    def _resize(self, chunkrows):
+        if self._data is not None:
+            self._data.flush()
+        self._data = None
+        with open(self.filename, "r+b") as f:
+            f.truncate(HEADER_SIZE + chunkrows * self._chunkrowbytes)
+        self._map()
+
+    @property
+    def shape(self):
+        return self._traces, self.points
+
+    ndim = 2
+
+    @property
+    def size(self):
+        return self._traces * self.points
+
+    def __len__(self):
+        return self._traces
+
+    def append(self, trace):
+        """Add a trace, padded with zeros if it is short"""
+        n = self._traces
+        if n >= self._capacity():
+            # Grows by as many rows of chunks as there are, to keep remapping rare
+            self._resize(max(2 * (self._capacity() // self.chunk_traces), 1))
+        row = self._rowbuf
+        row[:len(trace)] = trace
+        row[len(trace):] = 0
+        self._data[n // self.chunk_traces, :, n % self.chunk_traces, :] = row.reshape(self._pointchunks, self.chunk_points)
+        self._traces += 1
+
+    def extend(self, traces, block=4096):
+        """Add the traces of a (traces x points) array"""
+        for start in range(0, len(traces), block):
+            for trace in np.asarray(traces[start:start + block]):
+                self.append(trace)
+
+    def flush(self):
+        """Write the number of traces and any traces still in memory to the file"""
+        if self.mode == 'r':
+            return
+        if self._data is not None:
+            self._data.flush()
+        with open(self.filename, "r+b") as f:
+            f.write(self._header(self.dtype, self.points, self.chunk_traces, self.chunk_points, self._traces))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def move(self, filename):
+        """Flush to filename and continue with it. The unused rows of chunks are removed"""
+        self._resize(-(-self._traces // self.chunk_traces))
+        self.flush()
+        self._data = None
+        os.replace(self.filename, filename)
+        self.filename = filename
+        self._map()
+
+    def close(self):
+        self.flush()
+        self._data = None
+
+    def _block(self, start, stop, cols):
+        """Traces start to stop-1 and points cols.start to cols.stop-1"""
+        c0, c1 = cols
+        ct, cp = self.chunk_traces, self.chunk_points
+        out = np.empty((max(stop - start, 0), max(c1 - c0, 0)), dtype=self.dtype)
+        if out.size == 0:
+            return out
+        first, last = c0 // cp, (c1 - 1) // cp + 1
+        n = start
+        while n < stop:
+            rc, lo = divmod(n, ct)
+            hi = min(ct, lo + stop - n)
+            part = self._data[rc, first:last, lo:hi, :]
+            part = part.transpose(1, 0, 2).reshape(hi - lo, (last - first) * cp)
+            out[n - start:n - start + hi - lo] = part[:, c0 - first * cp:c1 - first * cp]
+            n += hi - lo
+        return out
+
+    def _rows(self, rows, cols):
+        c0, c1 = cols
+        ct, cp = self.chunk_traces, self.chunk_points
+        first, last = c0 // cp, (c1 - 1) // cp + 1
+        rows = np.asarray(rows, dtype=np.intp)
+        if len(rows) == 0 or c1 <= c0:
+            return np.empty((len(rows), max(c1 - c0, 0)), dtype=self.dtype)
+        part = self._data[rows // ct, first:last, rows % ct, :]
+        return part.reshape(len(rows), (last - first) * cp)[:, c0 - first * cp:c1 - first * cp]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 2:
+            raise IndexError("too many indices for traces")
+        rows = key[0] if len(key) > 0 else slice(None)
+        cols = key[1] if len(key) > 1 else slice(None)
+
+        # Points: read the range covering them, then apply the step
+        if isinstance(cols, slice):
+            c0, c1, cstep = cols.indices(self.points)
+            if cstep < 0:
+                c0, c1 = c1 + 1, c0 + 1
+            inner = slice(None, None, cstep)
+        elif isinstance(cols, (int, np.integer)):
+            c = int(cols) + (self.points if cols < 0 else 0)
+            if not 0 <= c < self.points:
+                raise IndexError("index %d is out of bounds for %d points" % (cols, self.points))
+            c0, c1, inner = c, c + 1, 0
+        else:
+            idx = np.arange(self.points)[cols]
+            c0, c1 = (int(idx.min()), int(idx.max()) + 1) if idx.size else (0, 0)
+            inner = idx - c0
+
+        if isinstance(rows, (int, np.integer)):
+            n = int(rows) + (self._traces if rows < 0 else 0)
+            if not 0 <= n < self._traces:
+                raise IndexError("index %d is out of bounds for %d traces" % (rows, self._traces))
+            return self._block(n, n + 1, (c0, c1))[0][inner]
+        if isinstance(rows, slice) and rows.indices(self._traces)[2] == 1:
+            start, stop, _ = rows.indices(self._traces)
+            data = self._block(start, stop, (c0, c1))
+        else:
+            data = self._rows(np.arange(self._traces)[rows], (c0, c1))
+        return data[:, inner]
+
+    def __iter__(self):
+        for start in range(0, self._traces, self.chunk_traces):
+            for trace in self[start:start + self.chunk_traces]:
+                yield trace
+
+    def __array__(self, dtype=None, copy=None):
+        traces = self[:]
+        return traces if dtype is None else traces.astype(dtype)
+
+
+class TraceContainerChunked(TraceContainerNative):
+    """Native trace container with all traces in one chunked file (see module docstring).
+
+    A project using it keeps all of its traces in one segment, so there is
+    one config file and nothing to load or unload when reading traces from
+    different parts of the capture. Text and keys are saved like in the
+    native format.
+
+    Use it for the traces added to a project with::
+
+        project.set_trace_format("chunked")
+
+    Attributes:
+        chunk_traces (int): Number of traces in a chunk.
+        chunk_bytes (int): Size of the samples of one trace in a chunk, in bytes.
+    """
+    _name = "ChipWhisperer/Chunked"
+    _files = TraceContainerNative._files[:1] + ("%straces.cwc",) + TraceContainerNative._files[2:]
+
+    segment_length = sys.maxsize
+    chunk_traces = 256
+    chunk_bytes = 4096
+
+    def clear(self):
+        TraceContainerNative.clear(self)
+        self.config.setAttr("format", "chunked")
+
+    def addWave(self, trace, dtype=None):
+        if self.traces is None:
+            if dtype is None:
+                dtype = np.double
+            if isinstance(trace, RawWave):
+                dtype = trace.dtype
+                self.setSampleScale(trace.gain, trace.offset)
+            self.tracedtype = dtype
+            self.traces = self._createTraces(os.path.join(self.project.datadirectory, "traces"), dtype, len(trace))
+        elif self.traces.dtype.kind in 'ui':
+            trace = self._toCodes(trace)
+        elif isinstance(trace, RawWave):
+            trace = trace.to_float()
+
+        pad = self.traces.points - len(trace)
+        if pad > 0:
+            logging.warning('Trace too short (length=%d)' % len(trace) + " *This MAY SUGGEST DATA CORRUPTION*")
+            logging.warning('Padding with %d zero points' % pad)
+        elif pad < 0:
+            raise ValueError("Trace too long (length=%d, expected %d)" % (len(trace), self.traces.points))
+        self.traces.append(trace)
+
+        self._numTraces += 1
+        self.setDirty(True)
+        self.writeDataToConfig()
+
+    def _createTraces(self, directory, dtype, points):
+        # Renamed to the segment's prefix when the project is saved
+        stamp = datetime.now().strftime('%Y.%m.%d-%H.%M.%S.%f')
+        n = 0
+        while True:
+            try:
+                return ChunkedTraces.create(os.path.join(directory, "unsaved_%s_%d_traces.cwc" % (stamp, n)),
+                                            dtype, points, self.chunk_traces, self.chunk_bytes)
+            except FileExistsError:
+                n += 1
+
+    def loadAllTraces(self, directory=None, prefix=""):
+        if self.config.configFilename():
+            if directory is None:
+                directory = os.path.split(self.config.configFilename())[0]
+            if prefix is None or prefix == '':
+                prefix = self.config.attr("prefix")
+
+        filename = os.path.join(directory, "%straces.cwc" % prefix)
+        traces = ChunkedTraces(filename) if os.path.isfile(filename) else None
+        self._loadAux(directory, prefix)
+        self.traces = traces
+        self.loadSampleScale()
+
+    def _saveTraces(self, filename, traces):
+        tracefile = filename[:-len("npy")] + "cwc"
+        if traces is None:
+            if os.path.isfile(tracefile):
+                os.remove(tracefile)
+        elif isinstance(traces, ChunkedTraces):
+            if os.path.abspath(traces.filename) == os.path.abspath(tracefile):
+                traces.flush()
+            elif traces.mode == 'r':
+                # Saved with another project
+                shutil.copyfile(traces.filename, tracefile)
+            else:
+                traces.move(tracefile)
+        else:
+            traces = np.asarray(traces)
+            chunked = ChunkedTraces.create(tracefile, traces.dtype, traces.shape[1], self.chunk_traces, self.chunk_bytes)
+            chunked.extend(traces)
+            chunked.close()
+
+    def unloadAllTraces(self):
+        if isinstance(self.traces, ChunkedTraces):
+            self.traces.close()
+        TraceContainerNative.unloadAllTraces(self)
@@ -0,0 +1,351 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2020, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+"""Trace container that saves the traces compressed, in blocks that can be read separately.
+
+The traces of a segment are saved to <prefix>traces.cwz, which holds:
+
+* MAGIC
+* The compressed blocks of block_traces traces each.
+* A JSON footer with the dtype, shape, filters, codec and the offset of each block.
+* The length of the footer (uint64) and MAGIC.
+
+Before a block is compressed, integer traces are delta encoded along the
+samples (with wraparound, so it is exact) and the bytes of the samples are
+shuffled (all first bytes, then all second bytes, ...). For the integer ADC
+codes of :attr:`scope.int_samples <chipwhisperer.capture.scopes.OpenADC.int_samples>`
+this leaves mostly zero high bytes, which any codec compresses well.
+
+The codec is zstandard if it is installed, otherwise zlib (or lzma if asked
+for). Text and keys are saved like in the native format.
+"""
+
+import json
+import os
+import struct
+import zlib
+import lzma
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .TraceContainerNative import TraceContainerNative
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"CWZ1"
+_footer = struct.Struct("<Q")
+
+
+def _zstd_compress(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+#: Codec name: (compress(data, level), decompress(data), default level)
+codecs = {
+    "zlib": (zlib.compress, zlib.decompress, 1),
+    "lzma": (lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 1),
+}
+if zstandard is not None:
+    codecs["zstd"] = (_zstd_compress, _zstd_decompress, 3)
+
+
+def default_codec():
+    return "zstd" if "zstd" in codecs else "zlib"
+
+
+def _encode_block(block, delta, shuffle):
+    block = np.ascontiguousarray(block)
+    if delta:
+        # Same byte order as the saved dtype, which _decode_block() uses
+        block = block.view(block.dtype.str.replace('i', 'u'))
+        diff = np.empty_like(block)
+        diff[:, 0] = block[:, 0]
+        np.subtract(block[:, 1:], block[:, :-1], out=diff[:, 1:])
+        block = diff
+    data = block.view(np.uint8).reshape(-1, block.dtype.itemsize)
+    if shuffle:
+        data = data.T
+    return np.ascontiguousarray(data).tobytes()
+
+
+def _decode_block(data, dtype, rows, points, delta, shuffle):
+    dtype = np.dtype(dtype)
+    data = np.frombuffer(data, dtype=np.uint8)
+    if shuffle:
+        data = data.reshape(dtype.itemsize, -1).T
+    block = np.ascontiguousarray(data)
+    if delta:
+        udtype = dtype.str.replace('i', 'u')
+        block = block.view(udtype).reshape(rows, points)
+        # cumsum() returns native byte order, so convert back before the view
+        block = np.cumsum(block, axis=1, dtype=block.dtype).astype(udtype, copy=False)
+    return block.view(dtype).reshape(rows, points)
+
+
+def save_compressed(filename, traces, block_traces=256, codec=None, level=None, workers=None):
+    """Save a (traces x points) array to filename in the compressed block format"""
+    traces = np.asarray(traces)
+    if traces.ndim != 2:
+        raise ValueError("Expected a 2D trace array, got shape %s" % (traces.shape,))
+    if codec is None:
+        codec = default_codec()
+    compress, _, default_level = codecs[codec]
+    if level is None:
+        level = default_level
+
+    delta = traces.dtype.kind in 'ui'
+    shuffle = traces.dtype.itemsize > 1
+    starts = range(0, traces.shape[0], block_traces)
+
+    def encode(start):
+        return compress(_encode_block(traces[start:start + block_traces], delta, shuffle), level)
+
+    tmpname = filename + ".tmp"
+    with ThreadPoolExecutor(workers or os.cpu_count()) as pool, open(tmpname, "wb") as f:
+        f.write(MAGIC)
+        offsets = []
+        for data in pool.map(encode, starts):
+            offsets.append([f.tell(), len(data)])
+            f.write(data)
+        footer = json.dumps({
+            "dtype": traces.dtype.str,
+            "shape": list(traces.shape),
+            "block_traces": block_traces,
+            "codec": codec,
+            "delta": delta,
+            "shuffle": shuffle,
+            "blocks": offsets,
+        }).encode()
+        f.write(footer)
+        f.write(_footer.pack(len(footer)) + MAGIC)
+    os.replace(tmpname, filename)
+
+
+class CompressedTraces(object):
+    """Read-only (traces x points) array of traces in a compressed file.
+
+    Blocks are decompressed when traces in them are indexed, and the last
+    cache_blocks of them are kept. Indexing several blocks at once (a
+    slice) decompresses them in parallel. Otherwise it works like the
+    memory-mapped trace array of the native format.
+
+    Args:
+        filename (str): .cwz file saved by :func:`save_compressed`.
+        cache_blocks (int): Number of decompressed blocks to keep.
+        workers (int): Threads decompressing blocks, None for the number of CPUs.
+    """
+    def __init__(self, filename, cache_blocks=8, workers=None):
+        self.filename = filename
+        self.cache_blocks = cache_blocks
+        self.workers = workers or os.cpu_count()
+        with open(filename, "rb") as f:
+            f.seek(-(_footer.size + len(MAGIC)), os.SEEK_END)
+            length = _footer.unpack(f.read(_footer.size))[0]
+            if f.read(len(MAGIC)) != MAGIC:
+                raise IOError("%s is not a compressed trace file" % filename)
+            f.seek(-(_footer.size + len(MAGIC) + length), os.SEEK_END)
+            info = json.loads(f.read(length).decode())
+        self.dtype = np.dtype(info["dtype"])
+        self.shape = tuple(info["shape"])
+        self.block_traces = info["block_traces"]
+        self.codec = info["codec"]
+        self._delta = info["delta"]
+        self._shuffle = info["shuffle"]
+        self._blocks = info["blocks"]
+        self._decompress = codecs[self.codec][1]
+        self._cache = OrderedDict()
+
+    ndim = 2
+
+    @property
+    def nbytes(self):
+        """Memory used by the decompressed blocks that are cached"""
+        return sum(block.nbytes for block in self._cache.values())
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _read_block(self, n):
+        offset, length = self._blocks[n]
+        with open(self.filename, "rb") as f:
+            f.seek(offset)
+            data = self._decompress(f.read(length))
+        rows = min(self.block_traces, self.shape[0] - n * self.block_traces)
+        block = _decode_block(data, self.dtype, rows, self.shape[1], self._delta, self._shuffle)
+        block.flags.writeable = False
+        return block
+
+    def blocks(self, numbers):
+        """Return the decompressed blocks with the given numbers"""
+        missing = [n for n in set(numbers) if n not in self._cache]
+        if len(missing) > 1:
+            with ThreadPoolExecutor(min(self.workers, len(missing))) as pool:
+                found = dict(zip(missing, pool.map(self._read_block, missing)))
+        else:
+            found = dict((n, self._read_block(n)) for n in missing)
+
+        result = []
+        for n in numbers:
+            block = found.get(n)
+            if block is None:
+                block = self._cache.pop(n)
+            self._cache[n] = block
+            result.append(block)
+        while len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return result
+
+    def _rows(self, rows):
+        if len(rows) == 0:
+            return np.empty((0, self.shape[1]), dtype=self.dtype)
+        numbers = list(OrderedDict.fromkeys(r // self.block_traces for r in rows))
+        if len(numbers) == 1:
+            block = self.blocks(numbers)[0]
+            return block[np.asarray(rows) % self.block_traces]
+        blocks = dict(zip(numbers, self.blocks(numbers)))
+        out = np.empty((len(rows), self.shape[1]), dtype=self.dtype)
+        for i, r in enumerate(rows):
+            out[i] = blocks[r // self.block_traces][r % self.block_traces]
+        return out
+
+    def _slice(self, key):
+        start, stop, step = key.indices(self.shape[0])
+        if step != 1:
+            return self._rows(range(start, stop, step))
+        if stop <= start:
+            return np.empty((0, self.shape[1]), dtype=self.dtype)
+        bt = self.block_traces
+        first, last = start // bt, (stop - 1) // bt
+        blocks = self.blocks(list(range(first, last + 1)))
+        if len(blocks) == 1:
+            return blocks[0][start - first * bt:stop - first * bt]
+        out = np.empty((stop - start, self.shape[1]), dtype=self.dtype)
+        for n, block in zip(range(first, last + 1), blocks):
+            lo, hi = max(start, n * bt), min(stop, n * bt + len(block))
+            out[lo - start:hi - start] = block[lo - n * bt:hi - n * bt]
+        return out
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            if len(key) == 0:
+                return self[:]
+            rows = self[key[0]]
+            if np.ndim(rows) == 1:
+                return rows[key[1:]]
+            return rows[(slice(None),) + key[1:]]
+        if isinstance(key, slice):
+            return self._slice(key)
+        if isinstance(key, (int, np.integer)):
+            n = int(key)
+            if n < 0:
+                n += self.shape[0]
+            if not 0 <= n < self.shape[0]:
+                raise IndexError("index %d is out of bounds for %d traces" % (key, self.shape[0]))
+            return self.blocks([n // self.block_traces])[0][n % self.block_traces]
+        rows = np.arange(self.shape[0])[key]
+        return self._rows(rows.tolist())
+
+    def __iter__(self):
+        for n in range(len(self._blocks)):
+            for row in self.blocks([n])[0]:
+                yield row
+
+    def __array__(self, dtype=None, copy=None):
+        # Can be a read-only cached block, so copied unless copy=False
+        traces = self[:]
+        if copy is False:
+            if dtype is not None and traces.dtype != np.dtype(dtype):
+                raise ValueError("Unable to convert to {} without a copy".format(dtype))
+            return traces
+        return np.array(traces, dtype=dtype, copy=True)
+
+
+class TraceContainerCompressed(TraceContainerNative):
+    """Native trace container that saves the traces compressed (see module docstring).
+
+    Traces are read back a block at a time, so opening a segment doesn't
+    decompress all of it. Saved segments are read-only like native ones.
+
+    Use it for new segments of a project with::
+
+        project.set_trace_format("compressed")
+
+    Attributes:
+        codec (str): "zstd" (if installed), "zlib" or "lzma".
+        level (int): Compression level, None for the codec's default.
+        block_traces (int): Number of traces compressed together.
+        workers (int): Threads (de)compressing blocks, None for the number of CPUs.
+    """
+    _name = "ChipWhisperer/Compressed"
+    _files = TraceContainerNative._files[:1] + ("%straces.cwz",) + TraceContainerNative._files[2:]
+
+    codec = None
+    level = None
+    block_traces = 256
+    workers = None
+
+    def clear(self):
+        TraceContainerNative.clear(self)
+        self.config.setAttr("format", "compressed")
+
+    def loadAllTraces(self, directory=None, prefix=""):
+        if self.config.configFilename():
+            if directory is None:
+                directory = os.path.split(self.config.configFilename())[0]
+            if prefix is None or prefix == '':
+                prefix = self.config.attr("prefix")
+
+        filename = os.path.join(directory, "%straces.cwz" % prefix)
+        if os.path.isfile(filename):
+            traces = CompressedTraces(filename, workers=self.workers)
+        else:
+            # Segment saved without traces
+            traces = None
+        self._loadAux(directory, prefix)
+        self.traces = traces
+        self.loadSampleScale()
+
+    def _saveTraces(self, filename, traces):
+        tracefile = filename[:-len("npy")] + "cwz"
+        if traces is None:
+            if os.path.isfile(tracefile):
+                os.remove(tracefile)
+        elif isinstance(traces, CompressedTraces) and os.path.abspath(traces.filename) == os.path.abspath(tracefile):
+            # Already saved there
+            pass
+        else:
+            save_compressed(tracefile, traces, self.block_traces, self.codec, self.level, self.workers)
@@ -22,18 +22,32 @@
 #    You should have received a copy of the GNU General Public License
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 
+import logging
 import os
 import numpy as np
 from datetime import datetime
 from ._base import TraceContainer
+from . import journal
+from chipwhisperer.common.utils.tracesource import rows_to_array
 
 class TraceContainerNative(TraceContainer):
     """ Most common TraceContainer for CW Projects
 
     Stick to add_trace().
+
+    Text and keys are saved as (traces x bytes) uint8 arrays, which are
+    memory-mapped like the traces when loaded. Segments saved by older
+    versions as Python objects are converted the first time they are opened.
+
+    If the project's journal attribute is set, added traces are also
+    appended to a journal file (see :mod:`chipwhisperer.common.traces.journal`),
+    and full segments are saved and unloaded by compactJournal().
     """
     _name = "ChipWhisperer/Native"
-    
+    _journal = None
+    #: Files a segment is saved to, formatted with its prefix
+    _files = ("config_%s.cfg", "%straces.npy", "%stextin.npy", "%stextout.npy", "%skeylist.npy", "%sknownkey.npy")
+
     def default_config_setup(self, project):
         starttime = datetime.now()
         prefix = starttime.strftime('%Y.%m.%d-%H.%M.%S') + "_"
@@ -41,6 +55,47 @@ class TraceContainerNative(TraceContainer):
         self.config.setAttr("prefix", prefix)
         self.config.setAttr("date", starttime.strftime('%Y-%m-%d %H:%M:%S'))
 
+    def add_trace(self, trace, textin, textout, key, dtype=np.double, channelNum=0):
+        TraceContainer.add_trace(self, trace, textin, textout, key, dtype, channelNum)
+        if getattr(self.project, 'journal', False):
+            if self._journal is None:
+                self._journal = journal.TraceJournal.create(os.path.join(self.project.datadirectory, "traces"),
+                                                            self.project.journal_sync_interval)
+            self._journal.append(trace, textin, textout, key)
+
+    addTrace = add_trace
+
+    def compactJournal(self):
+        """Save the traces of a journaled segment to the traces directory, then remove the journal and unload them"""
+        if self._journal is None:
+            return
+
+        directory = os.path.dirname(self._journal.filename)
+        replaced = self.config.configFilename()
+        if replaced is None or not os.path.isfile(replaced):
+            replaced = None
+
+        # Named after the journal, which is named after the time it was created
+        prefix = os.path.splitext(os.path.basename(self._journal.filename))[0][len("journal_"):] + "_"
+        self.config.setConfigFilename(os.path.join(directory, "config_" + prefix + ".cfg"))
+        self.config.setAttr("prefix", prefix)
+        self.config.setAttr("date", datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        self.saveAllTraces(directory, prefix)
+
+        for name in self._files:
+            with open(os.path.join(directory, name % prefix), "rb") as f:
+                os.fsync(f.fileno())
+
+        journal.add_to_index(directory, self.config.configFilename(), self._journal.filename, replaced)
+        self._journal.remove()
+        self._journal = None
+        self.unloadAllTraces()
+
+    def removeJournal(self):
+        if self._journal is not None:
+            self._journal.remove()
+            self._journal = None
+
     def copyTo(self, srcTraces=None):
         self.numTrace = srcTraces.numTraces()
         self.numPoint = srcTraces.numPoints()
@@ -75,18 +130,29 @@ class TraceContainerNative(TraceContainer):
             if prefix is None or prefix == '':
                 prefix = self.config.attr("prefix")
 
-        self.traces = np.load(os.path.join(directory, "%straces.npy" % prefix), mmap_mode='r', allow_pickle=True)
-        self.textins = np.load(os.path.join(directory, "%stextin.npy" % prefix), allow_pickle=True)
-        self.textouts = np.load(os.path.join(directory, "%stextout.npy" % prefix), allow_pickle=True)
+        try:
+            self.traces = np.load(os.path.join(directory, "%straces.npy" % prefix), mmap_mode='r', allow_pickle=True)
+        except ValueError:
+            # Segment saved without traces
+            self.traces = np.load(os.path.join(directory, "%straces.npy" % prefix), allow_pickle=True)
+            if self.traces.ndim == 0:
+                self.traces = None
+        self.loadSampleScale()
+        self._loadAux(directory, prefix)
+
+    def _loadAux(self, directory, prefix):
+        """Load the text and keys of a segment"""
+        self.textins = self._loadRows(os.path.join(directory, "%stextin.npy" % prefix))
+        self.textouts = self._loadRows(os.path.join(directory, "%stextout.npy" % prefix))
 
         try:
-            self.knownkey = np.load(os.path.join(directory, "%sknownkey.npy" % prefix), allow_pickle=True)
+            self.knownkey = self._loadRows(os.path.join(directory, "%sknownkey.npy" % prefix), mmap=False)
         except IOError:
             self.knownkey = None
 
         # OK if this fails
         try:
-            self.keylist = np.load(os.path.join(directory, "%skeylist.npy" % prefix), allow_pickle=True)
+            self.keylist = self._loadRows(os.path.join(directory, "%skeylist.npy" % prefix))
         except IOError:
             self.keylist = None
 
@@ -94,8 +160,69 @@ class TraceContainerNative(TraceContainer):
         self.setDirty(False)
         self._isloaded = True
 
+    @staticmethod
+    def _loadRows(filename, mmap=True):
+        """Load a text/key file, converting it to a uint8 array if it was saved as Python objects"""
+        try:
+            return np.load(filename, mmap_mode='r' if mmap else None, allow_pickle=False)
+        except ValueError:
+            pass
+
+        # Saved by an older version as a list of bytearrays (or None), needs unpickling once
+        data = np.load(filename, allow_pickle=True)
+        if data.ndim == 0:
+            return data
+        rows = rows_to_array(data)
+        if rows.dtype != np.uint8:
+            return data
+
+        try:
+            TraceContainerNative._saveArray(filename, rows)
+        except OSError as e:
+            logging.warning("Could not convert %s to uint8 array: %s" % (filename, e))
+            return rows
+        return np.load(filename, mmap_mode='r' if mmap else None, allow_pickle=False)
+
+    @staticmethod
+    def _saveArray(filename, data):
+        # Written to a new file and renamed, as data may be memory-mapped from the old one
+        tmpname = filename + ".tmp.npy"
+        np.save(tmpname, data)
+        os.replace(tmpname, filename)
+
+    def _saveTraces(self, filename, traces):
+        self._saveArray(filename, traces)
+
+    @staticmethod
+    def _saveRows(filename, rows):
+        """Save text/keys as a uint8 array if possible"""
+        if rows is not None:
+            array = rows_to_array(rows)
+            if array.dtype == np.uint8:
+                rows = array
+        TraceContainerNative._saveArray(filename, rows)
+
+    @staticmethod
+    def _bytesRow(row):
+        """A single text/key row as a bytearray, like it was captured, instead of a row of the uint8 array"""
+        if isinstance(row, np.ndarray) and row.ndim == 1 and row.dtype == np.uint8:
+            return bytearray(row)
+        return row
+
+    def getTextin(self, n):
+        return self._bytesRow(TraceContainer.getTextin(self, n))
+
+    def getTextout(self, n):
+        return self._bytesRow(TraceContainer.getTextout(self, n))
+
+    def getKnownKey(self, n=0):
+        return self._bytesRow(TraceContainer.getKnownKey(self, n))
+
     def unloadAllTraces(self):
         """Drop traces from memory to save space """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
         self.traces = None
         self.textins = None
         self.textouts = None
@@ -126,11 +253,22 @@ class TraceContainerNative(TraceContainer):
 
     def saveAllTraces(self, directory, prefix=""):
         self.config.saveTrace()
-        np.save(os.path.join(directory, "%straces.npy" % prefix), self.traces)
-        np.save(os.path.join(directory, "%stextin.npy" % prefix), self.textins)
-        np.save(os.path.join(directory, "%stextout.npy" % prefix), self.textouts)
-        np.save(os.path.join(directory, "%skeylist.npy" % prefix), self.keylist)
-        np.save(os.path.join(directory, "%sknownkey.npy" % prefix), self.knownkey)
+        traces = self.traces
+        if isinstance(traces, np.ndarray):
+            # Rows allocated for traces that haven't been added aren't saved
+            traces = traces[:self.numTraces()]
+        self._saveTraces(os.path.join(directory, "%straces.npy" % prefix), traces)
+        self._saveRows(os.path.join(directory, "%stextin.npy" % prefix), self.textins)
+        self._saveRows(os.path.join(directory, "%stextout.npy" % prefix), self.textouts)
+        self._saveRows(os.path.join(directory, "%skeylist.npy" % prefix), self.keylist)
+
+        knownkey = self.knownkey
+        try:
+            if knownkey is not None:
+                knownkey = np.asarray(knownkey, dtype=np.uint8)
+        except (ValueError, TypeError, OverflowError):
+            pass
+        self._saveArray(os.path.join(directory, "%sknownkey.npy" % prefix), knownkey)
         self.setDirty(False)
 
     def closeAll(self, clearTrace=True, clearText=True, clearKeys=True):
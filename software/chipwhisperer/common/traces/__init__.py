@@ -1,3 +1,86 @@
 from collections import namedtuple
 
-Trace = namedtuple('Trace', 'wave textin textout key')
\ No newline at end of file
+import numpy as np
+
+Trace = namedtuple('Trace', 'wave textin textout key')
+
+
+class RawWave(np.ndarray):
+    """Trace samples kept as the scope's integer ADC codes.
+
+    The sample values are codes * gain + offset (see :meth:`to_float`).
+    Trace containers store the codes as they are (2 bytes per sample for
+    OpenADC scopes, 1 for the Nano, instead of 8) and record gain and offset
+    in the segment config, converting the traces when they are read back.
+
+    Arithmetic on a RawWave works on the codes and returns plain arrays.
+
+    Args:
+        codes (array): Integer ADC codes.
+        gain (float): Value of one ADC code.
+        offset (float): Value of code 0.
+    """
+    def __new__(cls, codes, gain=1.0, offset=0.0):
+        obj = np.asarray(codes).view(cls)
+        obj.gain = gain
+        obj.offset = offset
+        return obj
+
+    def __array_finalize__(self, obj):
+        self.gain = getattr(obj, 'gain', 1.0)
+        self.offset = getattr(obj, 'offset', 0.0)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(np.asarray(i) if isinstance(i, RawWave) else i for i in inputs)
+        if 'out' in kwargs:
+            kwargs['out'] = tuple(np.asarray(o) if isinstance(o, RawWave) else o for o in kwargs['out'])
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __reduce__(self):
+        return RawWave, (np.asarray(self), self.gain, self.offset)
+
+    def to_float(self, dtype=np.float64):
+        """Return the sample values as a (plain) float array"""
+        return scale_codes(np.asarray(self), self.gain, self.offset, dtype)
+
+
+def scale_codes(codes, gain, offset, dtype=np.float64):
+    """Return codes * gain + offset as a new dtype array"""
+    values = np.multiply(codes, gain, dtype=dtype)
+    values += offset
+    return values
+
+
+class TraceBatch(object):
+    """Several traces, stored by column.
+
+    Returned when slicing :attr:`project.traces <chipwhisperer.common.api.ProjectFormat.Project.traces>`.
+    Indexing with an integer returns a :class:`Trace`, slices and index
+    arrays return another TraceBatch. Iterating yields :class:`Trace` objects.
+
+    Attributes:
+        waves (array): (traces x points) array of the trace samples.
+        textins (array): One row per trace.
+        textouts (array): One row per trace.
+        keys (array): One row per trace.
+    """
+    def __init__(self, waves, textins, textouts, keys):
+        self.waves = waves
+        self.textins = textins
+        self.textouts = textouts
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.waves)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return Trace(self.waves[item], self.textins[item], self.textouts[item], self.keys[item])
+        return TraceBatch(self.waves[item], self.textins[item], self.textouts[item], self.keys[item])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return 'TraceBatch(number={}, points={})'.format(len(self), self.waves.shape[1] if self.waves.ndim > 1 else 0)
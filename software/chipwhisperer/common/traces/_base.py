@@ -27,7 +27,9 @@ import logging
 import re
 import numpy as np
 from . import _cfgfile
+from . import RawWave, scale_codes
 from chipwhisperer.common.utils.parameter import Parameterized
+from chipwhisperer.common.utils.tracesource import rows_to_array
 
 
 class TraceContainer(Parameterized):
@@ -39,6 +41,11 @@ class TraceContainer(Parameterized):
     adds functions for reading/storing data in the 'native' ChipWhisperer format.
     """
     _name = "Trace Configuration"
+
+    #: Most memory allocated for traces before they arrive, in bytes (see addWave())
+    prealloc_bytes = 256 * 1024 * 1024
+    #: Traces a project puts in one segment of this format, None for the project's default
+    segment_length = None
     
     def __init__(self, configfile=None, project=None, default_setup=False):
         self.configfile = configfile
@@ -68,6 +75,7 @@ class TraceContainer(Parameterized):
         self.pointhint = 0
         self._numTraces = 0
         self._isloaded = False
+        self.loadSampleScale()
 
     def setDirty(self, dirty):
         self.dirty = dirty
@@ -104,7 +112,7 @@ class TraceContainer(Parameterized):
         self.addTextin(textin)
         self.addTextout(textout)
         self.addKey(key)
-        self.project.trace_manager()._updateRanges()
+        self.project.trace_manager()._traceAdded(self)
 
     addTrace = add_trace
 
@@ -112,23 +120,57 @@ class TraceContainer(Parameterized):
         self.config.setAttr("numTraces", self._numTraces)
         self.config.setAttr("numPoints", self.numPoints())      
 
+    def loadSampleScale(self):
+        """Get the scale of integer trace data from the config"""
+        self.sample_gain = float(self.config.attr("sampleGain"))
+        self.sample_offset = float(self.config.attr("sampleOffset"))
+
+    def setSampleScale(self, gain, offset):
+        """Store that the trace data is integer codes, with values codes * gain + offset"""
+        self.sample_gain = float(gain)
+        self.sample_offset = float(offset)
+        self.config.setAttr("sampleGain", self.sample_gain)
+        self.config.setAttr("sampleOffset", self.sample_offset)
+
+    def isScaled(self):
+        """True if the trace data is integer codes that are converted when read"""
+        return self.traces is not None and self.traces.dtype.kind in 'ui' and \
+            (self.sample_gain, self.sample_offset) != (1.0, 0.0)
+
     def addWave(self, trace, dtype=None):
+        """Add a trace to the trace array.
+
+        The array is allocated for tracehint traces (up to prealloc_bytes)
+        at the first trace. After that it doubles in size whenever it is
+        full, so adding N traces copies O(N) traces in total.
+        """
         try:
             if self.traces is None:
                 if dtype is None:
                     dtype = np.double
+                if isinstance(trace, RawWave):
+                    # Keep the codes, values are converted when read
+                    dtype = trace.dtype
+                    self.setSampleScale(trace.gain, trace.offset)
                 self.tracedtype = dtype
-                self.traces = np.zeros((self.tracehint, len(trace)), dtype=dtype)
+                rowbytes = max(len(trace) * np.dtype(dtype).itemsize, 1)
+                rows = max(min(self.tracehint, self.prealloc_bytes // rowbytes), 1)
+                self.traces = np.zeros((rows, len(trace)), dtype=dtype)
                 self.traces[self._numTraces][:] = trace
             else:
                 # Check can fit this
                 if self.traces.shape[0] <= self._numTraces:
-                    if self._numTraces >= self.tracehint:
-                        # Tracehint wrong - increase by 25
-                        self.tracehint += 25
-
-                    # Do a resize now to allocate more memory
-                    self.traces.resize((self.tracehint, self.traces.shape[1]))
+                    rows = max(2 * self.traces.shape[0], 25)
+                    if self._numTraces < self.tracehint:
+                        rows = min(rows, self.tracehint)
+                    traces = np.zeros((rows, self.traces.shape[1]), dtype=self.traces.dtype)
+                    traces[:self._numTraces] = self.traces[:self._numTraces]
+                    self.traces = traces
+
+                if self.traces.dtype.kind in 'ui':
+                    trace = self._toCodes(trace)
+                elif isinstance(trace, RawWave):
+                    trace = trace.to_float()
 
                 #Validate traces fit - if too short warn & pad (prevents aborting long captures)
                 pad = self.traces.shape[1] - len(trace)
@@ -139,12 +181,30 @@ class TraceContainer(Parameterized):
 
                 self.traces[self._numTraces][:] = trace
         except MemoryError:
-            raise Warning("Failed to allocate/resize array for %d x %d, if you have sufficient memory it may be fragmented. Use smaller segments and retry." % (self.tracehint, self.traces.shape[1]))
+            raise Warning("Failed to allocate/resize array for %d x %d, if you have sufficient memory it may be fragmented. Use smaller segments and retry." % (self._numTraces + 1, len(trace)))
             
         self._numTraces += 1
         self.setDirty(True)
         self.writeDataToConfig()
 
+    def _toCodes(self, trace):
+        """Return trace as the integer codes stored in this segment.
+
+        Raises:
+            ValueError: The values of trace aren't codes of this segment.
+        """
+        gain, offset = self.sample_gain, self.sample_offset
+        if isinstance(trace, RawWave) and (trace.gain, trace.offset) == (gain, offset):
+            return np.asarray(trace)
+        values = trace.to_float() if isinstance(trace, RawWave) else np.asarray(trace, dtype=np.float64)
+        codes = np.rint((values - offset) / gain)
+        info = np.iinfo(self.traces.dtype)
+        if codes.size and (codes.min() < info.min or codes.max() > info.max or
+                           np.max(np.abs(codes * gain + offset - values)) > abs(gain) * 1e-3):
+            raise ValueError("Trace values aren't %s codes * %g + %g like the rest of the segment" %
+                             (self.traces.dtype, gain, offset))
+        return codes.astype(self.traces.dtype)
+
     def setKnownKey(self, key):
         self.knownkey = key
 
@@ -157,12 +217,15 @@ class TraceContainer(Parameterized):
     def addTextout(self, data):
         self.textouts.append(data)
         
-    def getTrace(self, n):
+    def getTrace(self, n, raw=False):
+        """Return trace n. Integer trace data is converted to values unless raw is True"""
         data = self.traces[n]
 
         #Following line will normalize all traces relative to each
         #other by mean & standard deviation
         #data = (data - np.mean(data)) / np.std(data)
+        if not raw and self.isScaled():
+            data = scale_codes(data, self.sample_gain, self.sample_offset)
         return data
 
     def getTextin(self, n):
@@ -177,6 +240,25 @@ class TraceContainer(Parameterized):
                 return self.keylist[n]
 
         return self.knownkey
+
+    def get_trace_block(self, start, stop, point_range=None):
+        """Get traces start to stop-1 of this container, see TraceSource.get_trace_block()
+
+        The traces are a slice of the trace array (a memmap for saved traces), not a copy,
+        unless they are stored as integer codes, which are converted.
+        """
+        if point_range is not None:
+            traces = self.traces[start:stop, point_range[0]:point_range[1]]
+        else:
+            traces = self.traces[start:stop]
+        if self.isScaled():
+            traces = scale_codes(traces, self.sample_gain, self.sample_offset)
+
+        if getattr(self, 'keylist', None) is not None:
+            keys = self.keylist[start:stop]
+        else:
+            keys = [self.knownkey] * (stop - start)
+        return traces, rows_to_array(self.textins[start:stop]), rows_to_array(self.textouts[start:stop]), rows_to_array(keys)
     
     def getAuxDataConfig(self, newmodule):
         """
@@ -270,6 +352,14 @@ class TraceContainer(Parameterized):
     def saveAllTraces(self, directory, prefix=""):
         """Placeholder for save command."""
         raise AttributeError("%s doesn't have this method implemented"%self.__class__.__name__)
+
+    def compactJournal(self):
+        """Placeholder called when a segment is full, to save its traces if they were journaled"""
+        pass
+
+    def removeJournal(self):
+        """Placeholder called once the traces of a segment were saved with the project, to remove its journal"""
+        pass
     
     def copyTo(self, srcTraces=None, srcFormat=None):
         """Placeholder for copy/import command. Different from load as copies data INTO this classes format, possibly from another format"""
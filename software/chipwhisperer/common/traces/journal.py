@@ -0,0 +1,247 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2020, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+"""Append-only journal of captured traces, so they survive a crash before the project is saved.
+
+A journal file holds the traces of one segment. It starts with MAGIC,
+followed by one record per trace: the payload length and CRC32 (uint32
+each), then the payload. A record that was only partly written when the
+capture stopped fails the length or CRC check, and it and anything after
+it are ignored.
+
+When a segment is full, it is saved in the normal segment layout, its
+config file is added to the journal index, and its journal is removed.
+Saving the project clears the index and the journals. Opening the project
+adds back the segments in the index and the traces in the journals (see
+TraceManager.recover_journals()).
+"""
+
+import logging
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+from . import Trace, RawWave
+
+MAGIC = b"CWJ1"
+INDEX = "journal.idx"
+
+_header = struct.Struct("<II")
+_scale = struct.Struct("<dd")
+_length = struct.Struct("<I")
+
+_NONE, _BYTES = 0, 1
+
+
+def _field(data):
+    return _length.pack(len(data)) + data
+
+
+def _obj(value):
+    """Text/key as None or uint8 bytes, the only types saved in a journal"""
+    if value is None:
+        return bytes([_NONE])
+    if not isinstance(value, (bytes, bytearray)):
+        array = np.asarray(value)
+        if array.ndim != 1 or (array.size and (array.dtype.kind not in 'ui' or array.min() < 0 or array.max() > 255)):
+            raise TypeError("Text and keys must be bytes to be journaled, got %r" % (value,))
+        value = array.astype(np.uint8).tobytes()
+    return bytes([_BYTES]) + _field(bytes(value))
+
+
+def _pack_trace(wave, textin, textout, key):
+    gain, offset = getattr(wave, 'gain', 1.0), getattr(wave, 'offset', 0.0)
+    wave = np.ascontiguousarray(wave)
+    return b"".join([_scale.pack(gain, offset), _field(wave.dtype.str.encode()), _field(wave.tobytes()),
+                     _obj(textin), _obj(textout), _obj(key)])
+
+
+def _unpack_trace(payload):
+    pos = [_scale.size]
+
+    def field():
+        length, = _length.unpack_from(payload, pos[0])
+        start = pos[0] + _length.size
+        pos[0] = start + length
+        return payload[start:start + length]
+
+    def obj():
+        tag = payload[pos[0]]
+        pos[0] += 1
+        if tag == _NONE:
+            return None
+        if tag != _BYTES:
+            raise ValueError("Unknown field type %d" % tag)
+        return bytearray(field())
+
+    gain, offset = _scale.unpack_from(payload, 0)
+    dtype = np.dtype(field().decode())
+    wave = np.frombuffer(field(), dtype=dtype).copy()
+    if (gain, offset) != (1.0, 0.0):
+        wave = RawWave(wave, gain, offset)
+    return Trace(wave, obj(), obj(), obj())
+
+
+class TraceJournal(object):
+    """Journal file the traces of one segment are appended to.
+
+    Every trace is written to the file straight away, so it survives the
+    capture program crashing. The file is also synced to disk at most every
+    sync_interval seconds, which bounds what a power failure can lose.
+
+    Args:
+        filename (str): Journal file, appended to if it exists.
+        sync_interval (float): Longest time between syncs to disk, in seconds.
+    """
+    def __init__(self, filename, sync_interval=1.0):
+        self.filename = filename
+        self.sync_interval = sync_interval
+        self._file = open(filename, "ab", buffering=0)
+        if self._file.tell() == 0:
+            self._write(MAGIC)
+        self._lastsync = time.perf_counter()
+
+    @classmethod
+    def create(cls, directory, sync_interval=1.0):
+        """Create a new journal in directory, named after the current time"""
+        stamp = datetime.now().strftime('%Y.%m.%d-%H.%M.%S.%f')
+        n = 0
+        while True:
+            filename = os.path.join(directory, "journal_%s_%d.cwj" % (stamp, n))
+            try:
+                open(filename, "xb").close()
+                return cls(filename, sync_interval)
+            except FileExistsError:
+                n += 1
+
+    def _write(self, data):
+        view = memoryview(data)
+        while len(view):
+            view = view[self._file.write(view):]
+
+    def append(self, wave, textin, textout, key):
+        payload = _pack_trace(wave, textin, textout, key)
+        self._write(_header.pack(len(payload), zlib.crc32(payload)) + payload)
+        if time.perf_counter() - self._lastsync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Make sure everything appended so far is on the disk"""
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._lastsync = time.perf_counter()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        os.remove(self.filename)
+
+
+def read_journal(filename):
+    """Return the traces in a journal file, up to the first incomplete record"""
+    traces = []
+    with open(filename, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        logging.warning("%s is not a trace journal" % filename)
+        return traces
+
+    pos = len(MAGIC)
+    while pos < len(data):
+        if pos + _header.size > len(data):
+            break
+        length, crc = _header.unpack_from(data, pos)
+        payload = data[pos + _header.size:pos + _header.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            break
+        try:
+            traces.append(_unpack_trace(payload))
+        except ValueError as e:
+            logging.warning("Bad trace record in %s: %s" % (filename, e))
+            break
+        pos += _header.size + length
+
+    if pos < len(data):
+        logging.warning("Ignoring incomplete trace at the end of %s (%d bytes)" % (filename, len(data) - pos))
+    return traces
+
+
+def find_journals(directory):
+    """Return the journal files in directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory))
+            if f.startswith("journal_") and f.endswith(".cwj")]
+
+
+def add_to_index(directory, configfile, journalfile, replaced=None):
+    """Record that the segment in journalfile was saved with configfile.
+
+    replaced is the config file the segment was saved with before (with
+    the project), if any.
+    """
+    names = [os.path.basename(f) if f else "" for f in (configfile, journalfile, replaced)]
+    with open(os.path.join(directory, INDEX), "a") as f:
+        f.write("\t".join(names) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_index(directory):
+    """Return (config file, journal file, replaced config file or None) of the segments
+    saved from journals since the project was saved"""
+    try:
+        with open(os.path.join(directory, INDEX)) as f:
+            lines = f.read().splitlines()
+    except IOError:
+        return []
+    entries = []
+    for line in lines:
+        names = line.split("\t")
+        if len(names) == 3:
+            entries.append(tuple(os.path.join(directory, name) if name else None for name in names))
+    return entries
+
+
+def clear_index(directory):
+    try:
+        os.remove(os.path.join(directory, INDEX))
+    except FileNotFoundError:
+        pass
+
+
+def remove_all(directory):
+    """Remove the journals and the index in directory, e.g. of a project that is overwritten"""
+    for filename in find_journals(directory):
+        os.remove(filename)
+    clear_index(directory)
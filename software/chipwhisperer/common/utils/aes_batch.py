@@ -0,0 +1,261 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2020, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+"""AES-128/192/256 on many blocks at once, with NumPy.
+
+Blocks are (N x 16) uint8 arrays, with the bytes in the same order as
+:class:`AESCipher <chipwhisperer.common.utils.aes_cipher.AESCipher>` (byte r
+of column c of the state is byte 4*c + r). Keys are 16, 24 or 32 bytes:
+one key for all blocks, or an (N x key length) array with a key per block.
+
+Encryption works on the four 32-bit columns of the state with T-tables,
+so SubBytes, ShiftRows and MixColumns of a round are 16 table lookups
+for all the blocks. The round operations are also available separately
+(subbytes(), shiftrows(), mixcolumns(), ...), working on the last axis of
+(..., 16) arrays, for computing intermediate values.
+
+Example::
+
+    from chipwhisperer.common.utils import aes_batch
+    ct = aes_batch.encrypt(pt, key)
+    # states[:, r] is the state after round r
+    ct, states = aes_batch.encrypt(pt, key, states=True)
+"""
+
+import numpy as np
+
+from . import aes_tables
+
+SBOX = np.array(aes_tables.sbox, dtype=np.uint8)
+INV_SBOX = np.array(aes_tables.i_sbox, dtype=np.uint8)
+_MUL = dict((n, np.array(table, dtype=np.uint8)) for n, table in
+            [(2, aes_tables.gal2), (3, aes_tables.gal3), (9, aes_tables.gal9),
+             (11, aes_tables.gal11), (13, aes_tables.gal13), (14, aes_tables.gal14)])
+
+#: Byte of the input each byte of the ShiftRows output comes from
+_SHIFT = np.array([4 * ((c + r) % 4) + r for c in range(4) for r in range(4)])
+_INV_SHIFT = np.argsort(_SHIFT)
+
+# T-tables: the MixColumns column for an S-box output in row r. The bytes
+# are viewed as native uint32s, like the columns of the state.
+_TE_BYTES = np.stack([_MUL[2][SBOX], SBOX, SBOX, _MUL[3][SBOX]], axis=1)
+_TE = [np.ascontiguousarray(np.roll(_TE_BYTES, r, axis=1)).view(np.uint32)[:, 0] for r in range(4)]
+
+# The same as Python ints (little-endian) for single blocks
+_TE_LIST = [np.ascontiguousarray(np.roll(_TE_BYTES, r, axis=1)).view('<u4')[:, 0].tolist() for r in range(4)]
+_SBOX_LIST = SBOX.tolist()
+
+
+def subbytes(state):
+    return SBOX[state]
+
+
+def inv_subbytes(state):
+    return INV_SBOX[state]
+
+
+def shiftrows(state):
+    return np.asarray(state)[..., _SHIFT]
+
+
+def inv_shiftrows(state):
+    return np.asarray(state)[..., _INV_SHIFT]
+
+
+def _mix(state, m):
+    state = np.asarray(state, dtype=np.uint8)
+    cols = state.reshape(state.shape[:-1] + (4, 4))
+    out = np.empty_like(cols)
+    for r in range(4):
+        # Row r of the matrix is m rotated right by r
+        terms = [cols[..., i] if m[(i - r) % 4] == 1 else _MUL[m[(i - r) % 4]][cols[..., i]] for i in range(4)]
+        out[..., r] = terms[0] ^ terms[1] ^ terms[2] ^ terms[3]
+    return out.reshape(state.shape)
+
+
+def mixcolumns(state):
+    return _mix(state, (2, 3, 1, 1))
+
+
+def inv_mixcolumns(state):
+    return _mix(state, (14, 11, 13, 9))
+
+
+def expand_key(key, rounds=None):
+    """Return the round keys of key as a (rounds + 1 x 16) uint8 array.
+
+    For an (N x key length) array of keys, returns (N x rounds + 1 x 16).
+    rounds can be given to only compute the first round keys.
+    """
+    key = np.asarray(key, dtype=np.uint8)
+    if key.shape[-1] not in (16, 24, 32):
+        raise ValueError("Invalid key length: %d bytes" % key.shape[-1])
+    nk = key.shape[-1] // 4
+    nr = nk + 6 if rounds is None else rounds
+    nw = 4 * (nr + 1)
+    w = np.empty(key.shape[:-1] + (max(nw, nk), 4), dtype=np.uint8)
+    w[..., :nk, :] = key.reshape(key.shape[:-1] + (nk, 4))
+    rcon = 1
+    for i in range(nk, nw):
+        temp = w[..., i - 1, :]
+        if i % nk == 0:
+            temp = SBOX[np.roll(temp, -1, axis=-1)]
+            temp[..., 0] ^= rcon
+            rcon = _MUL[2][rcon]
+        elif nk > 6 and i % nk == 4:
+            temp = SBOX[temp]
+        w[..., i, :] = w[..., i - nk, :] ^ temp
+    return w[..., :nw, :].reshape(key.shape[:-1] + (nr + 1, 16))
+
+
+def _blocks(blocks):
+    blocks = np.ascontiguousarray(blocks, dtype=np.uint8)
+    if blocks.ndim != 2 or blocks.shape[1] != 16:
+        raise ValueError("Expected (N x 16) blocks, got shape %s" % (blocks.shape,))
+    return blocks
+
+
+def _encrypt(blocks, rk, states):
+    nr = rk.shape[-2] - 1
+    rk32 = rk.view(np.uint32)
+    s = blocks.view(np.uint32) ^ rk32[..., 0, :]
+    if states:
+        out = np.empty((len(blocks), nr + 1, 16), dtype=np.uint8)
+        out[:, 0] = s.view(np.uint8)
+    t = np.empty_like(s)
+    for r in range(1, nr):
+        b = s.view(np.uint8)
+        for c in range(4):
+            t[:, c] = (_TE[0][b[:, 4 * c]] ^ _TE[1][b[:, 4 * ((c + 1) % 4) + 1]] ^
+                       _TE[2][b[:, 4 * ((c + 2) % 4) + 2]] ^ _TE[3][b[:, 4 * ((c + 3) % 4) + 3]])
+        t ^= rk32[..., r, :]
+        s, t = t, s
+        if states:
+            out[:, r] = s.view(np.uint8)
+    ct = SBOX[s.view(np.uint8)[:, _SHIFT]] ^ rk[..., nr, :]
+    if states:
+        out[:, nr] = ct
+        return ct, out
+    return ct
+
+
+def _decrypt(blocks, rk, states):
+    nr = rk.shape[-2] - 1
+    s = blocks ^ rk[..., nr, :]
+    if states:
+        out = np.empty((len(blocks), nr + 1, 16), dtype=np.uint8)
+        out[:, 0] = s
+    for r in range(nr - 1, -1, -1):
+        s = INV_SBOX[s[:, _INV_SHIFT]] ^ rk[..., r, :]
+        if r > 0:
+            s = inv_mixcolumns(s)
+        if states:
+            out[:, nr - r] = s
+    if states:
+        return s, out
+    return s
+
+
+def encrypt(blocks, key, states=False):
+    """Encrypt (N x 16) blocks with key (one key, or one per block).
+
+    Returns:
+        (N x 16) uint8 array of ciphertexts. With states=True, also an
+        (N x rounds + 1 x 16) array of the states after each round (0 is
+        the state after the first AddRoundKey, the last is the ciphertext).
+    """
+    return _encrypt(_blocks(blocks), expand_key(key), states)
+
+
+def decrypt(blocks, key, states=False):
+    """Decrypt (N x 16) blocks with key (one key, or one per block).
+
+    Returns:
+        (N x 16) uint8 array of plaintexts. With states=True, also an
+        (N x rounds + 1 x 16) array of the states after each round of the
+        decryption (0 is the state after the first AddRoundKey, the last is
+        the plaintext).
+    """
+    return _decrypt(_blocks(blocks), expand_key(key), states)
+
+
+class AESBatch(object):
+    """AES with a fixed key, which is only expanded once.
+
+    Args:
+        key (bytes-like): 16, 24 or 32 byte key.
+    """
+    def __init__(self, key):
+        self.key = bytes(bytearray(key))
+        self.round_keys = expand_key(np.frombuffer(self.key, dtype=np.uint8))
+        self._rk_list = [[int.from_bytes(rk[4 * c:4 * c + 4].tobytes(), 'little') for c in range(4)]
+                         for rk in self.round_keys]
+
+    @property
+    def rounds(self):
+        return len(self.round_keys) - 1
+
+    def encrypt(self, blocks, states=False):
+        """See :func:`encrypt`"""
+        return _encrypt(_blocks(blocks), self.round_keys, states)
+
+    def decrypt(self, blocks, states=False):
+        """See :func:`decrypt`"""
+        return _decrypt(_blocks(blocks), self.round_keys, states)
+
+    def encrypt_block(self, block):
+        """Encrypt one 16 byte block, returning a bytearray.
+
+        Faster than encrypt() for a single block, for when each block depends
+        on the one before.
+        """
+        T0, T1, T2, T3 = _TE_LIST
+        S = _SBOX_LIST
+        rk = self._rk_list
+        block = bytes(bytearray(block))
+        s0, s1, s2, s3 = [int.from_bytes(block[4 * c:4 * c + 4], 'little') ^ rk[0][c] for c in range(4)]
+        for r in range(1, self.rounds):
+            k = rk[r]
+            s0, s1, s2, s3 = (
+                T0[s0 & 255] ^ T1[(s1 >> 8) & 255] ^ T2[(s2 >> 16) & 255] ^ T3[s3 >> 24] ^ k[0],
+                T0[s1 & 255] ^ T1[(s2 >> 8) & 255] ^ T2[(s3 >> 16) & 255] ^ T3[s0 >> 24] ^ k[1],
+                T0[s2 & 255] ^ T1[(s3 >> 8) & 255] ^ T2[(s0 >> 16) & 255] ^ T3[s1 >> 24] ^ k[2],
+                T0[s3 & 255] ^ T1[(s0 >> 8) & 255] ^ T2[(s1 >> 16) & 255] ^ T3[s2 >> 24] ^ k[3])
+        k = rk[self.rounds]
+        s = (s0, s1, s2, s3)
+        out = bytearray()
+        for c in range(4):
+            col = (S[s[c] & 255] | S[(s[(c + 1) % 4] >> 8) & 255] << 8 |
+                   S[(s[(c + 2) % 4] >> 16) & 255] << 16 | S[s[(c + 3) % 4] >> 24] << 24) ^ k[c]
+            out += col.to_bytes(4, 'little')
+        return out
+
+    def encrypt_chain(self, block, n):
+        """Return an (n x 16) array of block, its encryption, the encryption of that, ..."""
+        out = np.empty((n, 16), dtype=np.uint8)
+        block = bytearray(block)
+        for i in range(n):
+            out[i] = block
+            block = self.encrypt_block(block)
+        return out
@@ -26,9 +26,33 @@
 #=================================================
 import logging
 import uuid
+import numpy as np
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.utils.parameter import Parameterized, setupSetParam
 
+def rows_to_array(rows):
+    """Stack per-trace data (textin, key, ...) into an array with one row per trace.
+
+    Returns a uint8 array when every row is a list of bytes of the same
+    length, otherwise a 1-D object array of the rows.
+    """
+    if isinstance(rows, np.ndarray):
+        if rows.dtype != object:
+            return rows
+        # Rows of an object array are only converted one by one
+        rows = list(rows)
+    try:
+        array = np.array(rows, dtype=np.uint8)
+        if array.ndim == 2:
+            return array
+    except (ValueError, TypeError, OverflowError):
+        pass
+    array = np.empty(len(rows), dtype=object)
+    for i, row in enumerate(rows):
+        array[i] = row
+    return array
+
+
 class TraceSource(object):
     """
     It has traces as output
@@ -72,6 +96,28 @@ class TraceSource(object):
         """Get known-key number n"""
         raise NotImplementedError
 
+    def get_trace_block(self, start, stop, point_range=None):
+        """Get traces start to stop-1 and their data as arrays.
+
+        Fetches one trace at a time, sources that can do better override this.
+
+        Args:
+            start (int): First trace.
+            stop (int): End of the block (not included).
+            point_range (list, optional): [start, end) of the points to return.
+
+        Returns:
+            (traces, textins, textouts, keys): traces is a (traces x points)
+            array, the others have one row per trace (see rows_to_array()).
+        """
+        traces = np.array([self.getTrace(n) for n in range(start, stop)])
+        if point_range is not None:
+            traces = traces[:, point_range[0]:point_range[1]]
+        textins = rows_to_array([self.getTextin(n) for n in range(start, stop)])
+        textouts = rows_to_array([self.getTextout(n) for n in range(start, stop)])
+        keys = rows_to_array([self.getKnownKey(n) for n in range(start, stop)])
+        return traces, textins, textouts, keys
+
     def getSegmentList(self):
         """Return a list of segments."""
         raise NotImplementedError
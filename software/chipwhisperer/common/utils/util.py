@@ -526,3 +526,123 @@ def better_delay(ms):
     t = time.perf_counter() + ms / 1000
     while time.perf_counter() < t:
         pass
+
+
+class WaitStats(object):
+    """Where the time went while waiting for something (see PollWait).
+
+    Attributes:
+        name (str): What was waited for.
+        polls (int): Number of times the condition was checked.
+        elapsed (float): Total time waited, in seconds.
+        slept (float): Time spent sleeping between polls, in seconds.
+        expected (float): Time the wait was expected to take, in seconds,
+            or None if unknown.
+        timed_out (bool): True if the condition wasn't met in time.
+    """
+    def __init__(self, name, expected=None):
+        self.name = name
+        self.polls = 0
+        self.elapsed = 0.0
+        self.slept = 0.0
+        self.expected = expected
+        self.timed_out = False
+
+    def _dict_repr(self):
+        dict = OrderedDict()
+        dict['polls'] = self.polls
+        dict['elapsed'] = self.elapsed
+        dict['slept'] = self.slept
+        dict['expected'] = self.expected
+        dict['timed_out'] = self.timed_out
+        return dict
+
+    def __repr__(self):
+        ret = "%s: %d polls in %.3f ms (%.3f ms sleeping)" % (self.name, self.polls, self.elapsed * 1000, self.slept * 1000)
+        if self.expected is not None:
+            ret += ", expected %.3f ms" % (self.expected * 1000)
+        if self.timed_out:
+            ret += ", timed out"
+        return ret
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class PollWait(object):
+    """Waits for a condition by polling it, backing off while it isn't met.
+
+    The condition is checked straight away, then again after an interval
+    that starts at 1/max_rate and grows by a factor of backoff after every
+    failed check, up to max_interval. Quick operations are noticed quickly,
+    while long ones (slow targets, long captures) cost a few polls instead
+    of a busy loop.
+
+    When the time something takes is known in advance, sleep_until() sleeps
+    until then. Sleeps may overshoot by a fraction of a millisecond; setting
+    spin makes it stop sleeping that long before the deadline and busy-wait
+    the rest, which is more precise but keeps a core busy. Spinning is off
+    by default.
+
+    Attributes:
+        max_rate (float): Maximum number of polls per second.
+        max_interval (float): Longest time between polls, in seconds.
+        backoff (float): Factor the interval grows by after each failed poll.
+        spin (float): Time before a deadline to stop sleeping and spin, in seconds (0 to never spin).
+        stats (WaitStats): Statistics of the last wait.
+    """
+    def __init__(self, max_rate=20000, max_interval=0.005, backoff=2.0, spin=0):
+        self.max_rate = max_rate
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.spin = spin
+        self.stats = None
+
+    def sleep_until(self, deadline, stats=None):
+        """Return once time.perf_counter() reaches deadline"""
+        now = time.perf_counter()
+        start = now
+        if deadline - now > self.spin:
+            time.sleep(deadline - now - self.spin)
+        if self.spin:
+            while time.perf_counter() < deadline:
+                pass
+        if stats:
+            stats.slept += time.perf_counter() - start
+
+    def wait(self, done, timeout, name="", expected=None):
+        """Call done() until it returns True, or until timeout seconds have passed.
+
+        Args:
+            done (callable): Returns True when the wait is over.
+            timeout (float): Time in seconds to give up after.
+            name (str, optional): Name for the statistics.
+            expected (float, optional): Time in seconds the wait should take.
+                If given, done() is first checked once this has passed.
+
+        Returns:
+            WaitStats of the wait (also stored in self.stats). Check its
+            timed_out attribute for a timeout.
+        """
+        stats = WaitStats(name, expected)
+        self.stats = stats
+        start = time.perf_counter()
+        deadline = start + timeout
+        if expected:
+            self.sleep_until(min(start + expected, deadline), stats)
+
+        interval = 1.0 / self.max_rate if self.max_rate else 0
+        while True:
+            stats.polls += 1
+            if done():
+                break
+            now = time.perf_counter()
+            if now >= deadline:
+                stats.timed_out = True
+                break
+            if interval:
+                self.sleep_until(min(now + interval, deadline), stats)
+            interval = min(max(interval, 1e-6) * self.backoff, self.max_interval)
+
+        stats.elapsed = time.perf_counter() - start
+        return stats
@@ -0,0 +1,614 @@
+#
+# Copyright (c) 2014-2020, NewAE Technology Inc
+# All rights reserved.
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.chipwhisperer.com
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+# ChipWhisperer is a trademark of NewAE Technology Inc., registered in the
+# United States of America, the European Union, and other jurisdictions.
+# ==========================================================================
+"""In-process emulation of NewAE USB devices, for running capture code without hardware.
+
+The emulated devices stand in for the pyusb device object used by
+NAEUSB_Backend, so everything above it (NAEUSB, the FPGA register interface,
+USART, the scope and target classes) runs unmodified::
+
+    import chipwhisperer as cw
+    from chipwhisperer.hardware.naeusb.emulator import EmulatedCWLite, emulate
+
+    with emulate(EmulatedCWLite(latency=100e-6)):
+        scope = cw.scope()
+        target = cw.target(scope)
+        scope.default_setup()
+        ktp = cw.ktp.Basic()
+        key, text = ktp.next()
+        trace = cw.capture_trace(scope, target, text, key)
+
+The target attached to each emulated device is a SimpleSerial (v1.1) AES-128
+implementation, or SimpleSerial v2 with target=SimpleSerial2AES(). While the
+scope is armed, the 'p' command triggers a capture of a synthetic power trace
+that leaks the Hamming weight of the first round S-box outputs.
+"""
+import array
+import binascii
+import logging
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import usb.core
+
+from chipwhisperer.capture.targets.SimpleSerial2 import SimpleSerial2
+from chipwhisperer.common.utils import aes_tables
+from chipwhisperer.common.utils.aes_cipher import AESCipher
+from chipwhisperer.analyzer.attacks.models.aes.key_schedule import key_schedule_rounds
+from chipwhisperer.hardware.firmware import cwlite as fw_cwlite
+from chipwhisperer.hardware.firmware import cwnano as fw_nano
+from .naeusb import NAEUSB, NAEUSB_Backend, NEWAE_VID, packuint32, unpackuint32
+
+_sbox = np.array(aes_tables.sbox, dtype=np.uint8)
+_hw = np.array([bin(i).count("1") for i in range(256)], dtype=np.int32)
+
+
+class SimpleSerialAES(object):
+    """SimpleSerial v1.1 target running AES-128 (simpleserial-aes firmware).
+
+    Bytes written to the USART are parsed into commands, responses are
+    queued for the USART to read back. Supported commands are 'k' (set key),
+    'p' (encrypt), 'v' (version check) and 'w' (switch to raw binary
+    payloads with 01, back to hex-ASCII with 00). 'x' resets the command
+    buffer, and switches back to hex-ASCII in binary mode.
+    """
+    _lengths = {'k': 16, 'p': 16, 'v': 0, 'w': 1}
+
+    def __init__(self):
+        self.key = bytearray(16)
+        self.textin = bytearray(16)
+        self.textout = bytearray(16)
+        self.binary = False
+        self._cipher = None
+        self._cmd = bytearray()
+
+    def _set_key(self, key):
+        self.key = bytearray(key)
+        exp_key = list(self.key)
+        for i in range(1, 11):
+            exp_key.extend(key_schedule_rounds(list(self.key), 0, i))
+        self._cipher = AESCipher(exp_key)
+
+    def receive(self, data):
+        """Process bytes received from the ChipWhisperer.
+
+        Returns:
+            List of (command, payload, response) for each completed command
+        """
+        done = []
+        for c in bytearray(data):
+            if self.binary and self._cmd[:1] not in (b"", b"w"):
+                # Raw payload of known length, then the end of line
+                self._cmd.append(c)
+                if len(self._cmd) == self._lengths[chr(self._cmd[0])] + 2:
+                    done.append(self._process(bytes(self._cmd[:-1])))
+                    self._cmd = bytearray()
+            elif self.binary and not self._cmd:
+                if c == ord('x'):
+                    self.binary = False
+                elif chr(c) in self._lengths:
+                    self._cmd.append(c)
+            elif c in b"\n\r":
+                if self._cmd:
+                    done.append(self._process(bytes(self._cmd)))
+                self._cmd = bytearray()
+            elif c == ord('x') and not self._cmd:
+                continue
+            else:
+                self._cmd.append(c)
+        return done
+
+    def _put(self, c, data):
+        data = bytes(bytearray(data))
+        if self.binary:
+            return c + data + b"\n"
+        return c + binascii.hexlify(data).upper() + b"\n"
+
+    def _process(self, cmd):
+        name = chr(cmd[0])
+        if self.binary and name != 'w':
+            payload = bytearray(cmd[1:])
+        else:
+            try:
+                payload = bytearray(binascii.unhexlify(cmd[1:]))
+            except (binascii.Error, ValueError):
+                return name, None, self._put(b"z", [1])
+
+        if name == 'k' and len(payload) == 16:
+            self._set_key(payload)
+            return name, payload, self._put(b"z", [0])
+        elif name == 'p' and len(payload) == 16:
+            if self._cipher is None:
+                self._set_key(self.key)
+            self.textin = payload
+            self.textout = bytearray(self._cipher.cipher_block(list(payload)))
+            return name, payload, self._put(b"r", self.textout) + self._put(b"z", [0])
+        elif name == 'v':
+            return name, payload, self._put(b"z", [0])
+        elif name == 'w' and len(payload) == 1 and payload[0] <= 1:
+            self.binary = False
+            ack = self._put(b"z", [0])
+            self.binary = payload[0] == 1
+            return name, payload, ack
+        return name, payload, self._put(b"z", [1])
+
+    def leakage(self):
+        """Return the modelled leakage (Hamming weight of each first round S-box output)"""
+        return _hw[_sbox[np.bitwise_xor(np.frombuffer(bytes(self.textin), dtype=np.uint8),
+                                        np.frombuffer(bytes(self.key), dtype=np.uint8))]]
+
+
+class SimpleSerial2AES(SimpleSerialAES):
+    """SimpleSerial v2 target running AES-128 (simpleserial-aes firmware).
+
+    Commands are COBS frames of [cmd, scmd, len, data, crc] (see
+    :class:`SimpleSerial2 <chipwhisperer.capture.targets.SimpleSerial2>`).
+    Command 0x01 encrypts with subcommand 0x01 ('p') and sets the key with
+    0x02 ('k'). Every command is acked with an 'e' packet, after the 'r'
+    packet with the ciphertext for encryptions.
+    """
+    def receive(self, data):
+        done = []
+        for c in bytearray(data):
+            if c != 0x00:
+                self._cmd.append(c)
+                continue
+            if self._cmd:
+                done.append(self._process(bytes(self._cmd)))
+            self._cmd = bytearray()
+        return done
+
+    @staticmethod
+    def _ack(err):
+        return SimpleSerial2._encode_frame([ord('e'), 1, err])
+
+    def _process(self, frame):
+        buf = bytearray(frame)
+        n = buf[0]
+        while n < len(buf):
+            buf[n], n = 0x00, n + buf[n]
+        if n != len(buf) or len(buf) < 5 or SimpleSerial2._calc_crc(buf[1:-1]) != buf[-1]:
+            return None, None, self._ack(2)
+        cmd, scmd, payload = buf[1], buf[2], buf[4:-1]
+        if buf[3] != len(payload):
+            return None, None, self._ack(4)
+
+        if cmd == 0x01 and scmd == 0x02 and len(payload) == 16:
+            self._set_key(payload)
+            return 'k', payload, self._ack(0)
+        elif cmd == 0x01 and scmd == 0x01 and len(payload) == 16:
+            if self._cipher is None:
+                self._set_key(self.key)
+            self.textin = payload
+            self.textout = bytearray(self._cipher.cipher_block(list(payload)))
+            return 'p', payload, SimpleSerial2._encode_frame([ord('r'), 16] + list(self.textout)) + self._ack(0)
+        return chr(cmd), payload, self._ack(1)
+
+
+class EmulatedNAEUSBDevice(object):
+    """Base for emulated NewAE USB devices, implementing the pyusb device calls used by NAEUSB_Backend.
+
+    Handles the NAEUSB control/bulk protocol: memory reads/writes (passed to
+    read_mem()/write_mem()), the USART (connected to a SimpleSerialAES target),
+    FPGA programming, and firmware version. Other control requests store
+    their data, which is returned when the same request is read.
+
+    Args:
+        serial_number (str): USB serial number to report.
+        latency (float): Time in seconds that each USB transfer takes.
+        target_delay (float): Time in seconds before the target's response
+            becomes available to read.
+        noise (float): Standard deviation of the noise in synthetic traces,
+            in ADC codes.
+        seed (int): Seed for the noise in synthetic traces.
+        target (SimpleSerialAES): Emulated target, a new SimpleSerialAES if None.
+    """
+    idVendor = NEWAE_VID
+    idProduct = None
+    product = None
+    fwver = [0, 0]
+
+    CMD_READMEM_BULK = NAEUSB_Backend.CMD_READMEM_BULK
+    CMD_WRITEMEM_BULK = NAEUSB_Backend.CMD_WRITEMEM_BULK
+    CMD_READMEM_CTRL = NAEUSB_Backend.CMD_READMEM_CTRL
+    CMD_WRITEMEM_CTRL = NAEUSB_Backend.CMD_WRITEMEM_CTRL
+    CMD_FW_VERSION = NAEUSB.CMD_FW_VERSION
+    CMD_FPGA_STATUS = 0x15
+    CMD_FPGA_PROGRAM = 0x16
+    CMD_USART0_DATA = 0x1A
+    CMD_USART0_CONFIG = 0x1B
+
+    USART_CMD_NUMWAIT = 0x0014
+    USART_CMD_NUMWAIT_TX = 0x0018
+
+    def __init__(self, serial_number="EMU000000", latency=0.0, target_delay=0.0, noise=2.0, seed=None, target=None):
+        self.serial_number = serial_number
+        self.latency = latency
+        self.target_delay = target_delay
+        self.noise = noise
+        self.target = SimpleSerialAES() if target is None else target
+        self.transfers = 0
+
+        self._rng = np.random.default_rng(seed)
+        self._ctrl = {}
+        self._pending_read = None
+        self._pending_write = None
+        self._usart_rx = bytearray()
+        self._usart_ready = []
+
+    def __repr__(self):
+        return "%s(serial_number=%r)" % (type(self).__name__, self.serial_number)
+
+    def _transfer(self):
+        self.transfers += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # pyusb device interface
+    def set_configuration(self, configuration=None):
+        pass
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0, data_or_wLength=None, timeout=None):
+        self._transfer()
+        if bmRequestType & 0x80:
+            return array.array('B', self.read_ctrl(bRequest, wValue, data_or_wLength))
+        data = bytearray(data_or_wLength or [])
+        self.write_ctrl(bRequest, wValue, data)
+        return len(data)
+
+    def read(self, endpoint, size_or_buffer, timeout=None):
+        self._transfer()
+        if self._pending_read is None:
+            raise usb.core.USBTimeoutError("Operation timed out", 110, 110)
+        data, self._pending_read = self._pending_read, None
+        return array.array('B', data)
+
+    def write(self, endpoint, data, timeout=None):
+        self._transfer()
+        if self._pending_write is not None:
+            addr, self._pending_write = self._pending_write, None
+            self.write_mem(addr, bytearray(data))
+        # Otherwise bulk data is a bitstream, nothing to do with it
+        return len(data)
+
+    # Control requests
+    def read_ctrl(self, request, value, length):
+        if request == self.CMD_FW_VERSION:
+            return bytearray(self.fwver + [0])[:length]
+        elif request == self.CMD_FPGA_STATUS:
+            return bytearray([1, 0, 0, 0])[:length]
+        elif request == self.CMD_READMEM_CTRL:
+            data, self._pending_read = self._pending_read, None
+            return data[:length]
+        elif request == self.CMD_USART0_DATA:
+            self._update_usart()
+            data = self._usart_rx[:length]
+            del self._usart_rx[:length]
+            return data
+        elif request == self.CMD_USART0_CONFIG:
+            if value == self.USART_CMD_NUMWAIT:
+                self._update_usart()
+                return bytearray(packuint32(min(len(self._usart_rx), 255)))[:length]
+            elif value == self.USART_CMD_NUMWAIT_TX:
+                return bytearray(length)
+        return self._ctrl.get((request, value), bytearray(length)).ljust(length, b'\x00')[:length]
+
+    def write_ctrl(self, request, value, data):
+        if request in (self.CMD_READMEM_CTRL, self.CMD_READMEM_BULK):
+            dlen = unpackuint32(data[0:4])
+            addr = unpackuint32(data[4:8])
+            self._pending_read = bytearray(self.read_mem(addr, dlen))
+        elif request == self.CMD_WRITEMEM_CTRL:
+            addr = unpackuint32(data[4:8])
+            self.write_mem(addr, data[8:])
+        elif request == self.CMD_WRITEMEM_BULK:
+            self._pending_write = unpackuint32(data[4:8])
+        elif request == self.CMD_USART0_DATA:
+            self._usart_write(data)
+        elif request in (self.CMD_FPGA_PROGRAM, self.CMD_USART0_CONFIG):
+            pass
+        else:
+            self._ctrl[(request, value)] = bytearray(data)
+
+    # USART / target
+    def _usart_write(self, data):
+        for cmd, payload, response in self.target.receive(data):
+            if cmd == 'p':
+                self.trigger()
+            self._usart_ready.append((time.perf_counter() + self.target_delay, response))
+
+    def _update_usart(self):
+        now = time.perf_counter()
+        while self._usart_ready and self._usart_ready[0][0] <= now:
+            self._usart_rx.extend(self._usart_ready.pop(0)[1])
+
+    # Scope
+    def synthetic_trace(self, samples, leak_start=10, leak_step=6, gain=0.0):
+        """Return a trace of the target's last operation, in ADC codes centered on 0.
+
+        Byte i of the first round S-box output leaks at sample leak_start + i*leak_step.
+        """
+        trace = self._rng.normal(0, self.noise, samples) if self.noise else np.zeros(samples)
+        points = leak_start + leak_step * np.arange(16)
+        points = points[points < samples]
+        trace[points] += gain * (self.target.leakage()[:len(points)] - 4)
+        return trace
+
+    def trigger(self):
+        """Called when the target starts an encryption"""
+        pass
+
+    def read_mem(self, addr, dlen):
+        raise NotImplementedError
+
+    def write_mem(self, addr, data):
+        raise NotImplementedError
+
+
+class EmulatedCWLite(EmulatedNAEUSBDevice):
+    """Emulated ChipWhisperer-Lite, with the OpenADC FPGA register map.
+
+    Registers keep the values written to them, apart from the status, clock
+    and FIFO registers. When triggered, the ADC FIFO is filled with
+    ADDR_SAMPLES synthetic samples packed in the FPGA's format: a 0xAC sync
+    byte, then big-endian 32 bit words of three 10 bit samples and the trigger
+    marker in the top two bits.
+
+    The samples after the presamples are taken in real time, starting
+    ADDR_OFFSET (decimated) ADC cycles after the trigger. If the scope is disarmed
+    before they have all been taken, the FIFO only keeps the ones taken.
+    """
+    idProduct = 0xACE2
+    product = "ChipWhisperer Lite"
+    fwver = list(fw_cwlite.fwver)
+
+    ADDR_SETTINGS = 1
+    ADDR_STATUS = 2
+    ADDR_ADCDATA = 3
+    ADDR_FREQ = 5
+    ADDR_ADVCLK = 6
+    ADDR_SYSFREQ = 7
+    ADDR_ADCFREQ = 8
+    ADDR_VERSIONS = 10
+    ADDR_SAMPLES = 16
+    ADDR_DECIMATE = 15
+    ADDR_PRESAMPLES = 17
+    ADDR_BYTESTORX = 18
+    ADDR_OFFSET = 26
+    ADDR_RECONFIG = 52
+
+    SETTINGS_RESET = 0x01
+    SETTINGS_ARM = 0x08
+    SETTINGS_TRIG_NOW = 0x40
+
+    STATUS_ARM_MASK = 0x01
+    STATUS_FIFO_MASK = 0x02
+
+    #: Maximum number of samples reported after reset (hardware limit + 45)
+    max_samples = 24573
+    sys_freq = 96000000
+    adc_freq = 4 * 7.37E6
+
+    def __init__(self, *args, **kwargs):
+        super(EmulatedCWLite, self).__init__(*args, **kwargs)
+        self._regs = {
+            self.ADDR_VERSIONS: bytearray([0, 8 << 3, 0, 0, 0, 0]),
+            self.ADDR_SAMPLES: bytearray(packuint32(self.max_samples)),
+            self.ADDR_SYSFREQ: bytearray(packuint32(self.sys_freq)),
+            self.ADDR_ADVCLK: bytearray(4),
+        }
+        self._armed = False
+        self._fifo = bytearray()
+        # (codes, presamples, trigger time) of a capture still taking samples
+        self._capture = None
+
+    def _reg_int(self, addr):
+        return unpackuint32(self._regs.get(addr, bytearray(4)).ljust(4, b'\x00'))
+
+    def read_mem(self, addr, dlen):
+        if addr == self.ADDR_ADCDATA:
+            data = self._fifo[:dlen]
+            self._fifo = self._fifo[dlen:]
+            return data
+        elif addr == self.ADDR_STATUS:
+            status = self.STATUS_ARM_MASK if self._armed else 0
+            if self._fifo:
+                status |= self.STATUS_FIFO_MASK
+            return bytearray([status]).ljust(dlen, b'\x00')
+        elif addr == self.ADDR_BYTESTORX:
+            return bytearray(packuint32(max(len(self._fifo) - 1, 0)))[:dlen]
+        elif addr == self.ADDR_RECONFIG:
+            # Partial reconfiguration (glitch module) always succeeds
+            return bytearray(dlen)
+        elif addr in (self.ADDR_ADCFREQ, self.ADDR_FREQ):
+            # Frequency counters count for 2^23 system clock cycles
+            return bytearray(packuint32(self.adc_freq * 2**23 / self.sys_freq))[:dlen]
+
+        data = self._regs.get(addr, bytearray()).ljust(dlen, b'\x00')[:dlen]
+        if addr == self.ADDR_ADVCLK and dlen >= 4:
+            # Register present, both DCMs locked, CLKGEN values loaded
+            data[0] |= 0xE0
+            data[3] |= 0x02
+        return data
+
+    def write_mem(self, addr, data):
+        data = bytearray(data)
+        if addr == self.ADDR_SETTINGS and data:
+            if data[0] & self.SETTINGS_RESET:
+                self._regs[self.ADDR_SAMPLES] = bytearray(packuint32(self.max_samples))
+            was_armed = self._reg_int(self.ADDR_SETTINGS) & self.SETTINGS_ARM
+            if data[0] & self.SETTINGS_ARM and not was_armed:
+                self._armed = True
+                self._fifo = bytearray()
+                self._capture = None
+            elif not data[0] & self.SETTINGS_ARM:
+                self._armed = False
+                self._stop_capture()
+            if data[0] & self.SETTINGS_TRIG_NOW:
+                self.trigger()
+        self._regs[addr] = data
+
+    def trigger(self):
+        if not self._armed:
+            return
+        self._armed = False
+        samples = self._reg_int(self.ADDR_SAMPLES)
+        presamples = self._reg_int(self.ADDR_PRESAMPLES)
+        trace = self.synthetic_trace(samples, leak_start=presamples + 10, gain=8.0)
+        codes = np.clip(np.rint(trace) + 512, 0, 1023).astype(np.uint32)
+        self._fifo = self.pack_samples(codes, presamples)
+        self._capture = (codes, presamples, time.perf_counter())
+
+    def _stop_capture(self):
+        """Drop the samples that wouldn't have been taken yet when the ADC is stopped"""
+        if self._capture is None:
+            return
+        codes, presamples, start = self._capture
+        self._capture = None
+        decimate = (self._reg_int(self.ADDR_DECIMATE) & 0xFFFF) + 1
+        cycles = (time.perf_counter() - start) * self.adc_freq / decimate - self._reg_int(self.ADDR_OFFSET)
+        taken = presamples + max(int(cycles), 0)
+        if taken < len(codes):
+            self._fifo = self.pack_samples(codes[:taken], presamples)
+
+    @staticmethod
+    def pack_samples(codes, trigger_sample=0):
+        """Pack 10 bit ADC codes like the OpenADC FIFO, with the trigger at trigger_sample"""
+        nwords = (len(codes) + 2) // 3
+        padded = np.zeros(nwords * 3, dtype=np.uint32)
+        padded[:len(codes)] = codes
+        padded = padded.reshape(-1, 3)
+        words = padded[:, 0] | (padded[:, 1] << 10) | (padded[:, 2] << 20)
+
+        # Words before the trigger are marked 3, the word with the trigger
+        # holds its position within the word
+        marker = np.full(nwords, 3, dtype=np.uint32)
+        tword = trigger_sample // 3
+        if tword < nwords:
+            marker[tword] = trigger_sample % 3
+            marker[tword + 1:] = 0
+        words |= marker << 30
+        return bytearray(b'\xac') + bytearray(words.astype('>u4').tobytes())
+
+
+class EmulatedCWNano(EmulatedNAEUSBDevice):
+    """Emulated ChipWhisperer-Nano.
+
+    After being armed, the target's next encryption captures adc.samples
+    8 bit synthetic samples, read back from memory address 0.
+    """
+    idProduct = 0xACE0
+    product = "ChipWhisperer Nano"
+    fwver = list(fw_nano.fwver)
+
+    REQ_ARM = 0x29
+    REQ_SAMPLES = 0x2A
+
+    def __init__(self, *args, **kwargs):
+        super(EmulatedCWNano, self).__init__(*args, **kwargs)
+        self._armed = False
+        self._adc = bytearray()
+        self._ctrl[(self.REQ_SAMPLES, 0)] = bytearray(packuint32(5000))
+
+    def read_ctrl(self, request, value, length):
+        if request == self.REQ_ARM:
+            return bytearray([0 if self._armed else 1])[:length]
+        return super(EmulatedCWNano, self).read_ctrl(request, value, length)
+
+    def write_ctrl(self, request, value, data):
+        if request == self.REQ_ARM:
+            self._armed = bool(value)
+            return
+        super(EmulatedCWNano, self).write_ctrl(request, value, data)
+
+    def read_mem(self, addr, dlen):
+        return self._adc[:dlen]
+
+    def write_mem(self, addr, data):
+        pass
+
+    def trigger(self):
+        if not self._armed:
+            return
+        self._armed = False
+        samples = unpackuint32(self._ctrl[(self.REQ_SAMPLES, 0)])
+        trace = self.synthetic_trace(samples, gain=2.0)
+        self._adc = bytearray(np.clip(np.rint(trace) + 128, 0, 255).astype(np.uint8).tobytes())
+
+
+class NAEUSB_EmulatorBackend(NAEUSB_Backend):
+    """NAEUSB backend connecting to emulated devices instead of USB.
+
+    Args:
+        devices (list): Emulated devices (such as EmulatedCWLite) to make available.
+    """
+    def __init__(self, devices):
+        super(NAEUSB_EmulatorBackend, self).__init__()
+        self.devices = list(devices)
+
+    def get_possible_devices(self, idProduct=None, dictonly=True, backend=None):
+        devlist = [d for d in self.devices if not idProduct or d.idProduct in idProduct]
+        if dictonly:
+            devlist = [{'sn': d.serial_number, 'product': d.product, 'pid': d.idProduct, 'vid': d.idVendor} for d in devlist]
+        return devlist
+
+    def open(self, serial_number=None, connect_to_first=False):
+        devlist = self.get_possible_devices(dictonly=False)
+        if serial_number:
+            devlist = [d for d in devlist if d.serial_number == serial_number]
+        if len(devlist) == 0:
+            raise OSError("Failed to find USB Device")
+
+        dev = devlist[0]
+        logging.info('Found emulated %s, Serial Number = %s' % (dev.product, dev.serial_number))
+        self.snum = dev.serial_number
+        self._usbdev = dev
+        self.rep = 0x81
+        self.wep = 0x02
+        self._timeout = 200
+        return dev.idProduct
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def emulate(*devices):
+    """Connect new scopes/targets to the emulated devices instead of USB hardware.
+
+    Within the with block, NAEUSB objects (and so cw.scope(), cw.target(),
+    etc.) find the emulated devices given here instead of the ones attached to
+    USB. Yields the list of devices.
+
+    Args:
+        *devices: Emulated devices to connect to. If none, a single EmulatedCWLite is used.
+    """
+    devices = list(devices) or [EmulatedCWLite()]
+    old_backend = NAEUSB.backend
+    NAEUSB.backend = lambda: NAEUSB_EmulatorBackend(devices)
+    try:
+        yield devices
+    finally:
+        NAEUSB.backend = old_backend
@@ -607,9 +607,14 @@ class NAEUSB(object):
 
     # TODO: make this better
     fwversion_latest = [0, 11]
+
+    #: Creates the backend of new NAEUSB objects. Replaced by
+    #: chipwhisperer.hardware.naeusb.emulator.emulate() to run without hardware.
+    backend = NAEUSB_Backend
+
     def __init__(self):
         self._usbdev = None
-        self.usbtx = NAEUSB_Backend()
+        self.usbtx = NAEUSB.backend()
         self.usbseralizer = NAEUSB_Serializer(self.usbtx.txrx)
 
     def get_possible_devices(self, idProduct):
@@ -25,9 +25,52 @@
 
 import time
 import os
+from collections import OrderedDict
 from .naeusb import packuint32
+from chipwhisperer.common.utils import util
 from chipwhisperer.common.utils.util import fw_ver_required
 
+
+class ReadStats(object):
+    """USB transfers made by one USART.read() call.
+
+    Attributes:
+        requested (int): Number of bytes asked for (0 for everything waiting).
+        received (int): Number of bytes returned.
+        buffered (int): Bytes of those that were already in the host buffer.
+        transfers (int): USB control transfers made.
+        elapsed (float): Time the read took, in seconds.
+        timed_out (bool): True if fewer than requested bytes arrived in time.
+    """
+    def __init__(self, requested):
+        self.requested = requested
+        self.received = 0
+        self.buffered = 0
+        self.transfers = 0
+        self.elapsed = 0.0
+        self.timed_out = False
+
+    def _dict_repr(self):
+        dict = OrderedDict()
+        dict['requested'] = self.requested
+        dict['received'] = self.received
+        dict['buffered'] = self.buffered
+        dict['transfers'] = self.transfers
+        dict['elapsed'] = self.elapsed
+        dict['timed_out'] = self.timed_out
+        return dict
+
+    def __repr__(self):
+        ret = "read %d/%d bytes (%d buffered) in %d transfers, %.3f ms" % (
+            self.received, self.requested, self.buffered, self.transfers, self.elapsed * 1000)
+        if self.timed_out:
+            ret += ", timed out"
+        return ret
+
+    def __str__(self):
+        return self.__repr__()
+
+
 class USART(object):
     """
     USART Class communicates with NewAE USB Interface to read/write data over control endpoint.
@@ -48,6 +91,16 @@ class USART(object):
         """
         self._max_read = 256
 
+        # Bytes read from the device but not returned yet. Deleting from the
+        # front of a bytearray doesn't move the rest, so this works as a ring buffer.
+        self._rxbuf = bytearray()
+
+        #: How read() polls for data, see :class:`PollWait <chipwhisperer.common.utils.util.PollWait>`
+        self.read_wait = util.PollWait(max_interval=0.002)
+
+        #: :class:`ReadStats` of the last read()
+        self.read_stats = None
+
         self._usb = usb
         self.timeout = timeout
 
@@ -143,20 +196,39 @@ class USART(object):
         """
         Flush all input buffers
         """
-        inwait = self.inWaiting()
-        while(inwait):
-            self.read(inwait)
-            inwait = self.inWaiting()
+        del self._rxbuf[:]
+        while self._fill():
+            del self._rxbuf[:]
 
     def inWaiting(self):
         """
         Get number of bytes waiting to be read.
         """
-        # print "Checking Waiting..."
+        return len(self._rxbuf) + self._fw_waiting()
+
+    def _fw_waiting(self):
+        """
+        Get number of bytes waiting in the device's buffer.
+        """
         data = self._usartRxCmd(self.USART_CMD_NUMWAIT, dlen=4)
-        # print data
         return data[0]
 
+    def _fill(self, stats=None):
+        """
+        Move everything waiting in the device to the host buffer. Returns the number of bytes moved.
+        """
+        waiting = self._fw_waiting()
+        if stats:
+            stats.transfers += 1
+        if waiting == 0:
+            return 0
+        # The device only sends what it has, so never ask for more than it reported
+        newdata = self._usb.readCtrl(self.CMD_USART0_DATA, 0, min(waiting, self._max_read))
+        if stats:
+            stats.transfers += 1
+        self._rxbuf.extend(newdata)
+        return len(newdata)
+
     @fw_ver_required(0, 20)
     def in_waiting_tx(self):
         """
@@ -167,32 +239,38 @@ class USART(object):
 
     def read(self, dlen=0, timeout=0):
         """
-        Read data from input buffer, if 'dlen' is 0 everything present is read. If timeout is non-zero
-        system will block for a while until data is present in buffer.
+        Read data from input buffer, if 'dlen' is 0 everything present is read. Otherwise
+        blocks until dlen bytes have arrived or timeout ms have passed (self.timeout if
+        timeout is 0), and returns what arrived.
+
+        Everything waiting in the device is read in one transfer, and what isn't
+        asked for is kept for the next read, so a response and the ack after it
+        usually take a single read from the device. The transfers made are
+        recorded in self.read_stats.
         """
-
-        waiting = self.inWaiting()
+        stats = ReadStats(dlen)
+        self.read_stats = stats
+        start = time.perf_counter()
 
         if dlen == 0:
-            dlen = waiting
-
-        if timeout == 0:
-            timeout = self.timeout
-
-
-        resp = []
-
-        while dlen and (timeout * 10) > 0:
-            if waiting > 0:
-                newdata = self._usb.readCtrl(self.CMD_USART0_DATA, 0, min(min(waiting, dlen), self._max_read))
-                resp.extend(newdata)
-                dlen -= len(newdata)
-            waiting = self.inWaiting()
-            timeout -= 1
-
+            self._fill(stats)
+            dlen = len(self._rxbuf)
+        else:
+            stats.buffered = min(dlen, len(self._rxbuf))
+            if len(self._rxbuf) < dlen:
+                if timeout == 0:
+                    timeout = self.timeout
+                def done():
+                    self._fill(stats)
+                    return len(self._rxbuf) >= dlen
+                stats.timed_out = self.read_wait.wait(done, timeout / 1000.0, "usart").timed_out
+
+        resp = list(self._rxbuf[:dlen])
+        del self._rxbuf[:dlen]
+        stats.received = len(resp)
+        stats.elapsed = time.perf_counter() - start
         return resp
 
-
     def _usartTxCmd(self, cmd, data=[]):
         """
         Send a command to the USART interface (internal function).
@@ -0,0 +1,78 @@
+"""Capture throughput benchmark, using emulated ChipWhisperers (no hardware needed).
+
+Measures traces/second through cw.capture_trace() (and cw.capture_traces()
+with --batch) for a range of USB latencies. Exits with an error if the
+rate at any latency is below --min-rate, so it can be used to catch capture
+performance regressions in CI.
+
+Example:
+    python benchmark_capture.py --scope lite --samples 5000 --latency 0 100e-6 -n 500
+"""
+import argparse
+import sys
+import time
+
+import chipwhisperer as cw
+from chipwhisperer.hardware.naeusb.emulator import EmulatedCWLite, EmulatedCWNano, emulate
+
+
+def benchmark(device, num_traces, samples, batch=False):
+    with emulate(device):
+        scope = cw.scope()
+        target = cw.target(scope)
+    scope.default_setup()
+    scope.adc.samples = samples
+    ktp = cw.ktp.Basic()
+
+    # Warm up (first key send etc.)
+    key, text = ktp.next()
+    cw.capture_trace(scope, target, text, key)
+
+    transfers = device.transfers
+    start = time.perf_counter()
+    if batch:
+        captured = cw.capture_traces(scope, target, ktp, num_traces).captured
+    else:
+        captured = 0
+        for i in range(num_traces):
+            key, text = ktp.next()
+            if cw.capture_trace(scope, target, text, key) is not None:
+                captured += 1
+    elapsed = time.perf_counter() - start
+    transfers = (device.transfers - transfers) / num_traces
+
+    scope.dis()
+    target.dis()
+    return captured / elapsed, transfers, captured
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scope", choices=["lite", "nano"], default="lite")
+    parser.add_argument("-n", "--traces", type=int, default=200, help="Traces to capture per latency")
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0, 50e-6, 250e-6],
+                        help="Emulated USB latencies to test, in seconds per transfer")
+    parser.add_argument("--batch", action="store_true", help="Use cw.capture_traces() instead of cw.capture_trace()")
+    parser.add_argument("--min-rate", type=float, default=0.0, help="Fail if below this many traces/s")
+    args = parser.parse_args(args)
+
+    device_type = {"lite": EmulatedCWLite, "nano": EmulatedCWNano}[args.scope]
+
+    print("%-12s %12s %14s %10s" % ("latency (s)", "traces/s", "transfers/tr", "captured"))
+    failed = False
+    for latency in args.latency:
+        device = device_type(latency=latency, seed=0)
+        rate, transfers, captured = benchmark(device, args.traces, args.samples, args.batch)
+        print("%-12g %12.1f %14.1f %10d" % (latency, rate, transfers, captured))
+        if rate < args.min_rate or captured != args.traces:
+            failed = True
+
+    if failed:
+        print("FAILED: below %g traces/s or captures missing" % args.min_rate)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
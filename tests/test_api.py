@@ -1,4 +1,5 @@
 import unittest
+import warnings
 import chipwhisperer as cw
 import chipwhisperer.analyzer as cwa
 import numpy as np
@@ -77,6 +78,16 @@ class TestTraces(unittest.TestCase):
         # allow slicing
         self.assertEqual(self.fake_trace_2[1], textins[-2:][-1])
 
+    def test_get_trace_block(self):
+        tm = self.project.trace_manager()
+        waves, textins, textouts, keys = tm.get_trace_block(2, 13, point_range=[5, 10])
+
+        self.assertEqual(waves.shape, (11, 5))
+        np.testing.assert_array_equal(waves[0], np.arange(5, 10))
+        self.assertEqual(list(textins), ['asdf'] * 11)
+        self.assertEqual(list(keys), ['sdf'] * 10 + ['hello'])
+        self.assertRaises(ValueError, tm.get_trace_block, 10, 14)
+
 class TestProject(unittest.TestCase):
 
     def setUp(self):
@@ -109,6 +120,123 @@ class TestProject(unittest.TestCase):
             # check the key matches
             self.assertEqual(traces[index].key[i], self.project.traces[index].key[i])
 
+    def test_segment_cache(self):
+        self.project = cw.create_project(self.project_name)
+        self.project.traces.seg_len = 10
+        self.project.traces.seg_ind_max = 9
+        traces = create_random_traces(60, 100)
+        self.project.traces.extend(traces)
+        self.project.save()
+
+        tm = self.project.trace_manager()
+        segment_bytes = tm._segmentBytes(tm.get_segment(0))
+        tm.segment_cache_bytes = 2 * segment_bytes
+        for index in [55, 5, 12, 5, 33, 47, 5, 21, 59, 0]:
+            np.testing.assert_array_equal(traces[index].wave, tm.get_trace(index))
+            loaded = [t for t in tm.traceSegments if t.isLoaded()]
+            self.assertLessEqual(len(loaded), 2)
+            self.assertIn(tm.get_segment(index), loaded)
+
+        tm.segment_cache_bytes = 10 * segment_bytes
+        for index in range(0, 60, 7):
+            tm.get_trace(index)
+        self.assertEqual(6, len([t for t in tm.traceSegments if t.isLoaded()]))
+
+    def test_appended_ranges_and_saved_rows(self):
+        self.project = cw.create_project(self.project_name)
+        self.project.traces.seg_len = 7
+        self.project.traces.seg_ind_max = 6
+        traces = create_random_traces(30, 50)
+        self.project.traces.extend(traces)
+
+        tm = self.project.trace_manager()
+        ranges = [t.mappedRange[:] for t in tm.traceSegments]
+        tm._updateRanges()
+        self.assertEqual(ranges, [t.mappedRange for t in tm.traceSegments])
+        self.assertEqual(30, tm.num_traces())
+
+        self.project.save()
+        self.project = cw.open_project(self.project_name)
+        self.assertEqual([7, 7, 7, 7, 2], [t.traces.shape[0] for t in self.project.segments])
+        np.testing.assert_array_equal(traces[29].wave, self.project.traces[29].wave)
+
+    def test_column_arrays(self):
+        self.project = cw.create_project(self.project_name)
+        self.project.traces.seg_len = 10
+        self.project.traces.seg_ind_max = 9
+        traces = create_random_traces(35, 20)
+        self.project.traces.extend(traces)
+        self.project.save()
+        self.project = cw.open_project(self.project_name)
+
+        waves = np.array([trace.wave for trace in traces])
+        textins = np.array([trace.textin for trace in traces], dtype=np.uint8)
+        np.testing.assert_array_equal(waves, np.array(self.project.waves))
+        np.testing.assert_array_equal(waves[::-4, 3:9], self.project.waves[::-4, 3:9])
+        np.testing.assert_array_equal(waves[[31, 2, 17], 5], self.project.waves[[31, 2, 17], 5])
+        np.testing.assert_array_equal(textins[waves[:, 0] > 0.5], self.project.textins[waves[:, 0] > 0.5])
+        np.testing.assert_array_equal(waves[5, 3:7], self.project.waves[5, 3:7])
+        np.testing.assert_array_equal(waves[-1, 2:], self.project.waves[-1, 2:])
+        self.assertEqual(waves[5, 3], self.project.waves[5, 3])
+
+        # Within a segment, a view of its traces
+        block = self.project.waves[12:18]
+        self.assertTrue(np.shares_memory(block, self.project.segments[1].traces))
+        self.assertFalse(block.flags.writeable)
+
+        batch = self.project.traces[8:23]
+        self.assertEqual(15, len(batch))
+        np.testing.assert_array_equal(waves[8:23], batch.waves)
+        self.assertEqual(list(traces[10].key), list(batch[2].key))
+        self.assertEqual(5, len(batch[::3]))
+
+    def test_array_conversion_copies(self):
+        self.project = cw.create_project(self.project_name)
+        self.project.traces.extend(create_random_traces(10, 20))
+        self.project.save()
+        self.project = cw.open_project(self.project_name)
+
+        waves = np.array(self.project.waves)
+        self.assertTrue(waves.flags.writeable)
+        self.assertFalse(np.shares_memory(waves, self.project.segments[0].traces))
+        view = np.asarray(self.project.waves.__array__(copy=False))
+        self.assertTrue(np.shares_memory(view, self.project.segments[0].traces))
+        self.assertRaises(ValueError, self.project.waves.__array__, np.float32, copy=False)
+
+    def test_journal_recovery(self):
+        self.project = cw.create_project(self.project_name, overwrite=True, journal=True)
+        self.project.traces.seg_len = 10
+        self.project.traces.seg_ind_max = 9
+        traces = create_random_traces(25, 100)
+        self.project.traces.extend(traces[:12])
+        self.project.save()
+        self.project.traces.extend(traces[12:])
+        # Full segment was saved and unloaded
+        self.assertFalse(self.project.segments[1].isLoaded())
+
+        # Open without saving, as if the capture crashed
+        self.project = cw.open_project(self.project_name)
+        self.assertEqual(25, len(self.project.traces))
+        for trace, recovered in zip(traces, self.project.traces):
+            np.testing.assert_array_equal(trace.wave, recovered.wave)
+            self.assertEqual(bytearray(trace.textin), recovered.textin)
+
+        self.project.save()
+        self.project = cw.open_project(self.project_name)
+        self.assertEqual(25, len(self.project.traces))
+        self.assertEqual([], [f for f in os.listdir(self.project_name + '_data/traces') if 'journal' in f])
+
+        # Only bytes are journaled, nothing is pickled
+        from chipwhisperer.common.traces.journal import TraceJournal, read_journal
+        journal = TraceJournal.create(self.project_name + '_data')
+        journal.append(np.zeros(4), np.arange(16), None, bytearray(16))
+        self.assertRaises(TypeError, journal.append, np.zeros(4), 'text', None, None)
+        self.assertRaises(TypeError, journal.append, np.zeros(4), [1, 256], None, None)
+        journal.close()
+        trace = read_journal(journal.filename)[0]
+        self.assertEqual((bytearray(range(16)), None, bytearray(16)), (trace.textin, trace.textout, trace.key))
+        journal.remove()
+
     def test_create_and_save_project(self):
         self.project = cw.create_project(self.project_name)
         self.assertTrue(os.path.isdir(self.project_name + '_data'))
@@ -200,6 +328,37 @@ class TestProject(unittest.TestCase):
         self.project = cw.open_project(self.project_name)
 
 
+    def test_text_saved_as_uint8(self):
+        self.project = cw.create_project(self.project_name)
+        traces = create_random_traces(20, 100)
+        self.project.traces.extend(traces)
+        self.project.save()
+        segment = self.project.segments[0]
+        textin_file = os.path.join(os.path.dirname(segment.config.configFilename()),
+                                   segment.config.attr("prefix") + "textin.npy")
+        self.assertEqual(np.load(textin_file).dtype, np.uint8)
+
+        # Older versions saved a list of bytearrays
+        legacy = np.empty(20, dtype=object)
+        for i, trace in enumerate(traces):
+            legacy[i] = bytearray(trace.textin)
+        np.save(textin_file, legacy)
+
+        self.project = cw.open_project(self.project_name)
+        self.assertIsInstance(self.project.segments[0].textins, np.memmap)
+        self.assertEqual(np.load(textin_file).dtype, np.uint8)
+        for i, trace in enumerate(traces):
+            self.assertEqual(list(trace.textin), list(self.project.textins[i]))
+
+        # Single rows are bytearrays like the captured ones, blocks are arrays
+        segment = self.project.segments[0]
+        self.assertEqual(bytearray(traces[3].textin), self.project.textins[3])
+        self.assertEqual(bytearray(traces[3].textout), self.project.textouts[3])
+        self.assertEqual(bytearray(traces[3].key), self.project.keys[3])
+        self.assertIsInstance(segment.getKnownKey(), bytearray)
+        _, textins, _, keys = self.project.trace_manager().get_trace_block(0, 20)
+        self.assertEqual((np.uint8, np.uint8), (textins.dtype, keys.dtype))
+
 class TestProjectExportImport(unittest.TestCase):
 
     def setUp(self):
@@ -287,6 +446,67 @@ class TestSNR(unittest.TestCase):
         self.assertEqual(len(snr), 5000)
 
 
+class TestLeakageModels(unittest.TestCase):
+
+    def test_leakage_batch_matches_leakage(self):
+        textins = np.random.randint(0, 256, (20, 16), dtype=np.uint8)
+        textouts = np.random.randint(0, 256, (20, 16), dtype=np.uint8)
+        keys = np.random.randint(0, 256, (20, 16), dtype=np.uint8)
+        for leak_model in [cwa.leakage_models.sbox_output, cwa.leakage_models.last_round_state_diff,
+                           cwa.leakage_models.sbox_output_successive, cwa.leakage_models.mix_columns_output,
+                           cwa.leakage_models.round_1_2_state_diff_key_mix, cwa.leakage_models.round_1_2_state_diff_sbox]:
+            hyp = leak_model.leakage_batch(textins, textouts, range(256), 3, keys)
+            self.assertEqual(hyp.shape, (256, 20))
+            for guess in [0, 0x2B, 255]:
+                for i in range(len(textins)):
+                    state = {'knownkey': list(keys[i])}
+                    self.assertEqual(hyp[guess][i], leak_model.leakage(list(textins[i]), list(textouts[i]), guess, 3, state))
+
+
+class TestCPAAccumulator(unittest.TestCase):
+
+    def test_merge_and_float32(self):
+        from chipwhisperer.analyzer.attacks.cpa_algorithms import CPAAccumulator
+        hyp = np.random.randint(0, 9, (256, 3000))
+        traces = 1000 + np.random.rand(3000, 50) + 0.01 * hyp[0][:, None]
+        expected = np.corrcoef(hyp, traces.T)[:256, 256:]
+
+        first = CPAAccumulator().add(traces[:1000], hyp[:, :1000])
+        second = CPAAccumulator().add(traces[1000:], hyp[:, 1000:])
+        merged = first + second
+        self.assertEqual(merged.n, 3000)
+        np.testing.assert_allclose(merged.correlation(), expected, atol=1e-10)
+
+        acc = CPAAccumulator()
+        for i in range(0, 3000, 500):
+            acc.add(traces[i:i+500].astype(np.float32), hyp[:, i:i+500])
+        np.testing.assert_allclose(acc.correlation(), expected, atol=1e-4)
+
+
+class TestResults(unittest.TestCase):
+
+    def test_find_maximums(self):
+        from chipwhisperer.analyzer.attacks._stats import Results
+        diffs = np.random.randn(256, 300)
+        diffs[17, 120] = 10
+        diffs[3, 5] = -8
+        diffs[4, :] = np.nan
+        results = Results(1, 256)
+        results.max_history = 5
+        results.clear()
+        results.set_known_key([3])
+        for tnum in range(10):
+            results.update_subkey(0, diffs, tnum=tnum)
+            maxes = results.find_maximums()[0]
+        self.assertEqual(list(maxes['hyp'][:3]), [4, 17, 3])
+        self.assertEqual(list(maxes['point'][1:3]), [120, 5])
+        for hyp, point, value in maxes[1:]:
+            self.assertEqual(point, np.argmax(np.abs(diffs[hyp])))
+        self.assertEqual(results.pge[0], 1)
+        self.assertEqual(len(results.pge_total), 5)
+        self.assertEqual([m['trace'] for m in results.maxes_list[0]], [5, 6, 7, 8, 9])
+
+
 class TestPreprocessing(unittest.TestCase):
 
     def setUp(self):
@@ -305,6 +525,16 @@ class TestPreprocessing(unittest.TestCase):
         new_project = resync_traces.preprocess()
 
 
+    def test_get_trace_block(self):
+        dec = cwa.preprocessing.DecimationFixed(self.project)
+        dec.dec_factor = 3
+        waves, textins, textouts, keys = dec.get_trace_block(10, 20, point_range=[100, 200])
+        for i in range(10):
+            np.testing.assert_allclose(waves[i], self.project.waves[10 + i][300:600:3])
+            np.testing.assert_array_equal(textins[i], self.project.textins[10 + i])
+            np.testing.assert_array_equal(keys[i], self.project.keys[10 + i])
+
+
 class TestUtils(unittest.TestCase):
 
     def test_bytearray(self):
@@ -314,6 +544,38 @@ class TestUtils(unittest.TestCase):
         arr = bytearray([14, 10, 2])
         self.assertEqual(str(arr), "CWbytearray(b'0e 0a 02')")
 
+    def test_aes_batch(self):
+        from chipwhisperer.common.utils import aes_batch
+        from chipwhisperer.common.utils.aes_cipher import AESCipher
+        pt = np.frombuffer(bytes.fromhex("00112233445566778899aabbccddeeff"), dtype=np.uint8)
+        key = np.arange(32, dtype=np.uint8)
+        for keylen, ct in [(16, "69c4e0d86a7b0430d8cdb78070b4c55a"), (24, "dda97ca4864cdfe06eaf70a0ec0d7191"),
+                           (32, "8ea2b7ca516745bfeafc49904b496089")]:
+            self.assertEqual(aes_batch.encrypt(pt[None], key[:keylen])[0].tobytes().hex(), ct)
+            self.assertEqual(aes_batch.AESBatch(key[:keylen]).encrypt_block(pt).hex(), ct)
+
+        texts = np.random.randint(0, 256, (50, 16), dtype=np.uint8)
+        keys = np.random.randint(0, 256, (50, 16), dtype=np.uint8)
+        cts, states = aes_batch.encrypt(texts, keys, states=True)
+        for i in range(len(texts)):
+            cipher = AESCipher([int(b) for b in aes_batch.expand_key(keys[i]).ravel()])
+            self.assertEqual(cts[i].tolist(), cipher.cipher_block(texts[i].tolist()))
+        self.assertTrue((states[:, -1] == cts).all())
+        self.assertTrue((aes_batch.decrypt(cts, keys) == texts).all())
+
+    def test_verify_responses(self):
+        from chipwhisperer.common.utils.aes_batch import AESBatch
+        project = cw.create_project('test_verify', overwrite=True)
+        cipher = AESBatch(range(16))
+        for i in range(20):
+            textin = bytearray(np.random.randint(0, 256, 16, dtype=np.uint8))
+            textout = bytearray(cipher.encrypt_block(textin))
+            if i == 5:
+                textout[3] ^= 1
+            project.traces.append(cw.Trace(np.zeros(10), textin, textout, bytearray(range(16))))
+        self.assertEqual(np.flatnonzero(~cwa.verify_responses(project, chunk_size=8)).tolist(), [5])
+        project.remove(i_am_sure=True)
+
 class TestSegment(unittest.TestCase):
     def setUp(self):
         self.project = cw.create_project('test_seg', overwrite=True)
@@ -350,6 +612,120 @@ class TestCPA(unittest.TestCase):
 
         project.close(save=False)
 
+    def test_vectorized_matches_progressive(self):
+        project = cw.open_project('projects/Tutorial_B5')
+        for leak_model in [cwa.leakage_models.sbox_output, cwa.leakage_models.last_round_state_diff]:
+            results = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Progressive).run()
+            vec_results = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Vectorized).run()
+            self.assertEqual(results.find_key(), vec_results.find_key())
+            for bnum in range(len(results.diffs)):
+                np.testing.assert_allclose(np.array(results.diffs[bnum]), vec_results.diffs[bnum])
+
+        project.close(save=False)
+
+    def test_parallel_matches_progressive(self):
+        project = cw.open_project('projects/Tutorial_B5')
+        leak_model = cwa.leakage_models.sbox_output
+        results = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Progressive).run()
+        attack = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Parallel)
+        attack.algorithm.workers = 2
+        par_results = attack.run()
+        self.assertEqual(results.find_key(), par_results.find_key())
+        for bnum in range(len(results.diffs)):
+            np.testing.assert_allclose(np.array(results.diffs[bnum]), par_results.diffs[bnum])
+
+        # Resumed runs report the total number of traces
+        attack.run(trace_range=[0, 20])
+        resumed = attack.run(trace_range=[20, len(project.traces)], resume=True)
+        self.assertEqual([len(project.traces)] * len(resumed.diffs), resumed.diffs_tnum)
+        for bnum in range(len(results.diffs)):
+            np.testing.assert_allclose(np.array(results.diffs[bnum]), resumed.diffs[bnum], atol=1e-12)
+
+        project.close(save=False)
+
+    def test_parallel_float_hypotheses(self):
+        from chipwhisperer.analyzer.attacks.models.AES128_8bit import AES128_8bit, SBox_output
+
+        class FloatModel(AES128_8bit):
+            def leakage_batch(self, pt, ct, guesses, bnum, knownkeys=None):
+                return AES128_8bit.leakage_batch(self, pt, ct, guesses, bnum, knownkeys) ** 1.5
+
+        project = cw.open_project('projects/Tutorial_B5')
+        results = cwa.cpa(project, FloatModel(SBox_output), cwa.cpa_algorithms.Vectorized).run()
+        attack = cwa.cpa(project, FloatModel(SBox_output), cwa.cpa_algorithms.Parallel)
+        attack.algorithm.workers = 2
+        par_results = attack.run()
+        for bnum in range(len(results.diffs)):
+            np.testing.assert_allclose(np.array(results.diffs[bnum]), par_results.diffs[bnum])
+
+        project.close(save=False)
+
+    def test_resume_from_saved_state(self):
+        project = cw.open_project('projects/Tutorial_B5')
+        leak_model = cwa.leakage_models.sbox_output
+        results = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Vectorized).run()
+
+        attack = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Vectorized)
+        attack.run(trace_range=[0, 20])
+        attack.save_state('projects/cpa_state.npz')
+        attack = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Vectorized)
+        attack.load_state('projects/cpa_state.npz')
+        self.assertEqual(attack.trace_range, [20, len(project.traces)])
+        resumed = attack.run()
+        self.assertEqual([len(project.traces)] * len(resumed.diffs), resumed.diffs_tnum)
+
+        # No new traces, results of the saved traces only
+        attack = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Vectorized)
+        attack.load_state('projects/cpa_state.npz')
+        attack.run(trace_range=[20, 20])
+        unchanged = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Vectorized).run(trace_range=[0, 20])
+        for bnum in range(len(unchanged.diffs)):
+            np.testing.assert_allclose(unchanged.diffs[bnum], attack.results.diffs[bnum], atol=1e-12)
+        self.assertEqual(unchanged.find_key(), attack.results.find_key())
+        os.remove('projects/cpa_state.npz')
+
+        self.assertEqual(results.find_key(), resumed.find_key())
+        for bnum in range(len(results.diffs)):
+            np.testing.assert_allclose(results.diffs[bnum], resumed.diffs[bnum], atol=1e-12)
+
+        project.close(save=False)
+
+    def test_merge_partial_results(self):
+        from chipwhisperer.analyzer.attacks.cpa_algorithms import partial
+        project = cw.open_project('projects/Tutorial_B5')
+        leak_model = cwa.leakage_models.sbox_output
+        results = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Vectorized).run()
+
+        shards = []
+        for i, trace_range in enumerate([[0, 15], [30, 50], [15, 30]]):
+            attack = cwa.cpa(project, leak_model, cwa.cpa_algorithms.Vectorized)
+            attack.run(trace_range=trace_range)
+            shards.append('projects/cpa_shard%d.npz' % i)
+            attack.save_state(shards[-1])
+        partial.main(['-q', 'projects/cpa_merged.npz'] + shards)
+        merged = partial.PartialResults.load('projects/cpa_merged.npz')
+        with self.assertRaises(ValueError):
+            merged.merge(partial.PartialResults.load(shards[0]))
+
+        # Same model with a different bitmask gives different hypotheses
+        from chipwhisperer.analyzer.attacks.models.AES128_8bit import AES128_8bit, SBox_output
+        attack = cwa.cpa(project, AES128_8bit(SBox_output, 0x0f), cwa.cpa_algorithms.Vectorized)
+        attack.run(trace_range=[0, 15])
+        with self.assertRaises(ValueError):
+            attack.partial_results().merge(partial.PartialResults.load(shards[1]))
+        with self.assertRaises(ValueError):
+            attack.load_state(shards[1])
+        for f in shards + ['projects/cpa_merged.npz']:
+            os.remove(f)
+
+        self.assertEqual(merged.num_traces, len(project.traces))
+        merged = merged.results()
+        self.assertEqual(results.find_key(), merged.find_key())
+        for bnum in range(len(results.diffs)):
+            np.testing.assert_allclose(results.diffs[bnum], merged.diffs[bnum], atol=1e-12)
+
+        project.close(save=False)
+
     def test_jitter(self):
         project = cw.open_project('projects/jittertime')
         resync_traces = cwa.preprocessing.ResyncSAD(project)
@@ -365,6 +741,328 @@ class TestCPA(unittest.TestCase):
             self.assertEqual(project.keys[0][i], keys[i])
         project.close(save=False)
 
+class FakeScope(object):
+    """Scope returning a trace derived from the last plaintext, no hardware needed"""
+    def __init__(self, target, samples=100, fail_every=0):
+        self.target = target
+        self.samples = samples
+        self.fail_every = fail_every
+        self.captures = 0
+
+    def arm(self):
+        pass
+
+    def capture_raw(self):
+        self.captures += 1
+        timeout = bool(self.fail_every) and self.captures % self.fail_every == 0
+        return timeout, bytes(self.target.text) * (self.samples // 16 + 1)
+
+    def decode_raw(self, raw):
+        return np.frombuffer(raw, dtype=np.uint8)[:self.samples] / 256.0
+
+
+class FakeTarget(object):
+    """SimpleSerial target returning text XOR key"""
+    output_len = 16
+
+    def __init__(self):
+        self.key = bytearray(16)
+        self.text = bytearray(16)
+        self.keys_sent = 0
+
+    def set_key(self, key, ack=True):
+        self.key = key
+        self.keys_sent += 1
+
+    def simpleserial_write(self, cmd, data):
+        self.text = data
+
+    def simpleserial_read(self, cmd, pay_len, ack=True):
+        return bytearray(a ^ b for a, b in zip(self.text, self.key))
+
+    def is_done(self):
+        return True
+
+
+class TestCapture(unittest.TestCase):
+
+    def test_capture_traces(self):
+        target = FakeTarget()
+        scope = FakeScope(target)
+        ktp = cw.ktp.Basic()
+        project = cw.create_project('projects/test_capture_traces', overwrite=True)
+        results = cw.capture_traces(scope, target, ktp, 50, project=project)
+
+        self.assertEqual(50, results.captured)
+        self.assertEqual(0, results.failed)
+        self.assertEqual(1, target.keys_sent)
+        self.assertEqual(50, len(project.traces))
+        self.assertEqual([], results.traces)
+        self.assertEqual(list(results.timings), list(cw.CaptureResults.stages))
+        for trace in project.traces:
+            self.assertEqual(100, len(trace.wave))
+            self.assertEqual(trace.textin[0] / 256.0, trace.wave[0])
+            self.assertEqual(bytearray(a ^ b for a, b in zip(trace.textin, trace.key)), bytearray(trace.textout))
+        project.remove(i_am_sure=True)
+
+        scope = FakeScope(target, fail_every=5)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            results = cw.capture_traces(scope, target, ktp, 50)
+        self.assertEqual(40, results.captured)
+        self.assertEqual(10, results.failed)
+        self.assertEqual(40, len(results.traces))
+
+    def test_ktp_next_batch(self):
+        for ktp in [cw.ktp.Basic(), cw.ktp.VarVec(), cw.ktp.TVLATTest()]:
+            if isinstance(ktp, cw.ktp.Basic):
+                ktp.fixed_key = False
+            else:
+                ktp.init(50)
+            ktp.seed = 1234
+            pairs = [ktp.next() for i in range(25)]
+            pairs = [(bytearray(key), bytearray(text)) for key, text in pairs]
+
+            if not isinstance(ktp, cw.ktp.Basic):
+                ktp.init(50)
+            ktp.seed = 1234
+            keys, texts = ktp.next_batch(25)
+            self.assertEqual((25, 16), keys.shape)
+            self.assertEqual(np.uint8, texts.dtype)
+            self.assertEqual(pairs, [(bytearray(key), bytearray(text)) for key, text in zip(keys, texts)])
+
+class TestEmulator(unittest.TestCase):
+
+    def connect(self, device, target_type=None):
+        from chipwhisperer.hardware.naeusb.emulator import emulate
+        with emulate(device):
+            scope = cw.scope()
+            target = cw.target(scope) if target_type is None else cw.target(scope, target_type)
+        scope.default_setup()
+        return scope, target
+
+    def test_capture_trace_lite(self):
+        from chipwhisperer.hardware.naeusb.emulator import EmulatedCWLite
+        scope, target = self.connect(EmulatedCWLite(seed=0))
+        self.assertEqual("ChipWhisperer Lite", scope.get_name())
+        scope.adc.samples = 1000
+
+        # FIPS-197 AES-128 test vector
+        key = bytearray(range(16))
+        text = bytearray(range(0, 256, 17))
+        trace = cw.capture_trace(scope, target, text, key)
+        self.assertEqual(bytearray.fromhex("69c4e0d86a7b0430d8cdb78070b4c55a"), trace.textout)
+        self.assertEqual(1000, len(trace.wave))
+        self.assertLess(np.max(np.abs(trace.wave)), 0.1)
+
+        self.assertEqual(["trigger", "samples", "target"], [stats.name for stats in scope.wait_stats])
+        self.assertFalse(any(stats.timed_out for stats in scope.wait_stats))
+
+        codes = scope.get_last_trace(as_int=True)
+        self.assertEqual(np.uint16, codes.dtype)
+        np.testing.assert_array_equal((trace.wave + 0.5) * 1024, codes)
+        slow = scope.qtadc.sc.processData(scope.qtadc.sc._lastraw, 0.0, debug=True, NumberPoints=1000)
+        np.testing.assert_array_equal(slow, trace.wave)
+
+        scope.arm()
+        target.simpleserial_write('p', text)
+        timeout, raw = scope.capture_raw()
+        self.assertFalse(timeout)
+        wave = scope.decode_raw(raw)
+        codes = scope.decode_raw(raw, as_int=True)
+        self.assertEqual(np.uint16, codes.dtype)
+        np.testing.assert_array_equal(wave, codes.to_float())
+        np.testing.assert_array_equal(wave, scope.get_last_trace())
+
+    def test_capture_large_offset(self):
+        from chipwhisperer.hardware.naeusb.emulator import EmulatedCWLite
+        scope, target = self.connect(EmulatedCWLite(seed=0))
+        scope.adc.samples = 1000
+        scope.adc.presamples = 100
+        # About 50 ms from the trigger to the first sample after the presamples
+        scope.adc.offset = 1500000
+        trace = cw.capture_trace(scope, target, bytearray(16), bytearray(16))
+        self.assertEqual(1000, len(trace.wave))
+        self.assertGreater(scope.wait_stats[1].elapsed, 0.05)
+
+    def test_simpleserial2_batch(self):
+        from chipwhisperer.hardware.naeusb.emulator import EmulatedCWLite, SimpleSerial2AES
+        scope, target = self.connect(EmulatedCWLite(target=SimpleSerial2AES()), cw.targets.SimpleSerial2)
+        # FIPS-197 AES-128 test vector
+        target.set_key(bytearray(range(16)))
+        text = bytearray.fromhex("00112233445566778899aabbccddeeff")
+        expected = bytearray.fromhex("69c4e0d86a7b0430d8cdb78070b4c55a")
+
+        target.simpleserial_write('p', text)
+        self.assertEqual(expected, target.simpleserial_read('r', 16))
+        texts = [text] * 20
+        self.assertEqual([expected] * 20, target.simpleserial_batch('p', texts, 16))
+        self.assertEqual([expected] * 20, target.simpleserial_batch('p', texts, max_batch=3))
+        self.assertEqual([None] * 2, target.simpleserial_batch('k', [bytearray(range(16))] * 2))
+
+    def test_usart_read(self):
+        from chipwhisperer.hardware.naeusb.emulator import EmulatedCWLite
+        device = EmulatedCWLite()
+        scope, target = self.connect(device)
+        usart = target.ser.cwlite_usart
+        text = bytearray(range(16))
+
+        # Response and ack are read from the device together
+        target.simpleserial_write('p', text)
+        transfers = device.transfers
+        response = target.simpleserial_read('r', 16)
+        self.assertLessEqual(device.transfers - transfers, 3)
+        self.assertEqual(0, usart.read_stats.transfers)
+        self.assertEqual(4, usart.read_stats.buffered)
+
+        # Leftover bytes are kept for the next read
+        target.simpleserial_write('p', text)
+        self.assertEqual("r", target.read(1))
+        # Rest of "r<32 hex digits>\n" and "z00\n"
+        self.assertEqual(len(response) * 2 + 1 + 4, usart.inWaiting())
+        target.flush()
+        self.assertEqual(0, usart.inWaiting())
+
+        # Timeouts are in ms
+        self.assertEqual("", target.read(10, timeout=20))
+        self.assertTrue(usart.read_stats.timed_out)
+        self.assertGreaterEqual(usart.read_stats.elapsed, 0.02)
+        self.assertLess(usart.read_stats.elapsed, 1.0)
+
+    def test_simpleserial_binary(self):
+        from chipwhisperer.hardware.naeusb.emulator import EmulatedCWLite
+        scope, target = self.connect(EmulatedCWLite())
+        # FIPS-197 AES-128 test vector
+        target.set_key(bytearray(range(16)))
+        text = bytearray.fromhex("00112233445566778899aabbccddeeff")
+        expected = bytearray.fromhex("69c4e0d86a7b0430d8cdb78070b4c55a")
+
+        self.assertTrue(target.simpleserial_set_binary())
+        self.assertEqual('bin', target.protformat)
+        target.simpleserial_write('p', text)
+        self.assertEqual(expected, target.simpleserial_read('r', 16))
+        self.assertEqual(18, len(target.simpleserial_last_read))
+
+        for i in range(3):
+            target.write('p' + bytes(text).decode('latin-1') + '\n')
+        self.assertEqual([expected] * 3, target.simpleserial_read_many('r', 16, 3))
+
+        self.assertFalse(target.simpleserial_set_binary(False))
+        target.simpleserial_write('p', text)
+        self.assertEqual(expected, target.simpleserial_read('r', 16))
+        self.assertEqual(34, len(target.simpleserial_last_read))
+
+    def test_int_samples_project(self):
+        from chipwhisperer.hardware.naeusb.emulator import EmulatedCWLite
+        scope, target = self.connect(EmulatedCWLite(seed=0))
+        scope.adc.samples = 500
+        scope.int_samples = True
+        ktp = cw.ktp.Basic()
+        project = cw.create_project('projects/test_int_samples', overwrite=True)
+        waves = []
+        for i in range(20):
+            key, text = ktp.next()
+            trace = cw.capture_trace(scope, target, text, key)
+            self.assertEqual(np.uint16, trace.wave.dtype)
+            waves.append(scope.get_last_trace(as_int=False))
+            project.traces.append(trace)
+
+        # Float traces are stored as codes if they are codes, never truncated
+        project.traces.append(cw.Trace(waves[0], text, trace.textout, key))
+        waves.append(waves[0])
+        self.assertRaises(ValueError, project.traces.append, cw.Trace(waves[0] + 1e-4, text, trace.textout, key))
+        self.assertEqual(21, len(project.traces))
+        self.assertEqual(21, len(project.textins))
+        project.save()
+
+        project = cw.open_project('projects/test_int_samples')
+        self.assertEqual(np.uint16, project.segments[0].traces.dtype)
+        np.testing.assert_array_equal(waves, [wave for wave in project.waves])
+        traces, _, _, _ = project.trace_manager().get_trace_block(0, 21)
+        np.testing.assert_array_equal(waves, traces)
+        project.remove(i_am_sure=True)
+
+    def test_compressed_project(self):
+        from chipwhisperer.common.traces import RawWave
+        from chipwhisperer.common.traces.TraceContainerCompressed import TraceContainerCompressed
+        project = cw.create_project('projects/test_compressed', overwrite=True)
+        project.set_trace_format("compressed")
+        project.get_trace_format().block_traces = 16
+        project.traces.seg_len = 70
+        project.traces.seg_ind_max = 69
+        rng = np.random.RandomState(0)
+        codes = rng.randint(0, 1024, (100, 300)).astype(np.uint16)
+        for i, row in enumerate(codes):
+            project.traces.append(cw.Trace(RawWave(row, 1 / 1024.0, -0.5), bytearray([i] * 16), None, bytearray(16)))
+        project.save()
+
+        project = cw.open_project('projects/test_compressed')
+        self.assertEqual(2, len(project.segments))
+        self.assertIsInstance(project.segments[0], TraceContainerCompressed)
+        waves = codes / 1024.0 - 0.5
+        np.testing.assert_array_equal(waves, [wave for wave in project.waves])
+        np.testing.assert_array_equal(waves[::-7], [project.waves[i] for i in range(99, -1, -7)])
+        traces, textins, _, _ = project.trace_manager().get_trace_block(10, 90, point_range=(5, 50))
+        np.testing.assert_array_equal(waves[10:90, 5:50], traces)
+        np.testing.assert_array_equal(np.arange(10, 90), textins[:, 0])
+        segment = project.segments[0]
+        np.testing.assert_array_equal(codes[[3, 40, 17]], segment.traces[[3, 40, 17]])
+        np.testing.assert_array_equal(codes[65:2:-5, 7], segment.traces[65:2:-5, 7])
+        project.remove(i_am_sure=True)
+
+    def test_compressed_traces(self):
+        from chipwhisperer.common.traces.TraceContainerCompressed import save_compressed, CompressedTraces
+        os.makedirs('projects', exist_ok=True)
+        filename = 'projects/test_traces.cwz'
+        for dtype in ['<i2', '>i2', '>u4', '>f8']:
+            traces = np.random.RandomState(1).randint(-500, 500, (40, 50)).astype(dtype)
+            save_compressed(filename, traces, block_traces=64)
+            compressed = CompressedTraces(filename)
+            np.testing.assert_array_equal(traces, compressed[:])
+            # A single block, but np.array() still returns a writeable copy
+            arr = np.array(compressed)
+            self.assertTrue(arr.flags.writeable)
+            self.assertFalse(np.shares_memory(arr, compressed.blocks([0])[0]))
+        os.remove(filename)
+
+    def test_chunked_project(self):
+        project = cw.create_project('projects/test_chunked', overwrite=True)
+        project.set_trace_format("chunked")
+        project.get_trace_format().chunk_traces = 16
+        project.get_trace_format().chunk_bytes = 64
+        traces = create_random_traces(100, 50)
+        project.traces.extend(traces[:40])
+        project.save()
+        project.traces.extend(traces[40:])
+        self.assertEqual(1, len(project.segments))
+        np.testing.assert_array_equal(traces[70].wave, project.waves[70])
+        project.save()
+
+        project = cw.open_project('projects/test_chunked')
+        self.assertEqual(1, len(project.segments))
+        waves = np.array([trace.wave for trace in traces])
+        np.testing.assert_array_equal(waves, [wave for wave in project.waves])
+        block, textins, _, _ = project.trace_manager().get_trace_block(5, 95, point_range=(3, 40))
+        np.testing.assert_array_equal(waves[5:95, 3:40], block)
+        np.testing.assert_array_equal([trace.textin for trace in traces[5:95]], textins)
+        chunked = project.segments[0].traces
+        np.testing.assert_array_equal(waves[[99, 0, 33], ::-3], chunked[[99, 0, 33], ::-3])
+        np.testing.assert_array_equal(waves[90:10:-7, 45], chunked[90:10:-7, 45])
+        project.remove(i_am_sure=True)
+
+    def test_cpa_on_emulated_nano(self):
+        from chipwhisperer.hardware.naeusb.emulator import EmulatedCWNano
+        scope, target = self.connect(EmulatedCWNano(seed=0))
+        scope.adc.samples = 200
+        ktp = cw.ktp.Basic()
+        project = cw.create_project('projects/test_emulated_nano', overwrite=True)
+        results = cw.capture_traces(scope, target, ktp, 300, project=project)
+        self.assertEqual(300, results.captured)
+
+        attack = cwa.cpa(project, cwa.leakage_models.sbox_output)
+        keys = attack.run().find_key()
+        self.assertEqual(list(ktp.next()[0]), list(keys))
+        project.remove(i_am_sure=True)
 
 
 if __name__ == '__main__':